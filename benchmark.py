@@ -0,0 +1,392 @@
+"""Script to load-test the LCC Issue Tracker routes over HTTP.
+
+This script drives a running instance of the application (`python run.py`)
+with a number of concurrent virtual users, one route at a time, and reports
+for each route:
+- p50/p95/p99 (and mean/max) latency
+- throughput in requests per second
+- response status codes
+- the number of database queries run per request
+
+Query counts are taken from the `Server-Timing` header that the application
+sends when it runs with SQL_INSTRUMENTATION=1 (see loginapp/db.py).
+Otherwise, they are read from the MySQL server's `Questions` status counter
+before and after each route, which is only accurate when nothing else is
+using the server. Pass `--no-db` to benchmark without database access (for
+example, against a stand-in database), in which case issue IDs are not
+looked up and query counts come from the header only.
+
+Virtual users log in as the visitor1, helper1 and admin1 accounts from
+populate_database.sql. Pass `--seed-issues N` to first add N synthetic issues
+(plus users and comments to match) with generate_dataset.py. The add_comment
+and update_issue_status routes write to the database, so only ever benchmark
+a scratch database, never one holding real data.
+
+The login route is throttled per username and client IP (see
+loginapp/ratelimit.py), so it gets a small request budget of its own, and
+runs more than a minute apart are needed to avoid 429 responses.
+
+Results are printed as a table and can be saved as JSON with `--output`.
+Pass a previous run's JSON file with `--compare` to print the change in each
+route's latency, and exit with status 1 if any route's p95 latency regressed
+by more than `--threshold` percent.
+
+Usage:
+    python benchmark.py [--url URL] [--users N] [--requests N]
+                        [--seed-issues N] [--output PATH] [--compare PATH]
+"""
+import argparse
+import itertools
+import json
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.cookiejar import CookieJar
+
+# Accounts the virtual users log in as, by role
+ACCOUNTS = {
+    'visitor': ('visitor1', 'Visitor1Pass'),
+    'helper': ('helper1', 'Helper1Pass'),
+    'admin': ('admin1', 'Admin1Pass'),
+}
+
+# Login requests made by the login benchmark. Together with the one login per
+# role above, this stays under the per-IP login limit of 30 a minute.
+LOGIN_REQUESTS = 24
+
+# Number of issue IDs sampled for the issue routes
+SAMPLE_ISSUES = 100
+
+# Search terms used by the search benchmarks
+SEARCH_TERMS = ['broken', 'water', 'gate', 'lights']
+USER_SEARCH_TERMS = ['visitor', 'help', 'adm', 'visitor12']
+
+ISSUE_STATUSES = ['new', 'open', 'stalled', 'resolved']
+
+# Shape of the data added by --seed-issues, as in generate_dataset.py's defaults
+SEED_ISSUES_PER_USER = 10
+SEED_COMMENTS_PER_ISSUE = 3
+
+# Matches the query count in the application's `Server-Timing` header
+SERVER_TIMING_QUERIES = re.compile(r'\bdb;[^,]*desc="(\d+) queries"')
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Returns redirects as responses, so each request times one route only."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+class Client:
+    """An HTTP client with its own session cookie (unless `keep_session` is
+    false, in which case every request is made without a session)."""
+
+    def __init__(self, base_url, keep_session=True):
+        self.base_url = base_url.rstrip('/')
+        handlers = [NoRedirect]
+        if keep_session:
+            handlers.append(urllib.request.HTTPCookieProcessor(CookieJar()))
+        self.opener = urllib.request.build_opener(*handlers)
+
+    def request(self, path, form=None):
+        """Makes a GET request, or a POST request if `form` is given.
+
+        Returns:
+            A tuple of the response status code and the number of queries the
+            request ran (or `None` if the response didn't say).
+        """
+        data = urllib.parse.urlencode(form).encode('utf-8') if form is not None else None
+        try:
+            with self.opener.open(self.base_url + path, data, timeout=60) as response:
+                response.read()
+                return response.status, self.query_count(response.headers)
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, self.query_count(error.headers)
+
+    @staticmethod
+    def query_count(headers):
+        match = SERVER_TIMING_QUERIES.search(', '.join(headers.get_all('Server-Timing') or []))
+        return int(match.group(1)) if match else None
+
+    def login(self, username, password):
+        status, _ = self.request('/login', {'username': username, 'password': password})
+        if status != 302:
+            raise RuntimeError(f'Could not log in as {username} (HTTP {status})')
+
+def percentile(sorted_values, percent):
+    """Gets a percentile of a sorted list by the nearest-rank method."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+class Database:
+    """Looks up benchmark data and query counts in the MySQL database."""
+
+    def __init__(self):
+        import MySQLdb
+        import MySQLdb.cursors
+        from loginapp import connect
+
+        self.conn = MySQLdb.connect(user=connect.dbuser, password=connect.dbpass,
+                                    host=connect.dbhost, database=connect.dbname,
+                                    port=connect.dbport, autocommit=True)
+        self.cursor = self.conn.cursor(MySQLdb.cursors.DictCursor)
+
+    def seed(self, issue_count):
+        from generate_dataset import seed_database
+        seed_database(self.cursor, max(issue_count // SEED_ISSUES_PER_USER, 1),
+                      issue_count, issue_count * SEED_COMMENTS_PER_ISSUE)
+
+    def issue_ids(self, count):
+        self.cursor.execute('SELECT issue_id FROM issues ORDER BY RAND() LIMIT %s', (count,))
+        return [row['issue_id'] for row in self.cursor.fetchall()]
+
+    def questions(self):
+        """Gets the number of statements the server has run so far.
+
+        The `SHOW` statement itself is counted too, so consecutive readings
+        differ by one when nothing else ran in between.
+        """
+        self.cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        return int(self.cursor.fetchone()['Value'])
+
+    def close(self):
+        self.conn.close()
+
+def build_routes(issue_ids):
+    """Lists the routes to benchmark.
+
+    Returns:
+        A list of (name, role, request_count_or_None, make_request) tuples,
+        where `make_request(n)` gives the path and form data (or `None` for a
+        GET) of the route's nth request. A count of `None` means the
+        `--requests` setting is used.
+    """
+    issue = lambda n: issue_ids[n % len(issue_ids)]
+    login_accounts = list(ACCOUNTS.values())
+
+    def login(n):
+        username, password = login_accounts[n % len(login_accounts)]
+        return '/login', {'username': username, 'password': password}
+
+    routes = [('login', None, LOGIN_REQUESTS, login)]
+    for filter_type in ['', 'my_issues', 'my_active', 'my_resolved']:
+        routes.append((f'list_issues?filter={filter_type}', 'visitor', None,
+                       lambda n, f=filter_type: (f'/issues/list?filter={f}', None)))
+    for filter_type in ['', 'resolved']:
+        routes.append((f'list_issues?filter={filter_type} (helper)', 'helper', None,
+                       lambda n, f=filter_type: (f'/issues/list?filter={f}', None)))
+    routes += [
+        ('search_issues', 'helper', None,
+         lambda n: ('/issues/search?q=' + SEARCH_TERMS[n % len(SEARCH_TERMS)], None)),
+        ('view_issue', 'helper', None,
+         lambda n: (f'/issues/{issue(n)}', None)),
+        ('add_comment', 'helper', None,
+         lambda n: (f'/issues/{issue(n)}/comment',
+                    {'content': f'Benchmark comment {n}'})),
+        ('update_issue_status', 'helper', None,
+         lambda n: (f'/issues/{issue(n)}/status',
+                    {'status': ISSUE_STATUSES[n % len(ISSUE_STATUSES)]})),
+        ('admin_home', 'admin', None,
+         lambda n: ('/admin/home', None)),
+        ('manage_users', 'admin', None,
+         lambda n: (f'/admin/users?page={n % 5 + 1}', None)),
+        ('manage_users?mode=prefix', 'admin', None,
+         lambda n: ('/admin/users?mode=prefix&search='
+                    + USER_SEARCH_TERMS[n % len(USER_SEARCH_TERMS)], None)),
+        ('manage_users?mode=contains', 'admin', None,
+         lambda n: ('/admin/users?mode=contains&search='
+                    + USER_SEARCH_TERMS[n % len(USER_SEARCH_TERMS)], None)),
+    ]
+    return routes
+
+def run_route(clients, request_count, make_request, users):
+    """Sends a route's requests from `users` concurrent threads.
+
+    Returns:
+        A tuple of (latencies in seconds, status code counts, elapsed seconds,
+        queries reported by the responses). The query total is `None` unless
+        every response reported its query count.
+    """
+    counter = itertools.count()
+    latencies = []
+    statuses = {}
+    query_counts = []
+    lock = threading.Lock()
+
+    def virtual_user(client):
+        while True:
+            n = next(counter)
+            if n >= request_count:
+                return
+            path, form = make_request(n)
+            start = time.perf_counter()
+            status, queries = client.request(path, form)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                query_counts.append(queries)
+
+    threads = [threading.Thread(target=virtual_user, args=(clients[i % len(clients)],))
+               for i in range(min(users, request_count))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    queries = None if None in query_counts else sum(query_counts)
+    return latencies, statuses, elapsed, queries
+
+def summarize(latencies, statuses, elapsed, queries):
+    """Builds a route's result record (latencies in milliseconds)."""
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': sum(n for status, n in statuses.items() if status >= 400),
+        'statuses': {str(status): n for status, n in sorted(statuses.items())},
+        'throughput': round(count / elapsed, 2) if elapsed else None,
+        'mean_ms': ms(sum(latencies) / count) if count else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+        'queries_per_request': round(queries / count, 2) if queries is not None and count else None,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results, baseline=None):
+    """Prints the results as a table, with p95 changes against a baseline."""
+    header = (f'{"route":<40} {"reqs":>5} {"err":>4} {"req/s":>8} {"p50 ms":>8} '
+              f'{"p95 ms":>8} {"p99 ms":>8} {"queries":>7}')
+    if baseline:
+        header += f' {"p95 change":>10}'
+    print(header)
+    print('-' * len(header))
+    fmt = lambda value: '-' if value is None else value
+    for route, result in results.items():
+        line = (f'{route:<40} {result["requests"]:>5} {result["errors"]:>4} '
+                f'{fmt(result["throughput"]):>8} {fmt(result["p50_ms"]):>8} '
+                f'{fmt(result["p95_ms"]):>8} {fmt(result["p99_ms"]):>8} '
+                f'{fmt(result["queries_per_request"]):>7}')
+        if baseline:
+            change = p95_change(result, baseline.get(route))
+            line += f' {"-" if change is None else f"{change:+.1f}%":>10}'
+        print(line)
+
+def p95_change(result, previous):
+    """Gets the percentage change in p95 latency from a previous result."""
+    if not previous or not previous.get('p95_ms') or result['p95_ms'] is None:
+        return None
+    return (result['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000',
+                        help='base URL of the running application (default: %(default)s)')
+    parser.add_argument('--users', type=int, default=8,
+                        help='number of concurrent virtual users (default: %(default)s)')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per route (default: %(default)s)')
+    parser.add_argument('--warmup', type=int, default=10,
+                        help='unmeasured requests per route before measuring '
+                             '(default: %(default)s)')
+    parser.add_argument('--routes', nargs='+', metavar='ROUTE',
+                        help='only benchmark routes whose name starts with one of these')
+    parser.add_argument('--seed-issues', type=int, default=0, metavar='N',
+                        help='seed N synthetic issues before benchmarking')
+    parser.add_argument('--no-db', dest='use_db', action='store_false',
+                        help="don't connect to the database (no seeding or query counts)")
+    parser.add_argument('--output', help='file to save the results to as JSON')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='JSON results of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help='p95 latency increase, in percent, counted as a regression '
+                             'with --compare (default: %(default)s)')
+    args = parser.parse_args()
+
+    started_at = datetime.now()
+    database = Database() if args.use_db else None
+    if database and args.seed_issues:
+        database.seed(args.seed_issues)
+    issue_ids = (database.issue_ids(SAMPLE_ISSUES) if database else None) or \
+        list(range(1, SAMPLE_ISSUES + 1))
+
+    # One logged-in session per role, shared by that role's virtual users
+    sessions = {}
+    for role, (username, password) in ACCOUNTS.items():
+        sessions[role] = Client(args.url)
+        sessions[role].login(username, password)
+
+    results = {}
+    for name, role, request_count, make_request in build_routes(issue_ids):
+        if args.routes and not any(name.startswith(prefix) for prefix in args.routes):
+            continue
+        request_count = request_count or args.requests
+        if role:
+            clients = [sessions[role]]
+            run_route(clients, args.warmup, make_request, args.users)
+        else:
+            # Logins are made without a session, so that every one of them
+            # checks a password. They are not warmed up.
+            clients = [Client(args.url, keep_session=False)]
+
+        before = database.questions() if database else None
+        latencies, statuses, elapsed, queries = run_route(clients, request_count,
+                                                          make_request, args.users)
+        if queries is None and database:
+            # Don't count the SHOW STATUS statement that took the first reading
+            queries = database.questions() - before - 1
+        results[name] = summarize(latencies, statuses, elapsed, queries)
+        print(f'{name}: {results[name]["p95_ms"]} ms p95', file=sys.stderr)
+
+    if database:
+        database.close()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)['routes']
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'url': args.url,
+            'users': args.users,
+            'requests': args.requests,
+            'seed_issues': args.seed_issues,
+            'routes': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+    if baseline:
+        regressions = [route for route, result in results.items()
+                       if (p95_change(result, baseline.get(route)) or 0) > args.threshold]
+        if regressions:
+            print(f'p95 latency regressed by more than {args.threshold}% for: '
+                  + ', '.join(regressions))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""Script to check the MySQL query plans of the LCC Issue Tracker routes.
+
+This script runs EXPLAIN on every database query made by the routes in
+loginapp/issues.py, loginapp/admin.py and loginapp/helper.py, and fails (exits
+with status 1) if any of them falls back to a full table scan or a filesort.
+The queries come from the same constants and builder functions the routes
+run, so the checks can't drift from what the routes actually execute.
+
+The MySQL optimizer happily scans small tables, so the plans are only
+meaningful on a large dataset. Pass `--seed-issues N` to first fill the
+database with N synthetic issues (plus users and comments to match). Only
+ever seed a scratch database, never one holding real data.
+
+Usage:
+    python check_query_plans.py [--database NAME] [--seed-issues N]
+"""
+import argparse
+import sys
+from datetime import datetime
+
+import MySQLdb
+import MySQLdb.cursors
+from werkzeug.datastructures import MultiDict
+
+from loginapp import admin, connect, export, importer, issues, stats
+from loginapp.issues import issue_page_query, issue_partitions, issue_search_query
+from loginapp.utils import (CURRENT_USER_QUERY, MAX_BULK_ROWS, PASSWORD_HASH_QUERY,
+                            PROFILE_IMAGE_REFS_QUERY, bulk_targets)
+
+# A bcrypt hash shared by every seeded user (the password is 'Visitor1Pass')
+SEED_PASSWORD_HASH = '$2b$12$n9oPM5DqUS7z2dVhzZLIs.pwA92BYJLWKqmi8/WztZsdUgktECV0a'
+
+# Example parameter values used when explaining the route queries
+USER_ID = 1
+ISSUE_ID = 1
+CURSOR_CREATED_AT = datetime(2024, 2, 1)
+PAGE_LIMIT = 26
+
+# Issues list filters to check, as (description, filter, role)
+LIST_FILTERS = [
+    ('my issues', 'my_issues', 'visitor'),
+    ('my active issues', 'my_active', 'visitor'),
+    ('my resolved issues', 'my_resolved', 'visitor'),
+    ('resolved issues', 'resolved', 'helper'),
+    ('active issues', None, 'helper'),
+]
+
+def _list_queries():
+    """Lists the queries run by list_issues, for every filter and for paging.
+
+    Returns:
+        A list of ROUTE_QUERIES entries.
+    """
+    queries = []
+    for description, filter_type, role in LIST_FILTERS:
+        partitions = issue_partitions(filter_type, role, USER_ID)
+        for where, params in partitions:
+            label = f'{description} ({params[-1]})' if len(partitions) > 1 else description
+            queries.append(('list_issues', label,
+                            *issue_page_query(where, params, PAGE_LIMIT), None))
+
+    where, params = issue_partitions(None, 'helper', USER_ID)[1]
+    position = (CURSOR_CREATED_AT, ISSUE_ID)
+    queries.append(('list_issues', 'active issues, next page',
+                    *issue_page_query(where, params, PAGE_LIMIT, position), None))
+    queries.append(('list_issues', 'active issues, previous page',
+                    *issue_page_query(where, params, PAGE_LIMIT, position, backwards=True),
+                    None))
+    return queries
+
+def _bulk_lock_query(template, data, id_key, filter_keys, **names):
+    """Builds the query that locks the rows of a bulk change.
+
+    Args:
+        template: The lock query, e.g. issues.BULK_ISSUE_LOCK_QUERY.
+        data: The bulk change's JSON request body.
+        id_key: The key of the ID list, as passed to utils.bulk_targets().
+        filter_keys: The columns that may be filtered on.
+        **names: Other names to format the template with.
+
+    Returns:
+        A (sql, params) tuple.
+    """
+    where, params, _ = bulk_targets(data, id_key, filter_keys)
+    return template.format(where=where, **names), params + (MAX_BULK_ROWS + 1,)
+
+# Query parameters of the exports to check
+EXPORT_BY_STATUS = MultiDict({'status': 'resolved'})
+EXPORT_BY_USER = MultiDict({'user_id': str(USER_ID)})
+
+# Queries run by each route, as (route, description, sql, params, allowed).
+# `allowed` explains why a query may read a whole table by design, and is
+# `None` for every query that must be served from an index.
+ROUTE_QUERIES = _list_queries() + [
+    # issues.py
+    ('search_issues', 'ranked full-text matches',
+     *issue_search_query('synthetic', 'helper', USER_ID, PAGE_LIMIT, PAGE_LIMIT),
+     'sorts only the full-text matches by relevance'),
+    ('search_issues', "visitor's ranked full-text matches",
+     *issue_search_query('synthetic', 'visitor', USER_ID, PAGE_LIMIT, PAGE_LIMIT),
+     'sorts only the full-text matches by relevance'),
+    ('list_issues', 'latest change', issues.LAST_MODIFIED_QUERY, (), None),
+    ('view_issue', 'issue version', issues.ISSUE_VERSION_QUERY, (ISSUE_ID,), None),
+    ('view_issue', 'issue with reporter', issues.ISSUE_DETAIL_QUERY, (ISSUE_ID,), None),
+    ('view_issue', 'comments with authors', issues.ISSUE_COMMENTS_QUERY, (ISSUE_ID,), None),
+    ('add_comment', 'issue permissions', issues.ISSUE_QUERY, (ISSUE_ID,), None),
+    ('add_comment', 'comment counter', issues.INCREMENT_COMMENT_COUNT, (ISSUE_ID,), None),
+    ('add_comment', 'reopen issue', issues.REOPEN_ISSUE, (ISSUE_ID,), None),
+    ('update_issue_status', 'status change',
+     issues.UPDATE_ISSUE_STATUS, ('open', ISSUE_ID), None),
+    ('update_issue_status', 'issue reporter',
+     issues.ISSUE_REPORTER_QUERY, (ISSUE_ID,), None),
+    ('bulk_update_issue_status', 'lock issues by status',
+     *_bulk_lock_query(issues.BULK_ISSUE_LOCK_QUERY, {'filter': {'status': 'new'}},
+                       'issue_ids', ['status', 'user_id']), None),
+
+    # admin.py
+    ('admin_home', 'current user', CURRENT_USER_QUERY, (USER_ID,), None),
+    ('admin_home', 'issue counts by status', stats.ISSUE_STATS_QUERY, (), None),
+    ('admin_home', 'active user counts by role', stats.USER_STATS_QUERY, (), None),
+    ('manage_users', 'all users',
+     *admin.user_list_query('', 'prefix', PAGE_LIMIT, 0),
+     'sorts only the page of user IDs read from the index'),
+    ('manage_users', 'search users by prefix',
+     *admin.user_list_query('seed1', 'prefix', PAGE_LIMIT, 0),
+     'sorts only the prefix matches by rank'),
+    ('manage_users', 'search users by substring',
+     *admin.user_list_query('ser1', 'contains', PAGE_LIMIT, 0),
+     'sorts only the full-text matches by relevance'),
+    ('bulk_update_user_status', 'lock users by role',
+     *_bulk_lock_query(admin.BULK_USER_LOCK_QUERY, {'filter': {'role': 'visitor'}},
+                       'user_ids', ['role', 'status'], column='status'), None),
+    ('update_user_role', 'role change', admin.UPDATE_USER_ROLE, ('helper', USER_ID), None),
+    ('update_user_status', 'status change',
+     admin.UPDATE_USER_STATUS, ('active', USER_ID), None),
+    ('view_user', 'user profile', admin.USER_QUERY, (USER_ID,), None),
+
+    # utils.py
+    ('change_password', 'password hash', PASSWORD_HASH_QUERY, (USER_ID,), None),
+    ('profile', 'profile image references',
+     PROFILE_IMAGE_REFS_QUERY, ('0' * 64 + '.jpg',), None),
+
+    # export.py
+    ('export_issues', 'issues by status',
+     *export.export_query(export.ISSUE_EXPORT_QUERY, EXPORT_BY_STATUS, 'i', 'i.status',
+                          export.issue_export_order(EXPORT_BY_STATUS)), None),
+    ('export_comments', 'comments by author',
+     *export.export_query(export.COMMENT_EXPORT_QUERY, EXPORT_BY_USER, 'c', 'i.status',
+                          export.comment_export_order(EXPORT_BY_USER)), None),
+
+    # importer.py
+    ('import_issues_upload', 'usernames', importer.USERNAMES_QUERY, (), None),
+
+    # helper.py
+    ('helper_home', 'current user', CURRENT_USER_QUERY, (USER_ID,), None),
+    ('helper_home', 'issue counts by status', stats.ISSUE_STATS_QUERY, (), None),
+]
+
+def seed(cursor, issue_count):
+    """Fills the database with synthetic users, issues and comments.
+
+    Rows are generated server-side with recursive CTEs, so seeding a few
+    hundred thousand issues takes seconds. Roughly one user is created per 20
+    issues, and three comments per issue.
+
+    Args:
+        cursor: A cursor on the database to seed.
+        issue_count: The number of issues to create.
+    """
+    user_count = max(issue_count // 20, 10)
+    comment_count = issue_count * 3
+    cursor.execute('SET SESSION cte_max_recursion_depth = %s',
+                   (max(user_count, issue_count, comment_count) + 1,))
+    cursor.execute('SELECT COALESCE(MAX(user_id), 0) AS max_id FROM users')
+    first_user = cursor.fetchone()['max_id'] + 1
+    cursor.execute('SELECT COALESCE(MAX(issue_id), 0) AS max_id FROM issues')
+    first_issue = cursor.fetchone()['max_id'] + 1
+
+    cursor.execute('''
+        INSERT INTO users (username, password_hash, email, first_name,
+                           last_name, location, role, status)
+        WITH RECURSIVE seq (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+        SELECT CONCAT('seed', %s + n), %s, CONCAT('seed', %s + n, '@example.com'),
+               'Seed', CONCAT('User', n), 'Lincoln',
+               ELT(1 + (n %% 20 = 0) + (n %% 100 = 0), 'visitor', 'helper', 'admin'),
+               IF(n %% 50 = 0, 'inactive', 'active')
+        FROM seq
+    ''', (user_count, first_user, SEED_PASSWORD_HASH, first_user))
+    print(f'Seeded {cursor.rowcount} users')
+
+    cursor.execute('''
+        INSERT INTO issues (user_id, summary, description, created_at, status,
+                            comment_count)
+        WITH RECURSIVE seq (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+        SELECT %s + (n * 7919) %% %s, CONCAT('Seeded issue ', n),
+               'Synthetic issue created by check_query_plans.py',
+               TIMESTAMP('2024-01-01') + INTERVAL n MINUTE,
+               ELT(1 + n %% 10 DIV 3, 'new', 'open', 'stalled', 'resolved'), 3
+        FROM seq
+    ''', (issue_count, first_user, user_count))
+    print(f'Seeded {cursor.rowcount} issues')
+
+    cursor.execute('''
+        INSERT INTO comments (issue_id, user_id, content, created_at)
+        WITH RECURSIVE seq (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+        SELECT %s + n DIV 3, %s + (n * 104729) %% %s, 'Synthetic comment',
+               TIMESTAMP('2024-01-01') + INTERVAL n MINUTE
+        FROM seq
+    ''', (comment_count - 1, first_issue, first_user, user_count))
+    print(f'Seeded {cursor.rowcount} comments')
+
+    cursor.execute('ANALYZE TABLE users, issues, comments')
+    cursor.fetchall()
+
+def explain(cursor, sql, params):
+    """Runs EXPLAIN on a query and lists the problems in its plan.
+
+    Args:
+        cursor: A dictionary cursor to run EXPLAIN with.
+        sql: The query to explain.
+        params: The query parameters.
+
+    Returns:
+        A list of problem descriptions, which is empty if the plan is fine.
+    """
+    cursor.execute('EXPLAIN ' + sql, params)
+    problems = []
+    for row in cursor.fetchall():
+        table = row.get('table') or '-'
+        extra = row.get('Extra') or ''
+        if row.get('type') == 'ALL':
+            problems.append(f'full table scan on {table}')
+        if 'Using filesort' in extra:
+            problems.append(f'filesort on {table}')
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database', default=connect.dbname,
+                        help='database to check (default: %(default)s)')
+    parser.add_argument('--seed-issues', type=int, default=0, metavar='N',
+                        help='seed N synthetic issues before checking')
+    args = parser.parse_args()
+
+    conn = MySQLdb.connect(user=connect.dbuser, password=connect.dbpass,
+                           host=connect.dbhost, database=args.database,
+                           port=connect.dbport, autocommit=True)
+    failures = 0
+    with conn.cursor(MySQLdb.cursors.DictCursor) as cursor:
+        if args.seed_issues:
+            seed(cursor, args.seed_issues)
+
+        for route, description, sql, params, allowed in ROUTE_QUERIES:
+            problems = explain(cursor, sql, params)
+            if not problems:
+                status = 'OK'
+            elif allowed:
+                status = f'ALLOWED ({allowed}): ' + ', '.join(problems)
+            else:
+                status = 'FAIL: ' + ', '.join(problems)
+                failures += 1
+            print(f'{route} | {description} | {status}')
+    conn.close()
+
+    print('-' * 100)
+    if failures:
+        print(f'{failures} route queries fall back to a table scan or filesort')
+        sys.exit(1)
+    print('All route queries are served from indexes')
+
+if __name__ == '__main__':
+    main()
@@ -21,8 +21,16 @@ CREATE TABLE `users`(
     `profile_image` VARCHAR(255),
     `role` ENUM('visitor', 'helper', 'admin') NOT NULL,
 	`status` ENUM('active', 'inactive') NOT NULL,
+    `updated_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
     PRIMARY KEY (`user_id`),
-    UNIQUE KEY `username` (`username`)
+    UNIQUE KEY `username` (`username`),
+    KEY `idx_users_status_role` (`status`, `role`),
+    KEY `idx_users_role_username` (`role`, `username`),
+    KEY `idx_users_first_name` (`first_name`),
+    KEY `idx_users_last_name` (`last_name`),
+    KEY `idx_users_profile_image` (`profile_image`),
+    KEY `idx_users_updated` (`updated_at`),
+    FULLTEXT KEY `ft_users_names` (`username`, `first_name`, `last_name`) WITH PARSER ngram
 ) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin;
 
 -- Create issues table
@@ -33,7 +41,15 @@ CREATE TABLE `issues` (
     `description` TEXT NOT NULL,
     `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     `status` ENUM('new', 'open', 'stalled', 'resolved') NOT NULL DEFAULT 'new',
+    `comment_count` INT NOT NULL DEFAULT 0 COMMENT 'Number of comments on the issue, maintained by the app',
+    `version` INT NOT NULL DEFAULT 1 COMMENT 'Bumped by the app whenever the issue or its comments change',
+    `updated_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
     PRIMARY KEY (`issue_id`),
+    KEY `idx_issues_user_status_created` (`user_id`, `status`, `created_at`),
+    KEY `idx_issues_user_created` (`user_id`, `created_at`),
+    KEY `idx_issues_status_created` (`status`, `created_at`),
+    KEY `idx_issues_updated` (`updated_at`),
+    FULLTEXT KEY `ft_issues_summary_description` (`summary`, `description`),
     FOREIGN KEY (`user_id`) REFERENCES `users` (`user_id`) ON DELETE CASCADE
 ) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin;
 
@@ -45,6 +61,8 @@ CREATE TABLE `comments` (
   `content` TEXT NOT NULL,
   `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`comment_id`),
+  KEY `idx_comments_issue_created` (`issue_id`, `created_at`),
+  FULLTEXT KEY `ft_comments_content` (`content`),
   FOREIGN KEY (`issue_id`) REFERENCES `issues`(`issue_id`) ON DELETE CASCADE,
   FOREIGN KEY (`user_id`) REFERENCES `users`(`user_id`) ON DELETE CASCADE
 ) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin;
\ No newline at end of file
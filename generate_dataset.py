@@ -0,0 +1,353 @@
+"""Script to generate a large synthetic dataset for the LCC Issue Tracker.
+
+Unlike populate_database.sql, which holds a few hand-written rows, this script
+generates as many users, issues and comments as you ask for, with a realistic
+shape:
+- Users have a mix of roles (mostly visitors) and a few are inactive.
+- Issues have a mix of statuses, older issues being more likely to be
+  resolved, and a few prolific reporters file most of them.
+- Comments follow a long-tail distribution: most issues get a handful, a few
+  get hundreds.
+
+Rows are streamed straight to the output, so memory use stays small (a few
+bytes per issue) however many rows are generated. Every user shares one
+bcrypt hash, computed once up front.
+
+Two output formats are supported:
+- `sql` (default): batched multi-row INSERT statements, written to a file or
+  stdout, e.g. `python generate_dataset.py | mysql -u root -p LCC`
+- `tsv`: one tab-separated file per table plus load.sql, which loads them
+  with LOAD DATA LOCAL INFILE (the fastest way to load millions of rows)
+
+The output assumes an empty database freshly created by create_database.sql,
+because it sets every row's ID explicitly. To add a dataset to a database
+that already holds rows (as benchmark.py does), call `seed_database()`, which
+numbers the new rows after the existing ones and inserts them directly.
+
+Usage:
+    python generate_dataset.py [--users N] [--issues N] [--comments N]
+                               [--format sql|tsv] [--output PATH]
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sys
+from array import array
+from datetime import datetime, timedelta
+
+import bcrypt
+
+# Role and status mixes, as (value, weight) pairs
+ROLE_MIX = [('visitor', 90), ('helper', 8), ('admin', 2)]
+ISSUE_STATUS_MIX = [('new', 20), ('open', 25), ('stalled', 10), ('resolved', 45)]
+
+# Fraction of users that are inactive
+INACTIVE_USER_RATE = 0.05
+
+# Pareto shape parameters for how issues are spread over reporters, and
+# comments over issues (lower means a longer tail)
+REPORTER_SKEW = 1.8
+COMMENT_SKEW = 2.5
+
+# Number of INSERT statements per transaction in sql output
+COMMIT_EVERY_BATCHES = 50
+
+# Time span covered by the generated issues
+DATASET_START = datetime(2023, 1, 1)
+DATASET_DAYS = 730
+
+FIRST_NAMES = ['Aroha', 'Ben', 'Charlotte', 'Daniel', 'Ella', 'Finn', 'Grace',
+               'Hemi', 'Isla', 'Jack', 'Kiri', 'Liam', 'Mia', 'Noah', 'Olivia',
+               'Priya', 'Quinn', 'Ruby', 'Sam', 'Tama', 'Wei', 'Zoe']
+LAST_NAMES = ['Brown', 'Chen', 'Davies', 'Singh', 'Smith', 'Taylor', 'Walker',
+              'Williams', 'Wilson', 'Ngata', 'Patel', 'Liu', 'Thompson', 'Young']
+LOCATIONS = ['Lincoln', 'Christchurch', 'Canterbury', 'Rolleston', 'Ashburton',
+             'Kaikoura', 'Timaru', 'Akaroa']
+PROBLEMS = ['Broken shower', 'Wi-Fi not working', 'Overflowing trash bins',
+            'Fallen tree', 'Missing BBQ parts', 'Power outage', 'Water leak',
+            'Damaged picnic table', 'Noisy generator', 'Flooded fire pit',
+            'Gate will not lock', 'Broken swing', 'No firewood', 'Clogged drain',
+            'Burnt-out lights', 'Wasp nest', 'Low water pressure', 'Faded signs']
+PLACES = ['the men\'s bathroom', 'the women\'s bathroom', 'area B', 'site #3',
+          'site #8', 'site #12', 'the central pavilion', 'the playground',
+          'the main gate', 'the lake path', 'the RV dump station',
+          'the dish washing station', 'the maintenance shed', 'the fishing dock']
+DETAILS = ['It has been like this since yesterday.',
+           'Several campers have mentioned it.',
+           'It looks unsafe, please check soon.',
+           'This happened after last night\'s storm.',
+           'Could someone take a look when they have time?']
+REPLIES = ['Thanks for reporting this, we will take a look.',
+           'I have checked it and ordered the parts we need.',
+           'This should be fixed now, please let us know if not.',
+           'Any update on this?', 'Still happening today.',
+           'We are waiting on maintenance to get back to us.',
+           'Thank you for sorting this out so quickly!']
+
+def pareto_weights(rng, n, skew):
+    """Draws n long-tailed weights from a (zero-based) Pareto distribution,
+    so that many weights are close to zero and a few are very large."""
+    return array('d', (rng.paretovariate(skew) - 1 for _ in range(n)))
+
+def cumulative(weights):
+    """Builds cumulative weights, for sampling with `sample_index()`."""
+    return array('d', itertools.accumulate(weights))
+
+def sample_index(rng, cum_weights):
+    """Samples an index in proportion to the weights behind `cum_weights`."""
+    return bisect.bisect(cum_weights, rng.random() * cum_weights[-1])
+
+def weighted_choice(rng, mix):
+    """Chooses an index into a list of (value, weight) pairs by weight."""
+    return rng.choices(range(len(mix)), [weight for _, weight in mix])[0]
+
+def generate_users(rng, count, password_hash, roles, first_id=1):
+    """Yields user rows, recording each user's role (as an index into
+    ROLE_MIX) in `roles`."""
+    for user_id in range(first_id, first_id + count):
+        role_index = weighted_choice(rng, ROLE_MIX)
+        roles.append(role_index)
+        role = ROLE_MIX[role_index][0]
+        status = 'inactive' if rng.random() < INACTIVE_USER_RATE else 'active'
+        username = f'{role}{user_id}'
+        yield (user_id, username, password_hash, f'{username}@example.com',
+               rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+               rng.choice(LOCATIONS), role, status)
+
+def generate_issues(rng, count, user_count, comment_counts, created_at, reporters,
+                    first_id=1, first_user_id=1):
+    """Yields issue rows in creation order, recording each issue's creation
+    time (as seconds after DATASET_START) and reporter."""
+    reporter_weights = cumulative(pareto_weights(rng, user_count, REPORTER_SKEW))
+    span = DATASET_DAYS * 86400
+    for index in range(count):
+        offset = int(span * index / count) + rng.randrange(60)
+        age = 1 - offset / span
+        status = ISSUE_STATUS_MIX[weighted_choice(rng, ISSUE_STATUS_MIX)][0]
+        if status != 'resolved' and rng.random() < age * 0.6:
+            # Older issues are more likely to have been resolved
+            status = 'resolved'
+        user_id = sample_index(rng, reporter_weights) + first_user_id
+        created_at.append(offset)
+        reporters.append(user_id)
+        problem = rng.choice(PROBLEMS)
+        place = rng.choice(PLACES)
+        yield (first_id + index, user_id, f'{problem} at {place}',
+               f'{problem} at {place}. {rng.choice(DETAILS)}',
+               DATASET_START + timedelta(seconds=offset), status,
+               comment_counts[index])
+
+def count_comments(rng, comment_count, issue_count):
+    """Spreads comments over issues with a long-tail distribution.
+
+    Each issue gets a share of the comments in proportion to a Pareto weight,
+    and the comments left over after rounding down go to randomly chosen
+    issues (again by weight).
+
+    Returns:
+        An array holding the number of comments on each issue.
+    """
+    if not issue_count:
+        return array('l')
+    weights = pareto_weights(rng, issue_count, COMMENT_SKEW)
+    scale = comment_count / sum(weights)
+    counts = array('l', (int(weight * scale) for weight in weights))
+    cum_weights = cumulative(weights)
+    for _ in range(comment_count - sum(counts)):
+        counts[sample_index(rng, cum_weights)] += 1
+    return counts
+
+def generate_comments(rng, comment_counts, created_at, reporters, roles,
+                      first_id=1, first_issue_id=1, first_user_id=1):
+    """Yields comment rows, issue by issue, each one after the last."""
+    staff = [user_id for user_id, role in enumerate(roles, start=first_user_id) if role > 0]
+    comment_id = itertools.count(first_id)
+    for issue_index, count in enumerate(comment_counts):
+        posted_at = created_at[issue_index]
+        for _ in range(count):
+            posted_at += rng.randrange(60, 3 * 86400)
+            if staff and rng.random() < 0.6:
+                user_id = rng.choice(staff)
+            else:
+                user_id = reporters[issue_index]
+            yield (next(comment_id), first_issue_id + issue_index, user_id,
+                   rng.choice(REPLIES), DATASET_START + timedelta(seconds=posted_at))
+
+def sql_value(value):
+    """Formats a Python value as a MySQL literal."""
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, datetime):
+        return f"'{value:%Y-%m-%d %H:%M:%S}'"
+    return "'" + str(value).replace('\\', '\\\\').replace("'", "''") + "'"
+
+def write_sql(out, table, columns, rows, batch_size):
+    """Writes rows as batched multi-row INSERT statements, committing every
+    COMMIT_EVERY_BATCHES statements."""
+    total = 0
+    header = f"INSERT INTO `{table}` ({', '.join(f'`{c}`' for c in columns)}) VALUES\n"
+    for batch_number in itertools.count(1):
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        out.write(header)
+        out.write(',\n'.join('(' + ', '.join(map(sql_value, row)) + ')' for row in batch))
+        out.write(';\n')
+        if batch_number % COMMIT_EVERY_BATCHES == 0:
+            out.write('COMMIT;\n')
+        total += len(batch)
+    out.write('COMMIT;\n')
+    return total
+
+def tsv_value(value):
+    """Formats a Python value as a LOAD DATA field."""
+    if isinstance(value, datetime):
+        return f'{value:%Y-%m-%d %H:%M:%S}'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n'))
+
+def write_tsv(path, rows):
+    """Writes rows to a tab-separated file for LOAD DATA."""
+    total = 0
+    with open(path, 'w', encoding='utf-8', newline='\n') as out:
+        for row in rows:
+            out.write('\t'.join(map(tsv_value, row)) + '\n')
+            total += 1
+    return total
+
+USER_COLUMNS = ['user_id', 'username', 'password_hash', 'email', 'first_name',
+                'last_name', 'location', 'role', 'status']
+ISSUE_COLUMNS = ['issue_id', 'user_id', 'summary', 'description', 'created_at',
+                 'status', 'comment_count']
+COMMENT_COLUMNS = ['comment_id', 'issue_id', 'user_id', 'content', 'created_at']
+
+def generate_tables(rng, user_count, issue_count, comment_count, password_hash,
+                    first_ids=(1, 1, 1)):
+    """Sets up the row generators for a dataset.
+
+    Args:
+        rng: The random number generator to draw from.
+        user_count, issue_count, comment_count: The number of rows to generate.
+        password_hash: The bcrypt hash shared by every user.
+        first_ids: The first user, issue and comment IDs to use.
+
+    Returns:
+        A list of (table, columns, rows) tuples, in the order the tables must
+        be filled. Each table's rows must be consumed before the next's.
+    """
+    first_user_id, first_issue_id, first_comment_id = first_ids
+
+    # Per-row state needed to keep comments consistent with their issues
+    roles = array('b')
+    created_at = array('q')
+    reporters = array('l')
+    comment_counts = count_comments(rng, comment_count, issue_count)
+
+    users = generate_users(rng, user_count, password_hash, roles, first_user_id)
+    issues = generate_issues(rng, issue_count, user_count, comment_counts,
+                             created_at, reporters, first_issue_id, first_user_id)
+    comments = generate_comments(rng, comment_counts, created_at, reporters, roles,
+                                 first_comment_id, first_issue_id, first_user_id)
+    return [('users', USER_COLUMNS, users), ('issues', ISSUE_COLUMNS, issues),
+            ('comments', COMMENT_COLUMNS, comments)]
+
+def seed_database(cursor, user_count, issue_count, comment_count, password='Password1',
+                  cost=12, seed=639, batch_size=1000):
+    """Adds a generated dataset to a database, after the rows it already holds.
+
+    New rows are numbered from the highest existing ID of each table, and
+    inserted in multi-row INSERT statements of up to `batch_size` rows.
+
+    Args:
+        cursor: A dictionary cursor on the database, with autocommit on.
+        user_count, issue_count, comment_count: The number of rows to add.
+        password: The password shared by every new user.
+        cost: The bcrypt cost factor.
+        seed: The random seed.
+        batch_size: Rows per INSERT statement.
+    """
+    first_ids = []
+    for table, column in [('users', 'user_id'), ('issues', 'issue_id'),
+                          ('comments', 'comment_id')]:
+        cursor.execute(f'SELECT COALESCE(MAX({column}), 0) + 1 AS first_id FROM {table}')
+        first_ids.append(cursor.fetchone()['first_id'])
+
+    rng = random.Random(seed)
+    password_hash = bcrypt.hashpw(password.encode('utf-8'),
+                                  bcrypt.gensalt(cost)).decode('utf-8')
+    tables = generate_tables(rng, user_count, issue_count, comment_count, password_hash,
+                             first_ids)
+    for table, columns, rows in tables:
+        sql = (f"INSERT INTO `{table}` ({', '.join(f'`{c}`' for c in columns)}) "
+               f"VALUES ({', '.join(['%s'] * len(columns))})")
+        total = 0
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            # MySQLdb sends these as one multi-row INSERT
+            cursor.executemany(sql, batch)
+            total += len(batch)
+        print(f'Seeded {total} {table}', file=sys.stderr)
+
+    cursor.execute('ANALYZE TABLE users, issues, comments')
+    cursor.fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=10000,
+                        help='number of users (default: %(default)s)')
+    parser.add_argument('--issues', type=int, default=100000,
+                        help='number of issues (default: %(default)s)')
+    parser.add_argument('--comments', type=int, default=300000,
+                        help='number of comments (default: %(default)s)')
+    parser.add_argument('--format', choices=['sql', 'tsv'], default='sql',
+                        help='output format (default: %(default)s)')
+    parser.add_argument('--output', default='-',
+                        help='SQL file, or directory for tsv output (default: stdout)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='rows per INSERT statement (default: %(default)s)')
+    parser.add_argument('--password', default='Password1',
+                        help='password shared by every user (default: %(default)s)')
+    parser.add_argument('--cost', type=int, default=12,
+                        help='bcrypt cost factor (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=639,
+                        help='random seed, for reproducible datasets (default: %(default)s)')
+    args = parser.parse_args()
+    if args.users < 1 or (args.comments and args.issues < 1):
+        parser.error('--users must be at least 1, and --issues too if there are comments')
+
+    rng = random.Random(args.seed)
+    password_hash = bcrypt.hashpw(args.password.encode('utf-8'),
+                                  bcrypt.gensalt(args.cost)).decode('utf-8')
+
+    tables = generate_tables(rng, args.users, args.issues, args.comments, password_hash)
+
+    if args.format == 'sql':
+        out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+        out.write('-- Synthetic LCC dataset generated by generate_dataset.py\n')
+        out.write('SET autocommit = 0, unique_checks = 0, foreign_key_checks = 0;\n')
+        for table, columns, rows in tables:
+            total = write_sql(out, table, columns, rows, args.batch_size)
+            print(f'{table}: {total} rows', file=sys.stderr)
+        out.write('SET unique_checks = 1, foreign_key_checks = 1;\n')
+        if out is not sys.stdout:
+            out.close()
+    else:
+        directory = '.' if args.output == '-' else args.output
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'load.sql'), 'w', encoding='utf-8') as load:
+            load.write('-- Load the synthetic LCC dataset generated by generate_dataset.py\n')
+            load.write('-- Run from this directory with: mysql --local-infile=1 -u root -p LCC < load.sql\n')
+            load.write('SET unique_checks = 0, foreign_key_checks = 0;\n')
+            for table, columns, rows in tables:
+                total = write_tsv(os.path.join(directory, f'{table}.tsv'), rows)
+                print(f'{table}: {total} rows', file=sys.stderr)
+                load.write(f"LOAD DATA LOCAL INFILE '{table}.tsv' INTO TABLE `{table}` "
+                           f"CHARACTER SET utf8mb4 ({', '.join(f'`{c}`' for c in columns)});\n")
+            load.write('SET unique_checks = 1, foreign_key_checks = 1;\n')
+
+if __name__ == '__main__':
+    main()
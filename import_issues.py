@@ -0,0 +1,63 @@
+"""Script to bulk-import issues, with their comments, into the LCC Issue Tracker.
+
+This script loads a CSV or JSON Lines file of issues (see loginapp/importer.py
+for the fields of each record) straight into the database, e.g. to migrate a
+ticket backlog from another tracker. Reporters and comment authors are matched
+to existing users by username.
+
+Issues are inserted in chunks, each committed in its own transaction, and
+progress is printed after every chunk. Invalid records are skipped, and listed
+at the end (up to the first 100); the script exits with status 1 if any were.
+Re-running the script after a partial import imports the file's issues again,
+so remove the issues already imported from the file first.
+
+Usage:
+    python import_issues.py FILE [--format csv|jsonl] [--database NAME]
+"""
+import argparse
+import os
+import sys
+
+import MySQLdb
+import MySQLdb.cursors
+
+from loginapp import connect, importer
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('file', help='CSV or JSON Lines file to import')
+    parser.add_argument('--format', choices=importer.IMPORT_FORMATS,
+                        help="the file's format (default: from its extension)")
+    parser.add_argument('--database', default=connect.dbname,
+                        help='database to import into (default: %(default)s)')
+    args = parser.parse_args()
+    fmt = args.format or os.path.splitext(args.file)[1].lstrip('.').lower()
+    if fmt not in importer.IMPORT_FORMATS:
+        parser.error('cannot tell the file format from its extension; pass --format')
+
+    def print_progress(summary):
+        print(f"{summary['read']} records read, {summary['imported']} issues and "
+              f"{summary['comments']} comments imported, {summary['failed']} failed",
+              file=sys.stderr)
+
+    conn = MySQLdb.connect(user=connect.dbuser, password=connect.dbpass,
+                           host=connect.dbhost, database=args.database,
+                           port=connect.dbport, autocommit=True)
+    with open(args.file, encoding='utf-8-sig', newline='') as stream, \
+            conn.cursor(MySQLdb.cursors.DictCursor) as cursor:
+        summary = importer.import_issues(conn, cursor, importer.read_records(stream, fmt),
+                                         progress=print_progress)
+    conn.close()
+
+    for error in summary['errors']:
+        location = f"line {error['line']}" if error['line'] else args.file
+        print(f"{location}: {error['error']}", file=sys.stderr)
+    if summary['failed'] > len(summary['errors']):
+        print(f"... and {summary['failed'] - len(summary['errors'])} more errors",
+              file=sys.stderr)
+    print(f"Imported {summary['imported']} issues and {summary['comments']} comments; "
+          f"{summary['failed']} records failed")
+    sys.exit(1 if summary['failed'] else 0)
+
+if __name__ == '__main__':
+    main()
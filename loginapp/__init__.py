@@ -6,6 +6,7 @@ and imports all route modules.
 """
 
 from flask import Flask, url_for, session
+import os
 
 app = Flask(__name__)
 
@@ -15,8 +16,18 @@ app.secret_key = 'Wei Liu student ID: 1162456'
 # Set up database connection
 from loginapp import connect
 from loginapp import db
+# Per-request query instrumentation is off unless SQL_INSTRUMENTATION=1 is set
+# in the environment (see `db.init_db`)
 db.init_db(app, connect.dbuser, connect.dbpass, connect.dbhost, connect.dbname,
-           connect.dbport)
+           connect.dbport,
+           instrument=os.environ.get('SQL_INSTRUMENTATION') == '1',
+           slow_ms=float(os.environ.get('SQL_SLOW_QUERY_MS', 100)),
+           repeated_threshold=int(os.environ.get('SQL_REPEATED_QUERY_THRESHOLD', 5)))
+
+# Collect request metrics (served at /metrics) for every request
+from loginapp import metrics
+app.before_request(metrics.start_request_timer)
+app.after_request(metrics.record_request)
 
 # Include all modules that define Flask route-handling functions
 from loginapp import user
@@ -24,4 +35,7 @@ from loginapp import visitor
 from loginapp import helper
 from loginapp import admin
 from loginapp import issues
-from loginapp import utils
\ No newline at end of file
+from loginapp import utils
+from loginapp import avatars
+from loginapp import export
+from loginapp import importer
\ No newline at end of file
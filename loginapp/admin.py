@@ -7,7 +7,9 @@ dashboard, user management, and user profile viewing.
 
 from loginapp import app
 from loginapp import db
-from flask import redirect, render_template, session, url_for, request, flash
+from loginapp import utils
+from loginapp import stats as dashboard_stats
+from flask import redirect, render_template, session, url_for, request, flash, jsonify
 from loginapp.decorators import admin_required
 
 @app.route('/admin/home')
@@ -21,75 +23,144 @@ def admin_home():
     Returns:
         Rendered admin home template with user data and statistics
     """
-    with db.get_cursor() as cursor:
-        # Get current user data
-        cursor.execute('SELECT * FROM users WHERE user_id = %s', (session['user_id'],))
-        user = cursor.fetchone()
+    # Get current user data
+    user = utils.get_current_user()
+
+    # Get issue and user statistics
+    stats = {
+        'issues': dashboard_stats.get_issue_stats(),
+        'users': dashboard_stats.get_user_stats()
+    }
 
-        # Get issue statistics
-        cursor.execute('''
-            SELECT status, COUNT(*) as count
-            FROM issues
-            GROUP BY status
-        ''')
-        issue_stats = {
-            'new': 0,
-            'open': 0,
-            'stalled': 0,
-            'resolved': 0
-        }
-        for row in cursor.fetchall():
-            issue_stats[row['status']] = row['count']
-
-        # Get user statistics
-        cursor.execute('''
-            SELECT role, COUNT(*) as count
-            FROM users
-            WHERE status = 'active'
-            GROUP BY role
-        ''')
-        user_stats = {
-            'visitor': 0,
-            'helper': 0,
-            'admin': 0
-        }
-        for row in cursor.fetchall():
-            user_stats[row['role']] = row['count']
+    return render_template('admin_home.html', user=user, stats=stats)
 
+@admin_required
+async def admin_home_async():
+    """
+    Async variant of `admin_home()`, served in the async serving mode (see
+    asgi.py).
+    """
+    user = await utils.get_current_user_async()
     stats = {
-        'issues': issue_stats,
-        'users': user_stats
+        'issues': await dashboard_stats.get_issue_stats_async(),
+        'users': await dashboard_stats.get_user_stats_async()
     }
 
     return render_template('admin_home.html', user=user, stats=stats)
 
+# Number of users shown per page of the user management list
+USERS_PER_PAGE = 50
+
+def _escape_like(term):
+    """
+    Escape the LIKE wildcard characters in a search term.
+
+    Args:
+        term: The search term
+
+    Returns:
+        str: The term with backslashes, % and _ escaped
+    """
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+# Pages through the (role, username) index, then fetches the rows
+USER_LIST_QUERY = '''
+    SELECT u.*
+    FROM (
+        SELECT user_id FROM users
+        ORDER BY role, username
+        LIMIT %s OFFSET %s
+    ) page
+    JOIN users u ON u.user_id = page.user_id
+    ORDER BY u.role, u.username
+'''
+USER_PREFIX_SEARCH_QUERY = '''
+    SELECT u.*
+    FROM (
+        SELECT user_id, MIN(match_rank) AS match_rank
+        FROM (
+            SELECT user_id, 0 AS match_rank FROM users WHERE username = %s
+            UNION ALL
+            SELECT user_id, 1 FROM users WHERE username LIKE %s
+            UNION ALL
+            SELECT user_id, 2 FROM users WHERE first_name LIKE %s
+            UNION ALL
+            SELECT user_id, 2 FROM users WHERE last_name LIKE %s
+        ) matches
+        GROUP BY user_id
+    ) ranked
+    JOIN users u ON u.user_id = ranked.user_id
+    ORDER BY ranked.match_rank, u.username
+    LIMIT %s OFFSET %s
+'''
+USER_CONTAINS_SEARCH_QUERY = '''
+    SELECT *, MATCH (username, first_name, last_name)
+              AGAINST (%s IN BOOLEAN MODE) AS score
+    FROM users
+    WHERE MATCH (username, first_name, last_name)
+          AGAINST (%s IN BOOLEAN MODE)
+    ORDER BY score DESC, username
+    LIMIT %s OFFSET %s
+'''
+
+def user_list_query(search, mode, limit, offset):
+    """
+    Build the query that reads one page of the user management list.
+
+    Args:
+        search: The search term, or an empty string to list every user
+        mode: 'prefix' or 'contains' (see `manage_users()`)
+        limit: The maximum number of users to return
+        offset: The number of users to skip
+
+    Returns:
+        tuple: (sql, params)
+    """
+    if search and mode == 'contains':
+        phrase = '"' + search.replace('"', ' ') + '"'
+        return USER_CONTAINS_SEARCH_QUERY, (phrase, phrase, limit, offset)
+    if search:
+        prefix = _escape_like(search) + '%'
+        return USER_PREFIX_SEARCH_QUERY, (search, prefix, prefix, prefix, limit, offset)
+    return USER_LIST_QUERY, (limit, offset)
+
 @app.route('/admin/users')
 @admin_required
 def manage_users():
     """
     User management endpoint.
     
-    Displays a list of all users with search functionality.
+    Displays one page (`page` query parameter) of users, optionally filtered
+    by the `search` query parameter. Every query is served from an index:
+    - No search: all users, ordered by role and username.
+    - `mode=prefix` (default): users whose username, first name or last name
+      starts with the search term. Exact username matches rank first, then
+      username prefixes, then name prefixes.
+    - `mode=contains`: users whose names contain the search term anywhere,
+      using the ngram FULLTEXT index and ranked by relevance.
     
     Returns:
         Rendered user management template with user list
     """
     search = request.args.get('search', '').strip()
-    
+    mode = request.args.get('mode', 'prefix')
+    if mode not in ['prefix', 'contains']:
+        mode = 'prefix'
+    page = max(1, request.args.get('page', 1, type=int))
+
     with db.get_cursor() as cursor:
-        if search:
-            cursor.execute('''
-                SELECT * FROM users 
-                WHERE username LIKE %s 
-                   OR first_name LIKE %s 
-                   OR last_name LIKE %s
-                ORDER BY role, username
-            ''', (f'%{search}%', f'%{search}%', f'%{search}%'))
-        else:
-            cursor.execute('SELECT * FROM users ORDER BY role, username')
-        users = cursor.fetchall()
-
-    return render_template('admin/manage_users.html', users=users, active_page='manage_users')
+        cursor.execute(*user_list_query(search, mode, USERS_PER_PAGE + 1,
+                                        (page - 1) * USERS_PER_PAGE))
+        users = list(cursor.fetchall())
+
+    has_next = len(users) > USERS_PER_PAGE
+    users = users[:USERS_PER_PAGE]
+
+    return render_template('admin/manage_users.html', users=users, active_page='manage_users',
+                           search=search, mode=mode, page=page, has_next=has_next)
+
+UPDATE_USER_ROLE = 'UPDATE users SET role = %s WHERE user_id = %s'
+UPDATE_USER_STATUS = 'UPDATE users SET status = %s WHERE user_id = %s'
 
 @app.route('/admin/users/<int:user_id>/role', methods=['POST'])
 @admin_required
@@ -115,9 +186,10 @@ def update_user_role(user_id):
         return redirect(url_for('manage_users'))
 
     with db.get_cursor() as cursor:
-        cursor.execute('UPDATE users SET role = %s WHERE user_id = %s', 
-                      (new_role, user_id))
+        cursor.execute(UPDATE_USER_ROLE, (new_role, user_id))
         db.get_db().commit()
+        utils.invalidate_user(user_id)
+        dashboard_stats.invalidate_user_stats()
         flash('User role updated successfully', 'success')
 
     return redirect(url_for('manage_users'))
@@ -146,13 +218,115 @@ def update_user_status(user_id):
         return redirect(url_for('manage_users'))
 
     with db.get_cursor() as cursor:
-        cursor.execute('UPDATE users SET status = %s WHERE user_id = %s',
-                      (new_status, user_id))
+        cursor.execute(UPDATE_USER_STATUS, (new_status, user_id))
         db.get_db().commit()
+        utils.invalidate_user(user_id)
+        dashboard_stats.invalidate_user_stats()
         flash('User status updated successfully', 'success')
 
     return redirect(url_for('manage_users'))
 
+# Locks the users a bulk change applies to; formatted with the changed column
+# and the WHERE clause from `utils.bulk_targets()`
+BULK_USER_LOCK_QUERY = '''
+    SELECT user_id, {column} FROM users
+    WHERE {where}
+    LIMIT %s
+    FOR UPDATE
+'''
+
+def _bulk_update_users(column, allowed_values):
+    """
+    Apply one change to many users, in one transaction.
+
+    The request's JSON body holds the new value under `column`, and names the
+    users either as a `user_ids` list or as a `filter` on role and status
+    (see `utils.bulk_targets()`). The matching rows are locked, then changed
+    with a single multi-row UPDATE. As with the single-user endpoints, admins
+    can't change their own account, which is skipped.
+
+    Args:
+        column: The users column to change ('role' or 'status')
+        allowed_values: The values the column may be set to
+
+    Returns:
+        A JSON summary of the rows matched, updated and skipped
+        400 error with a JSON message if the request is invalid
+    """
+    data = request.get_json(silent=True) or {}
+    new_value = data.get(column)
+    if new_value not in allowed_values:
+        return jsonify({'success': False, 'error': f'Invalid {column}'}), 400
+    try:
+        where, params, ids = utils.bulk_targets(data, 'user_ids', ['role', 'status'])
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    with db.get_cursor() as cursor:
+        db.get_db().begin()
+        cursor.execute(BULK_USER_LOCK_QUERY.format(column=column, where=where),
+                       params + (utils.MAX_BULK_ROWS + 1,))
+        matched = cursor.fetchall()
+        if len(matched) > utils.MAX_BULK_ROWS:
+            db.get_db().rollback()
+            return jsonify({'success': False,
+                            'error': f'More than {utils.MAX_BULK_ROWS} users match'}), 400
+
+        skipped_self = any(row['user_id'] == session['user_id'] for row in matched)
+        targets = [row['user_id'] for row in matched
+                   if row['user_id'] != session['user_id'] and row[column] != new_value]
+        if targets:
+            cursor.execute(f'''
+                UPDATE users SET {column} = %s
+                WHERE user_id IN ({', '.join(['%s'] * len(targets))})
+            ''', (new_value,) + tuple(targets))
+        db.get_db().commit()
+
+    for user_id in targets:
+        utils.invalidate_user(user_id)
+    if targets:
+        dashboard_stats.invalidate_user_stats()
+
+    matched_ids = {row['user_id'] for row in matched}
+    return jsonify({
+        'success': True,
+        'matched': len(matched),
+        'updated': len(targets),
+        'unchanged': len(matched) - len(targets) - skipped_self,
+        'skipped_self': skipped_self,
+        'not_found': [id for id in ids if id not in matched_ids] if ids else []
+    })
+
+@app.route('/admin/users/bulk/role', methods=['POST'])
+@admin_required
+def bulk_update_user_role():
+    """
+    Bulk update user role endpoint.
+
+    Changes the role of many users at once (see `_bulk_update_users()`), e.g.
+    `{"user_ids": [3, 4, 5], "role": "helper"}`.
+
+    Returns:
+        A JSON summary of the rows matched, updated and skipped
+    """
+    return _bulk_update_users('role', ['visitor', 'helper', 'admin'])
+
+@app.route('/admin/users/bulk/status', methods=['POST'])
+@admin_required
+def bulk_update_user_status():
+    """
+    Bulk update user status endpoint.
+
+    Changes the status of many users at once (see `_bulk_update_users()`),
+    e.g. `{"filter": {"role": "visitor"}, "status": "inactive"}`.
+
+    Returns:
+        A JSON summary of the rows matched, updated and skipped
+    """
+    return _bulk_update_users('status', ['active', 'inactive'])
+
+USER_QUERY = 'SELECT * FROM users WHERE user_id = %s'
+
 @app.route('/admin/users/<int:user_id>')
 @admin_required
 def view_user(user_id):
@@ -174,7 +348,7 @@ def view_user(user_id):
         return redirect(url_for('profile'))
 
     with db.get_cursor() as cursor:
-        cursor.execute('SELECT * FROM users WHERE user_id = %s', (user_id,))
+        cursor.execute(USER_QUERY, (user_id,))
         user = cursor.fetchone()
         
         if not user:
@@ -0,0 +1,363 @@
+"""
+ASGI application module (the async serving mode).
+
+This module serves the application from an asyncio event loop (e.g. with
+uvicorn; see run.py). The read-heavy pages (the issues list, issue details
+and the dashboards) are served by the async variants of their views listed in
+ASYNC_VIEWS, which query the database through `asyncdb` and so hold no thread
+while they wait on MySQL: one process can serve many concurrent slow clients.
+
+Live event streams are served by the async streaming views listed in
+ASYNC_STREAMS, so an open stream holds no thread either.
+
+Every other request (form posts, uploads, ...) is passed to the ordinary WSGI
+application, run on a pool of SYNC_THREADS threads, so the sync path behaves
+exactly as it does under gunicorn. Request bodies are streamed to it as it
+reads them, so its upload size limits reject oversized bodies before they
+are received.
+"""
+
+import asyncio
+import inspect
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request
+from werkzeug.exceptions import ClientDisconnected, HTTPException
+from loginapp import app, admin, asyncdb, connect, db, events, helper, issues, visitor
+
+# Threads serving the requests that have no async view
+SYNC_THREADS = int(os.environ.get('SYNC_THREADS', 16))
+
+# Size of the buffer the WSGI application reads request bodies through, in
+# bytes
+BODY_BUFFER_SIZE = 65536
+
+# Async views, by the endpoint of the sync view they replace
+ASYNC_VIEWS = {
+    'list_issues': issues.list_issues_async,
+    'view_issue': issues.view_issue_async,
+    'visitor_home': visitor.visitor_home_async,
+    'helper_home': helper.helper_home_async,
+    'admin_home': admin.admin_home_async,
+}
+
+# Async streaming views, by the endpoint of the sync view they replace. Each
+# is called with the request context pushed, and returns an async generator of
+# the response body's chunks (or None to have the sync view serve the request
+# after all)
+ASYNC_STREAMS = {
+    'issue_events': events.issue_events_async,
+}
+
+# Headers of the responses of the async streaming views
+STREAM_HEADERS = [('Content-Type', 'text/event-stream; charset=utf-8'),
+                  ('Cache-Control', 'no-cache'),
+                  ('X-Accel-Buffering', 'no')]
+
+asyncdb.init_db(app, connect.dbuser, connect.dbpass, connect.dbhost, connect.dbname,
+                connect.dbport)
+
+def _build_environ(scope, body):
+    """
+    Build the WSGI environ for an ASGI HTTP request.
+
+    Args:
+        scope: The ASGI connection scope
+        body: The request body, as a file-like object
+
+    Returns:
+        dict: The WSGI environ
+    """
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope['http_version'],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The input ends where the body does, so Werkzeug may read it (up to
+        # its max_content_length) even without a Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+
+class RequestBody(io.RawIOBase):
+    """
+    The body of an ASGI HTTP request, as a WSGI input stream.
+
+    The body is read from the ASGI receive channel on demand, by the thread
+    running the WSGI application, so it is never held whole in memory, and a
+    request that the application rejects (e.g. with a 413 error) is never
+    read further.
+
+    Args:
+        receive: The ASGI receive channel
+        loop: The event loop serving the request
+        first_message: The request's first message, already received
+    """
+
+    def __init__(self, receive, loop, first_message):
+        self._receive = receive
+        self._loop = loop
+        self._chunk = b''
+        self._offset = 0
+        self._complete = False
+        # Set (on the event loop) once the whole body has been received
+        self.received = asyncio.Event()
+        self.disconnected = False
+        self._accept(first_message)
+
+    def _accept(self, message):
+        if message['type'] == 'http.disconnect':
+            self.disconnected = True
+            more = False
+        else:
+            self._chunk = message.get('body', b'')
+            self._offset = 0
+            more = message.get('more_body', False)
+        if not more:
+            self._complete = True
+            self._loop.call_soon_threadsafe(self.received.set)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._offset == len(self._chunk):
+            if self.disconnected:
+                raise ClientDisconnected()
+            if self._complete:
+                return 0
+            self._accept(asyncio.run_coroutine_threadsafe(self._receive(),
+                                                          self._loop).result())
+        size = min(len(buffer), len(self._chunk) - self._offset)
+        buffer[:size] = self._chunk[self._offset:self._offset + size]
+        self._offset += size
+        return size
+
+def _header_list(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers]
+
+class Application:
+    """
+    The ASGI application, wrapping the Flask application.
+
+    Args:
+        flask_app: The Flask application
+        async_views: Async view functions, by endpoint
+        async_streams: Async streaming view functions, by endpoint
+        sync_threads: Threads serving requests through the WSGI application
+    """
+
+    def __init__(self, flask_app, async_views, async_streams, sync_threads):
+        self.app = flask_app
+        self.async_views = async_views
+        self.async_streams = async_streams
+        self.executor = ThreadPoolExecutor(max_workers=sync_threads,
+                                           thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            body = RequestBody(receive, asyncio.get_running_loop(), await receive())
+            if body.disconnected:
+                return
+            environ = _build_environ(scope, io.BufferedReader(body, BODY_BUFFER_SIZE))
+            endpoint = self._endpoint(environ)
+            if endpoint in self.async_views:
+                await self._serve_async(environ, self.async_views[endpoint], send)
+            elif not (endpoint in self.async_streams and await self._serve_stream(
+                    environ, self.async_streams[endpoint], receive, send)):
+                await self._serve_sync(environ, body, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await asyncdb.open_pool()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncdb.close_pool()
+                self.executor.shutdown(wait=False)
+                db.close_pool()
+                events.close_relay()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _endpoint(self, environ):
+        """Get the endpoint of a GET or HEAD request, or None for other
+        requests (which are always served by the WSGI application)."""
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return None
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None
+        return endpoint
+
+    async def _serve_async(self, environ, view, send):
+        """
+        Serve a request with an async view, in the same steps as
+        `Flask.wsgi_app()`: the request's before and after request functions,
+        error handlers and teardown functions all run as usual.
+        """
+        ctx = self.app.request_context(environ)
+        error = None
+        try:
+            ctx.push()
+            try:
+                try:
+                    rv = self.app.preprocess_request()
+                    if rv is None:
+                        rv = view(**request.view_args)
+                        if inspect.isawaitable(rv):
+                            rv = await rv
+                except Exception as e:
+                    rv = self.app.handle_user_exception(e)
+                response = self.app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = self.app.handle_exception(e)
+            finally:
+                await asyncdb.close_db()
+        finally:
+            ctx.pop(error)
+
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': _header_list(response.headers.items())})
+        body = b'' if environ['REQUEST_METHOD'] == 'HEAD' else response.get_data()
+        await send({'type': 'http.response.body', 'body': body})
+        response.close()
+
+    async def _serve_stream(self, environ, view, receive, send):
+        """
+        Serve a request with an async streaming view, sending each chunk as
+        soon as it is produced, until the stream ends or the client
+        disconnects.
+
+        Returns:
+            bool: False, having sent nothing, if the view left the request
+                to the WSGI application
+        """
+        with self.app.request_context(environ):
+            stream = view()
+        if stream is None:
+            return False
+
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': _header_list(STREAM_HEADERS)})
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            await send({'type': 'http.response.body'})
+            return True
+
+        async def pump():
+            async for chunk in stream:
+                await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'),
+                            'more_body': True})
+            await send({'type': 'http.response.body'})
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        pumping = asyncio.ensure_future(pump())
+        watching = asyncio.ensure_future(watch_disconnect())
+        try:
+            await asyncio.wait([pumping, watching], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watching.cancel()
+            pumping.cancel()
+            await asyncio.gather(pumping, watching, return_exceptions=True)
+            await stream.aclose()
+        if not pumping.cancelled() and pumping.exception() is not None:
+            raise pumping.exception()
+        return True
+
+    async def _serve_sync(self, environ, body, receive, send):
+        """
+        Serve a request with the WSGI application, on one of the sync
+        threads. Each chunk of the response is sent as soon as it is produced,
+        so streamed responses (such as exports) work, and the response is
+        closed early if the client disconnects.
+        """
+        loop = asyncio.get_running_loop()
+        disconnected = threading.Event()
+
+        async def watch_disconnect():
+            # The receive channel belongs to the request body until it has
+            # all been read
+            await body.received.wait()
+            if not body.disconnected:
+                while (await receive())['type'] != 'http.disconnect':
+                    pass
+            disconnected.set()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            started = []
+
+            def start_response(status, headers, exc_info=None):
+                started[:] = [int(status.split(' ', 1)[0]), _header_list(headers)]
+
+            def start():
+                if started:
+                    send_from_thread({'type': 'http.response.start',
+                                      'status': started[0], 'headers': started[1]})
+                    started.clear()
+
+            output = self.app(environ, start_response)
+            try:
+                for chunk in output:
+                    if disconnected.is_set():
+                        return
+                    start()
+                    if chunk and environ['REQUEST_METHOD'] != 'HEAD':
+                        send_from_thread({'type': 'http.response.body', 'body': chunk,
+                                          'more_body': True})
+                start()
+                send_from_thread({'type': 'http.response.body'})
+            finally:
+                if hasattr(output, 'close'):
+                    output.close()
+
+        watcher = loop.create_task(watch_disconnect())
+        try:
+            await loop.run_in_executor(self.executor, run)
+        finally:
+            watcher.cancel()
+
+application = Application(app, ASYNC_VIEWS, ASYNC_STREAMS, SYNC_THREADS)
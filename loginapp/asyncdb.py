@@ -0,0 +1,184 @@
+"""Async MySQL access for the async serving mode (see asgi.py).
+
+This module mirrors the interface of `db.py`, but its connections come from
+an aiomysql pool and every database call must be awaited, so one event loop
+can serve many requests while they wait on MySQL:
+
+    async with asyncdb.get_cursor() as cursor:
+        await cursor.execute('SELECT ...', params)
+        rows = await cursor.fetchall()
+
+Unlike `db.py`, connections are not returned to the pool by a Flask teardown
+function (those can't await); the ASGI application awaits `close_db()` at the
+end of each request instead.
+"""
+from flask import Flask, g
+import asyncio
+import MySQLdb
+
+try:
+    import aiomysql
+except ImportError:
+    # Only needed by the async serving mode
+    aiomysql = None
+
+# Database connection parameters (set when calling `init_db`).
+connection_params = {}
+
+# Pool settings (set when calling `init_db`).
+pool_settings = {}
+
+# The connection pool shared by all requests (created by `open_pool`, once the
+# event loop is running).
+pool = None
+
+_pool_lock = None
+
+def init_db(app: Flask, user: str, password: str, host: str, database: str,
+            port: int = 3306, autocommit: bool = True, pool_size: int = 5,
+            max_overflow: int = 10, pool_timeout: float = 30.0,
+            pool_recycle: float = 3600.0):
+    """Sets up async MySQL connectivity for the specified Flask app.
+
+    This must be called once while initialising the async serving mode,
+    before any other `asyncdb` module functions are called. It takes the same
+    arguments as `db.init_db()`. The pool itself is opened on first use (or
+    by `open_pool()`), since it must be created inside the event loop.
+
+    Args:
+        app: The `Flask` application to set up database connectivity for.
+        user: Username used to connect to the MySQL server.
+        password: Password used to connect to the MySQL server.
+        host: Host name or IP address of the MySQL server.
+        database: Name of the database to connect to on the MySQL server.
+        port: Port used to connect to the MySQL server (default `3306`).
+        autocommit: Whether or not to enable auto-commit (default `True`).
+        pool_size: Number of connections opened when the pool is created
+            (default `5`).
+        max_overflow: Number of extra connections that may be opened when
+            every pooled connection is in use (default `10`).
+        pool_timeout: Seconds to wait for a free connection before giving up
+            (default `30`).
+        pool_recycle: Maximum lifetime of a connection in seconds before it
+            is closed and replaced (default `3600`).
+    """
+    connection_params['user'] = user
+    connection_params['password'] = password
+    connection_params['host'] = host
+    connection_params['db'] = database
+    connection_params['port'] = port
+    connection_params['autocommit'] = autocommit
+
+    pool_settings['pool_size'] = pool_size
+    pool_settings['max_overflow'] = max_overflow
+    pool_settings['pool_timeout'] = pool_timeout
+    pool_settings['pool_recycle'] = pool_recycle
+
+async def open_pool():
+    """Opens the connection pool, if it isn't open already."""
+    global pool, _pool_lock
+
+    if pool is not None:
+        return
+    if aiomysql is None:
+        raise RuntimeError('The async serving mode requires the aiomysql package')
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if pool is None:
+            pool = await aiomysql.create_pool(
+                minsize=pool_settings['pool_size'],
+                maxsize=pool_settings['pool_size'] + pool_settings['max_overflow'],
+                pool_recycle=pool_settings['pool_recycle'],
+                **connection_params)
+
+async def close_pool():
+    """Closes every connection in the pool, e.g. when the server shuts down."""
+    global pool
+
+    if pool is not None:
+        pool.close()
+        await pool.wait_closed()
+        pool = None
+
+async def get_db():
+    """Gets an async MySQL connection to use while serving the current
+    request.
+
+    The first time you call this during a request, a connection will be
+    checked out of the connection pool. After that, any additional calls to
+    `get_db()` during the same request return the same connection.
+
+    Raises:
+        MySQLdb.OperationalError: If no connection became available within
+            the pool's wait timeout (the same error `db.get_db()` raises).
+
+    Returns:
+        An `aiomysql.Connection` instance.
+    """
+    if 'async_db' not in g:
+        await open_pool()
+        try:
+            g.async_db = await asyncio.wait_for(pool.acquire(),
+                                                pool_settings['pool_timeout'])
+        except asyncio.TimeoutError:
+            raise MySQLdb.OperationalError(
+                'Timed out after %.1fs waiting for a database connection'
+                % pool_settings['pool_timeout'])
+
+    return g.async_db
+
+class _CursorContext:
+    """Async context manager that opens a dictionary cursor on the request's
+    connection, and closes it on exit."""
+
+    async def __aenter__(self):
+        self.cursor = await (await get_db()).cursor(aiomysql.DictCursor)
+        return self.cursor
+
+    async def __aexit__(self, *exc_info):
+        await self.cursor.close()
+
+def get_cursor():
+    """Gets a new async MySQL dictionary cursor to use while serving the
+    current request, as an async context manager.
+
+    All cursors created by this function during a single request will belong
+    to the same connection.
+
+    Returns:
+        An async context manager giving an `aiomysql.DictCursor` instance.
+    """
+    return _CursorContext()
+
+def pool_stats() -> dict:
+    """Gets a snapshot of the connection pool's counters.
+
+    Returns:
+        A dictionary with the number of open, idle and checked out
+        connections and the pool limits, or an empty dictionary if the pool
+        isn't open.
+    """
+    if pool is None:
+        return {}
+    return {
+        'open': pool.size,
+        'idle': pool.freesize,
+        'checked_out': pool.size - pool.freesize,
+        'pool_size': pool_settings['pool_size'],
+        'max_overflow': pool_settings['max_overflow'],
+    }
+
+async def close_db():
+    """Returns the async MySQL connection associated with the current request
+    (if any) to the connection pool.
+
+    The ASGI application calls this at the end of every request it serves
+    asynchronously.
+    """
+    conn = g.pop('async_db', None)
+
+    if conn is not None:
+        if not conn.get_autocommit():
+            await conn.rollback()
+        pool.release(conn)
@@ -0,0 +1,240 @@
+"""
+Avatars module.
+
+This module generates small square thumbnails of profile images and serves
+them, so that pages showing many avatars (such as the issues list) download a
+few kilobytes per avatar instead of each full-size upload.
+
+Thumbnails are generated by a small pool of background threads after each
+upload, and stored as WebP files next to the originals. Until a thumbnail
+exists (e.g. for images uploaded before thumbnails were introduced), the
+original is served in its place and the thumbnail is queued.
+
+Uploaded images are stored under the SHA-256 hash of their content, so an
+image's URL changes whenever its content does. Browsers are therefore told to
+cache avatars for a year without ever revalidating them.
+"""
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+from flask import abort, send_from_directory, url_for
+from loginapp import app
+
+# Thumbnail sizes, in pixels (each thumbnail is square)
+AVATAR_SIZES = (32, 64, 128)
+
+# Image shown for users without a profile image (it is cached like an uploaded
+# image, so give it a new filename if it is ever changed)
+DEFAULT_AVATAR = '300.jpeg'
+
+# Seconds browsers may cache avatars for
+AVATAR_MAX_AGE = 365 * 24 * 60 * 60
+
+# Filenames of content-addressed images (a SHA-256 hash and an extension);
+# older uploads were named after their user and may be overwritten
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}\.[a-z]+$')
+
+# Extensions images are stored with, by the format Pillow detects
+IMAGE_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif'}
+
+# Threads generating thumbnails (Pillow releases the GIL while decoding and
+# resizing, so these don't stall the request-serving threads)
+THUMBNAIL_WORKERS = 2
+
+# WebP quality of the thumbnails
+THUMBNAIL_QUALITY = 80
+
+# Largest image, in pixels, that will be decoded; Pillow refuses anything more
+# than twice this, which protects the workers from decompression bombs
+Image.MAX_IMAGE_PIXELS = 40_000_000
+
+_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS,
+                               thread_name_prefix='thumbnails')
+_queued = set()
+_queued_lock = threading.Lock()
+
+def profile_image_folder():
+    """Get the directory profile images are stored in."""
+    return os.path.join(app.static_folder, 'uploads/profiles')
+
+def thumbnail_folder():
+    """Get the directory profile image thumbnails are stored in."""
+    return os.path.join(profile_image_folder(), 'thumbnails')
+
+def thumbnail_name(filename, size):
+    """
+    Get the filename of one of a profile image's thumbnails.
+
+    Args:
+        filename: The profile image's filename
+        size: The thumbnail size, one of AVATAR_SIZES
+
+    Returns:
+        str: The thumbnail's filename within `thumbnail_folder()`
+    """
+    return f'{filename}.{size}.webp'
+
+def image_extension(path):
+    """
+    Identify an image file's format, without decoding it.
+
+    Args:
+        path: Path of the file to check
+
+    Returns:
+        str: The extension to store the image with, or None if the file isn't
+            an image in one of the formats in IMAGE_EXTENSIONS
+    """
+    try:
+        with Image.open(path) as image:
+            image.verify()
+            return IMAGE_EXTENSIONS.get(image.format)
+    except Exception:
+        return None
+
+def is_immutable(filename):
+    """
+    Check whether an image's content can never change under its filename.
+
+    Args:
+        filename: The profile image's filename
+
+    Returns:
+        bool: True for content-addressed images and the default image
+    """
+    return filename == DEFAULT_AVATAR or bool(CONTENT_ADDRESSED_NAME.match(filename))
+
+def _send_avatar(directory, name, filename):
+    """Send an image file, letting browsers cache it for good if its content
+    can never change (see `is_immutable()`)."""
+    if not is_immutable(filename):
+        return send_from_directory(directory, name)
+    response = send_from_directory(directory, name, max_age=AVATAR_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+def generate_thumbnails(filename):
+    """
+    Generate every thumbnail of a profile image.
+
+    Each thumbnail is cropped to a centred square, matching how avatars are
+    displayed, and written under a temporary name before being renamed into
+    place, so a thumbnail is never served half-written.
+
+    Args:
+        filename: The profile image's filename
+    """
+    source = os.path.join(profile_image_folder(), filename)
+    os.makedirs(thumbnail_folder(), exist_ok=True)
+    with Image.open(source) as image:
+        # Let JPEG decode at a reduced scale, which is much faster for photos
+        image.draft('RGB', (max(AVATAR_SIZES) * 2,) * 2)
+        image = ImageOps.exif_transpose(image)
+        transparent = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if transparent else 'RGB')
+        for size in sorted(AVATAR_SIZES, reverse=True):
+            image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            path = os.path.join(thumbnail_folder(), thumbnail_name(filename, size))
+            image.save(path + '.part', 'WEBP', quality=THUMBNAIL_QUALITY)
+            os.replace(path + '.part', path)
+
+def _generate_queued(filename):
+    try:
+        generate_thumbnails(filename)
+    except FileNotFoundError:
+        # The image was deleted or replaced before its turn came
+        pass
+    except Exception:
+        app.logger.exception('Could not generate thumbnails for %s', filename)
+    finally:
+        with _queued_lock:
+            _queued.discard(filename)
+
+def queue_thumbnails(filename):
+    """
+    Queue a profile image's thumbnails to be generated in the background.
+
+    Requests for the same image while it is already queued are ignored.
+
+    Args:
+        filename: The profile image's filename
+    """
+    with _queued_lock:
+        if filename in _queued:
+            return
+        _queued.add(filename)
+    _executor.submit(_generate_queued, filename)
+
+def delete_thumbnails(filename):
+    """
+    Delete every thumbnail of a profile image.
+
+    Args:
+        filename: The profile image's filename
+    """
+    for size in AVATAR_SIZES:
+        try:
+            os.remove(os.path.join(thumbnail_folder(), thumbnail_name(filename, size)))
+        except FileNotFoundError:
+            pass
+
+@app.template_global()
+def avatar_url(filename, size=None):
+    """
+    Generate the URL of a profile image, or of one of its thumbnails.
+
+    Templates pick the smallest size that is at least as large as the image
+    is displayed, and offer the next size up to high-density screens with
+    `srcset`.
+
+    Args:
+        filename: The profile image's filename, or None for the default image
+        size: The thumbnail size, one of AVATAR_SIZES, or None for the
+            full-size image
+
+    Returns:
+        str: The image's URL
+    """
+    return url_for('avatar', size=size, filename=filename or DEFAULT_AVATAR)
+
+@app.route('/avatars/<filename>', defaults={'size': None})
+@app.route('/avatars/<int:size>/<filename>')
+def avatar(size, filename):
+    """
+    Avatar endpoint.
+
+    Serves a profile image, or one of its thumbnails. If the thumbnail hasn't
+    been generated yet, the original image is served instead and the
+    thumbnail is queued.
+
+    Content-addressed images (and their thumbnails) are sent with immutable,
+    year-long cache headers, so browsers never request them again.
+
+    Args:
+        size: The thumbnail size, one of AVATAR_SIZES, or None for the
+            full-size image
+        filename: The profile image's filename
+
+    Returns:
+        The image
+        404 error if the size or image doesn't exist
+    """
+    if size is None:
+        return _send_avatar(profile_image_folder(), filename, filename)
+    if size not in AVATAR_SIZES:
+        abort(404)
+    thumbnail = thumbnail_name(filename, size)
+    if os.path.exists(os.path.join(thumbnail_folder(), thumbnail)):
+        return _send_avatar(thumbnail_folder(), thumbnail, filename)
+
+    if not os.path.exists(os.path.join(profile_image_folder(), filename)):
+        abort(404)
+    queue_thumbnails(filename)
+    response = send_from_directory(profile_image_folder(), filename)
+    # Don't let browsers keep the full-size stand-in once the thumbnail exists
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,88 @@
+"""
+Cache module.
+
+This module provides a small in-process cache used to keep the results of
+expensive queries between requests.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    A thread-safe, size-bounded LRU cache whose entries expire after a TTL.
+
+    Each worker process has its own copy of any cache, so explicit
+    invalidation only reaches the process that performed the write. The TTL
+    bounds how stale other processes can be.
+    """
+
+    def __init__(self, maxsize=128, ttl=60.0):
+        """
+        Args:
+            maxsize: Maximum number of entries kept before the least recently
+                used entry is evicted
+            ttl: Seconds an entry stays valid after it is set
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Get a cached value.
+
+        Args:
+            key: The cache key
+            default: Value returned if the key is missing or expired
+
+        Returns:
+            The cached value, or `default`
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """
+        Cache a value, evicting the least recently used entry if full.
+
+        Args:
+            key: The cache key
+            value: The value to cache
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        """
+        Invalidate a cached value (if any).
+
+        Args:
+            key: The cache key
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Invalidate every cached value."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -1,11 +1,296 @@
-from flask import Flask, g
+from collections import Counter
+import contextlib
+from flask import Flask, g, request
+import functools
+import json
+import logging
 import MySQLdb
+import MySQLdb.cursors
+import queue
+import re
+import threading
+import time
 
 # Database connection parameters (set when calling `init_db`).
 connection_params = {}
 
+# The connection pool shared by all requests (created when calling `init_db`).
+pool = None
+
+# The cursor class returned by `get_cursor()` (set when calling `init_db`).
+cursor_class = MySQLdb.cursors.DictCursor
+
+# Query instrumentation thresholds (set when calling `init_db`).
+slow_query_ms = 100.0
+repeated_query_threshold = 5
+
+# Logger for the per-request query summaries written by instrumentation (set
+# when calling `init_db`).
+logger = logging.getLogger(__name__)
+
+_LITERAL_PATTERN = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_IN_LIST_PATTERN = re.compile(r'\bIN\s*\((?:\s*\?\s*,)+\s*\?\s*\)', re.IGNORECASE)
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of MySQL connections.
+
+    Up to `pool_size` idle connections are kept open between requests. When
+    they are all checked out, up to `max_overflow` extra connections may be
+    opened; these are closed again as soon as they are returned. Once both
+    limits are reached, `get()` blocks for up to `timeout` seconds waiting for
+    a connection to be returned.
+
+    Connections are health-checked with `ping()` on checkout, and any
+    connection older than `max_lifetime` seconds is closed and replaced
+    rather than being handed out again.
+    """
+
+    def __init__(self, params: dict, pool_size: int = 5, max_overflow: int = 10,
+                 timeout: float = 30.0, max_lifetime: float = 3600.0,
+                 pre_ping: bool = True):
+        self.params = params
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size + max_overflow)
+        self._created_at = {}
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'checked_out': 0,
+            'failed_pings': 0,
+            'recycled': 0,
+            'timeouts': 0,
+            'wait_time': 0.0,
+        }
+
+    def _connect(self):
+        conn = MySQLdb.connect(**self.params)
+        with self._lock:
+            self._created_at[id(conn)] = time.monotonic()
+            self._stats['created'] += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created_at.pop(id(conn), None)
+            self._stats['closed'] += 1
+        try:
+            conn.close()
+        except MySQLdb.Error:
+            pass
+
+    def _expired(self, conn) -> bool:
+        created_at = self._created_at.get(id(conn))
+        return (self.max_lifetime is not None and created_at is not None
+                and time.monotonic() - created_at > self.max_lifetime)
+
+    def get(self):
+        """Checks out a connection, opening a new one if none are idle.
+
+        Raises:
+            MySQLdb.OperationalError: If no connection became available within
+                the pool's wait timeout.
+        """
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise MySQLdb.OperationalError(
+                'Timed out after %.1fs waiting for a database connection'
+                % self.timeout)
+
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._connect()
+                    break
+
+                if self._expired(conn):
+                    with self._lock:
+                        self._stats['recycled'] += 1
+                    self._discard(conn)
+                    conn = None
+                elif self.pre_ping:
+                    try:
+                        conn.ping()
+                    except MySQLdb.Error:
+                        with self._lock:
+                            self._stats['failed_pings'] += 1
+                        self._discard(conn)
+                        conn = None
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['checked_out'] += 1
+            self._stats['wait_time'] += time.monotonic() - started
+        return conn
+
+    def put(self, conn, discard: bool = False):
+        """Returns a checked-out connection to the pool.
+
+        Any open transaction is rolled back first. The connection is closed
+        instead of being kept if `discard` is set, the rollback fails, it has
+        exceeded its maximum lifetime, or the pool already holds `pool_size`
+        idle connections.
+        """
+        try:
+            if not discard:
+                try:
+                    conn.rollback()
+                except MySQLdb.Error:
+                    discard = True
+
+            if discard or self._expired(conn):
+                self._discard(conn)
+            else:
+                try:
+                    self._idle.put_nowait(conn)
+                except queue.Full:
+                    self._discard(conn)
+        finally:
+            with self._lock:
+                self._stats['checked_out'] -= 1
+            self._slots.release()
+
+    def dispose(self):
+        """Closes every idle connection held by the pool."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        """Returns a snapshot of the pool's counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = len(self._created_at)
+        stats['idle'] = self._idle.qsize()
+        stats['pool_size'] = self.pool_size
+        stats['max_overflow'] = self.max_overflow
+        return stats
+
+@functools.lru_cache(maxsize=1024)
+def normalize_query(query) -> str:
+    """Normalizes a SQL statement so that runs of the same query can be
+    grouped together.
+
+    Literals and parameter placeholders are replaced with `?`, `IN` lists are
+    collapsed to `IN (...)`, and whitespace is collapsed to single spaces.
+
+    Args:
+        query: The SQL statement (str or bytes).
+
+    Returns:
+        The normalized statement.
+    """
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    query = _LITERAL_PATTERN.sub('?', ' '.join(query.split()))
+    return _IN_LIST_PATTERN.sub('IN (...)', query)
+
+class InstrumentedDictCursor(MySQLdb.cursors.DictCursor):
+    """A dictionary cursor that records every statement it runs in the
+    current Flask request's query log.
+
+    Each statement's normalized text, duration and row count are appended to
+    `g.sql_queries` as `(query, seconds, rows)` tuples.
+    """
+
+    _in_executemany = False
+
+    def _record(self, query, started):
+        elapsed = time.perf_counter() - started
+        if 'sql_queries' not in g:
+            g.sql_queries = []
+        g.sql_queries.append((normalize_query(query), elapsed, self.rowcount))
+
+    def execute(self, query, args=None):
+        if self._in_executemany:
+            return super().execute(query, args)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            self._record(query, started)
+
+    def executemany(self, query, args):
+        # `executemany()` may call `execute()` once per row; record it once.
+        started = time.perf_counter()
+        self._in_executemany = True
+        try:
+            return super().executemany(query, args)
+        finally:
+            self._in_executemany = False
+            self._record(query, started)
+
+def query_summary(queries) -> dict:
+    """Summarizes a request's query log.
+
+    Args:
+        queries: The `(query, seconds, rows)` tuples recorded for a request.
+
+    Returns:
+        A dictionary with the number of queries, their total time and rows,
+        the queries slower than `slow_query_ms`, and the queries run at least
+        `repeated_query_threshold` times (likely N+1 query patterns).
+    """
+    counts = Counter(query for query, _, _ in queries)
+    return {
+        'queries': len(queries),
+        'db_ms': round(sum(elapsed for _, elapsed, _ in queries) * 1000, 2),
+        'rows': sum(max(rows, 0) for _, _, rows in queries),
+        'slow': [{'query': query, 'ms': round(elapsed * 1000, 2), 'rows': rows}
+                 for query, elapsed, rows in queries
+                 if elapsed * 1000 >= slow_query_ms],
+        'repeated': [{'query': query, 'count': count}
+                     for query, count in counts.items()
+                     if count >= repeated_query_threshold],
+    }
+
+def report_queries(response):
+    """Adds the current request's query totals to a response, and logs them.
+
+    The totals are sent in a `Server-Timing` header (`db` with the total
+    query time, and the number of queries as its description), and written
+    as a JSON log line. The line is logged as a warning if any query was
+    slow or repeated.
+
+    This is registered as an `after_request` function when instrumentation
+    is enabled.
+    """
+    summary = query_summary(g.pop('sql_queries', []))
+    response.headers.add('Server-Timing',
+                         'db;dur=%.2f;desc="%d queries"' % (summary['db_ms'],
+                                                            summary['queries']))
+
+    flagged = summary['slow'] or summary['repeated']
+    if flagged or logger.isEnabledFor(logging.INFO):
+        summary.update(method=request.method, path=request.path,
+                       endpoint=request.endpoint, status=response.status_code)
+        logger.log(logging.WARNING if flagged else logging.INFO,
+                   json.dumps(summary, default=str))
+    return response
+
 def init_db(app: Flask, user: str, password: str, host: str, database: str,
-            port: int = 3306, autocommit: bool = True):
+            port: int = 3306, autocommit: bool = True, pool_size: int = 5,
+            max_overflow: int = 10, pool_timeout: float = 30.0,
+            pool_recycle: float = 3600.0, instrument: bool = False,
+            slow_ms: float = 100.0, repeated_threshold: int = 5):
     """Sets up MySQL connectivity for the specified Flask app.
 
     This must be called once while initialising your Flask web app, before any
@@ -19,7 +304,26 @@ def init_db(app: Flask, user: str, password: str, host: str, database: str,
         database: Name of the database to connect to on the MySQL server.
         port: Port used to connect to the MySQL server (default `3306`).
         autocommit: Whether or not to enable auto-commit (default `True`) .
+        pool_size: Number of idle connections kept open between requests
+            (default `5`).
+        max_overflow: Number of extra connections that may be opened when
+            every pooled connection is in use (default `10`).
+        pool_timeout: Seconds to wait for a free connection before giving up
+            (default `30`).
+        pool_recycle: Maximum lifetime of a connection in seconds before it
+            is closed and replaced (default `3600`).
+        instrument: Whether to record every query run by each request, and
+            report the totals in a `Server-Timing` header and a log line
+            (default `False`). When disabled, `get_cursor()` returns plain
+            `DictCursor` instances and nothing is recorded.
+        slow_ms: Duration in milliseconds at or above which an instrumented
+            query is reported as slow (default `100`).
+        repeated_threshold: Number of times the same instrumented query may
+            run in one request before it is reported as a likely N+1 query
+            pattern (default `5`).
     """
+    global pool, cursor_class, slow_query_ms, repeated_query_threshold, logger
+
     # Save connection details.
     connection_params['user'] = user
     connection_params['password'] = password
@@ -28,33 +332,47 @@ def init_db(app: Flask, user: str, password: str, host: str, database: str,
     connection_params['port'] = port
     connection_params['autocommit'] = autocommit
 
+    pool = ConnectionPool(connection_params, pool_size=pool_size,
+                          max_overflow=max_overflow, timeout=pool_timeout,
+                          max_lifetime=pool_recycle)
+
     # Register `close_db()` to run every time the application context is torn
     # down at the end of a Flask request, ensuring that any database connection
-    # using during that request gets closed.
+    # used during that request gets returned to the pool.
     app.teardown_appcontext(close_db)
 
+    if instrument:
+        cursor_class = InstrumentedDictCursor
+        slow_query_ms = slow_ms
+        repeated_query_threshold = repeated_threshold
+        # Log through the app's logger, so its handler writes the lines out
+        logger = app.logger.getChild('sql')
+        logger.setLevel(logging.INFO)
+        app.after_request(report_queries)
+
 def get_db():
     """Gets a MySQL database connection to use while serving the current Flask
     request.
 
-    The first time you call this during a request, a new connection will be
-    created. After that, any additional calls to `get_db()` during the same
-    request are guaranteed to return the same connection.
+    The first time you call this during a request, a connection will be
+    checked out of the connection pool. After that, any additional calls to
+    `get_db()` during the same request are guaranteed to return the same
+    connection.
     
     If you only need a MySQL cursor, and not a reference to the database, you
     can just call the `get_cursor()` function. There's no need to call
     `get_db()` first.
 
     You don't need to manually close the connection returned by `get_db()` - it
-    will be closed automatically at the end of the Flask request. However, you
-    should be sure to close any cursors that you create, including any created
-    by the `get_cursor()` function.
+    will be returned to the pool automatically at the end of the Flask request.
+    However, you should be sure to close any cursors that you create, including
+    any created by the `get_cursor()` function.
 
     Returns:
         A `Connection` instance.
     """
     if 'db' not in g:
-        g.db = MySQLdb.connect(**connection_params)
+        g.db = pool.get()
 
     return g.db
 
@@ -68,14 +386,82 @@ def get_cursor():
     
     Ensure that you close all cursors before the end of the Flask request.
     
+    If query instrumentation was enabled in `init_db()`, the cursor records
+    every statement it runs in the request's query log.
+
+    Returns:
+        A new `MySQLdb.cursors.DictCursor` (or `InstrumentedDictCursor`)
+        instance.
+    """
+    return get_db().cursor(cursorclass=cursor_class)
+
+@contextlib.contextmanager
+def get_streaming_cursor():
+    """Gets an unbuffered (server-side) MySQL dictionary cursor, for reading
+    results too large to hold in memory, as a context manager.
+
+    Rows are sent by the server as they are fetched, so memory use stays
+    constant however many rows the query returns. The cursor gets a
+    connection of its own, checked out of the pool for as long as the context
+    is open, so it can outlive the current Flask request (e.g. when used in
+    a streamed response's generator), and the request's other queries are
+    unaffected.
+
+    The connection is returned to the pool when the context exits normally,
+    once every row has been read. If it exits early, e.g. because the client
+    went away, the connection is closed instead of reading the rest of the
+    result just to reuse it.
+
+    Returns:
+        A context manager giving a `MySQLdb.cursors.SSDictCursor` instance.
+    """
+    conn = pool.get()
+    finished = False
+    try:
+        cursor = conn.cursor(cursorclass=MySQLdb.cursors.SSDictCursor)
+        yield cursor
+        cursor.close()
+        finished = True
+    finally:
+        pool.put(conn, discard=not finished)
+
+def reset_pool_after_fork():
+    """Replaces the connection pool in a newly forked worker process.
+
+    Connections opened before the fork share their sockets with the parent
+    process, so the new pool starts empty and the old pool's connections are
+    abandoned rather than closed (closing them would also close them for the
+    parent). Call this in each worker process right after it is forked.
+    """
+    global pool
+
+    if pool is not None:
+        pool = ConnectionPool(pool.params, pool_size=pool.pool_size,
+                              max_overflow=pool.max_overflow,
+                              timeout=pool.timeout,
+                              max_lifetime=pool.max_lifetime,
+                              pre_ping=pool.pre_ping)
+
+def close_pool():
+    """Closes every idle connection in the pool, e.g. when a worker process
+    is shutting down."""
+    if pool is not None:
+        pool.dispose()
+
+def pool_stats() -> dict:
+    """Gets a snapshot of the connection pool's counters.
+
     Returns:
-        A new `MySQLdb.cursors.DictCursor` instance.
+        A dictionary of pool statistics (connections created, closed, idle and
+        checked out, checkouts, failed health checks, recycled connections,
+        wait timeouts and total wait time), or an empty dictionary if
+        `init_db()` has not been called yet.
     """
-    return get_db().cursor(cursorclass=MySQLdb.cursors.DictCursor)
+    return pool.stats() if pool is not None else {}
 
 def close_db(exception = None):
-    """Closes the MySQL database connection associated with the current Flask
-    request (if any).
+    """Returns the MySQL database connection associated with the current Flask
+    request (if any) to the connection pool.
     
     There should be no need to call this manually: this function is called
     automatically when the application context is torn down at the end of each
@@ -90,4 +476,4 @@ def close_db(exception = None):
     db = g.pop('db', None)
     
     if db is not None:
-        db.close()
\ No newline at end of file
+        pool.put(db)
\ No newline at end of file
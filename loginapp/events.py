@@ -0,0 +1,402 @@
+"""
+Live events module.
+
+This module pushes issue activity (new issues, new comments and status
+changes) to logged-in users' browsers as Server-Sent Events, so that pages
+only need to be reloaded when something has actually changed.
+
+Events are published to an in-process broker, which hands them to every
+event stream served by the same process. When the application is served from
+several worker processes on one host (see run.py), each process also binds a
+Unix datagram socket in EVENT_SOCKET_DIR, and every event is forwarded to the
+sockets of the other processes, which republish it to their own streams.
+
+Each stream served by the sync view holds a request-handling thread for as
+long as it is open, so their number is capped by MAX_EVENT_STREAMS. In the
+async serving mode (see asgi.py), streams are served by
+`issue_events_async()` instead, which holds no thread while it waits.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+
+from flask import Response, session
+from loginapp import app
+from loginapp.decorators import login_required
+
+# Events kept queued for each stream; a stream that falls further behind is
+# closed, and the browser reconnects and reloads
+STREAM_QUEUE_SIZE = 100
+
+# Maximum number of event streams served by the sync view in each process at
+# once (each holds a request-handling thread); requests beyond this are asked
+# to reconnect later
+MAX_EVENT_STREAMS = int(os.environ.get('MAX_EVENT_STREAMS', 100))
+
+# Seconds between keep-alive comments, and the longest a stream is kept open
+# before the browser is asked to reconnect
+KEEPALIVE_INTERVAL = 15
+MAX_STREAM_DURATION = 600
+
+# Milliseconds browsers wait before reconnecting a closed stream
+RECONNECT_DELAY = 5000
+
+# Directory holding the per-process sockets that forward events between the
+# worker processes of one instance of the application. Every instance on a
+# host needs its own, or events leak between them: run.py names it after the
+# port the instance listens on, and otherwise it is named after the process
+# that loaded the application (which gunicorn's workers share when it is
+# preloaded)
+EVENT_SOCKET_DIR = os.environ.get('EVENT_SOCKET_DIR') or os.path.join(
+    tempfile.gettempdir(), 'lcc-events-%d' % os.getpid())
+
+# Largest event forwarded between processes, in bytes
+MAX_DATAGRAM_SIZE = 65536
+
+class EventBroker:
+    """
+    A thread-safe in-process publish/subscribe broker.
+
+    Each subscriber gets its own bounded queue. If a subscriber's queue is
+    full when an event is published, the subscriber is marked as overflowed
+    instead of blocking the publisher.
+    """
+
+    def __init__(self, queue_size=100):
+        """
+        Args:
+            queue_size: Maximum number of events queued for each subscriber
+        """
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, loop=None):
+        """
+        Register a new subscriber.
+
+        Args:
+            loop: The event loop of a subscriber running on asyncio, or None
+                for a subscriber running on its own thread
+
+        Returns:
+            Subscription: The subscription, which must be passed to
+                `unsubscribe()` when it is no longer needed
+        """
+        if loop is None:
+            subscription = Subscription(self.queue_size)
+        else:
+            subscription = AsyncSubscription(self.queue_size, loop)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        """
+        Hand an event to every current subscriber.
+
+        Args:
+            event: The event (a JSON-serializable dict)
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.events.put_nowait(event)
+            except queue.Full:
+                subscription.overflowed = True
+
+    def __len__(self):
+        with self._lock:
+            return len(self._subscribers)
+
+class Subscription:
+    """A broker subscriber's queue of pending events."""
+
+    def __init__(self, queue_size):
+        self.events = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+class AsyncSubscription:
+    """A broker subscriber's queue of pending events, for a subscriber
+    running on an asyncio event loop."""
+
+    def __init__(self, queue_size, loop):
+        self.events = LoopQueue(queue_size, loop)
+        self.overflowed = False
+
+class LoopQueue:
+    """
+    A bounded queue that other threads put items on, and that coroutines on
+    an event loop await items from.
+
+    Args:
+        maxsize: Maximum number of items queued
+        loop: The event loop the items are awaited on
+    """
+
+    def __init__(self, maxsize, loop):
+        self.maxsize = maxsize
+        self._loop = loop
+        self._queue = asyncio.Queue()
+
+    def put_nowait(self, item):
+        """Queue an item, raising `queue.Full` if the queue is full (or its
+        event loop has been closed)."""
+        if self._queue.qsize() >= self.maxsize:
+            raise queue.Full
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        except RuntimeError:
+            raise queue.Full
+
+    async def get(self):
+        return await self._queue.get()
+
+broker = EventBroker(STREAM_QUEUE_SIZE)
+
+_stream_slots = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
+
+_relay_socket = None
+_relay_pid = None
+_relay_lock = threading.Lock()
+
+def _relay_path(pid):
+    return os.path.join(EVENT_SOCKET_DIR, '%d.sock' % pid)
+
+def _get_relay_socket():
+    """
+    Get this process's event relay socket, binding it (and starting the
+    thread that republishes events received on it) on first use.
+
+    The socket is rebound if the current process was forked from the one
+    that bound it. Returns None if Unix sockets are unavailable, in which
+    case events only reach streams served by the publishing process.
+    """
+    global _relay_socket, _relay_pid
+    with _relay_lock:
+        if _relay_pid == os.getpid():
+            return _relay_socket
+        _relay_pid = os.getpid()
+        _relay_socket = None
+        if not hasattr(socket, 'AF_UNIX'):
+            return None
+        try:
+            os.makedirs(EVENT_SOCKET_DIR, mode=0o700, exist_ok=True)
+            path = _relay_path(_relay_pid)
+            if os.path.exists(path):
+                os.unlink(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+        except OSError:
+            app.logger.warning('Could not bind the event relay socket; live '
+                               'events will not reach other worker processes')
+            return None
+        _relay_socket = sock
+        threading.Thread(target=_receive_relayed_events, args=(sock,),
+                         name='event-relay', daemon=True).start()
+        return sock
+
+def close_relay():
+    """Close this process's event relay socket (if any) and remove its file,
+    e.g. when a worker process is shutting down."""
+    global _relay_socket
+    with _relay_lock:
+        if _relay_socket is not None and _relay_pid == os.getpid():
+            _relay_socket.close()
+            try:
+                os.unlink(_relay_path(_relay_pid))
+            except OSError:
+                pass
+        _relay_socket = None
+
+def _receive_relayed_events(sock):
+    while True:
+        try:
+            data = sock.recv(MAX_DATAGRAM_SIZE)
+        except OSError:
+            return
+        try:
+            broker.publish(json.loads(data))
+        except ValueError:
+            pass
+
+def _relay(event):
+    """Forward an event to the other worker processes on this host."""
+    sock = _get_relay_socket()
+    if sock is None:
+        return
+    data = json.dumps(event).encode('utf-8')
+    own_path = _relay_path(os.getpid())
+    try:
+        names = os.listdir(EVENT_SOCKET_DIR)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(EVENT_SOCKET_DIR, name)
+        if path == own_path or not name.endswith('.sock'):
+            continue
+        try:
+            sock.sendto(data, path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # The process that bound this socket has exited
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        except OSError:
+            # The receiver's buffer is full; it misses this event
+            pass
+
+def publish(event_type, issue, **details):
+    """
+    Publish an issue event to every stream that may see the issue.
+
+    Call this after the change has been committed.
+
+    Args:
+        event_type: 'issue_reported', 'comment_added' or 'status_changed'
+        issue: A dict with at least the issue's `issue_id` and the `user_id`
+            of its reporter
+        **details: Extra event fields (e.g. the new `status`)
+    """
+    event = dict(details, type=event_type, issue_id=issue['issue_id'],
+                 owner_id=issue['user_id'])
+    broker.publish(event)
+    _relay(event)
+
+def _may_see(event, role, user_id):
+    # The same rule as `view_issue`: staff see every issue, visitors their own
+    return role in ['helper', 'admin'] or event['owner_id'] == user_id
+
+def _format_event(event):
+    return 'event: %s\ndata: %s\n\n' % (event['type'], json.dumps(event))
+
+def _end_event(missed, retry):
+    """
+    The event sent last on every stream the server closes.
+
+    Browsers report any closed stream as an error, so the page can't tell a
+    planned close from a lost connection by itself. On this event it closes
+    the stream and opens a new one, and only warns that it may be out of date
+    if `missed` is true.
+
+    Args:
+        missed: Whether events the page should have seen were dropped
+        retry: Milliseconds to wait before reconnecting
+    """
+    return 'event: end\ndata: %s\n\n' % json.dumps({'missed': missed, 'retry': retry})
+
+def _retry_later():
+    """An event stream that closes at once, asking the browser to reconnect
+    later (browsers give up on a stream for good if it gets an error
+    response). The page isn't being kept up to date meanwhile, so events
+    count as missed."""
+    retry = RECONNECT_DELAY * 6
+    return Response('retry: %d\n\n' % retry + _end_event(True, retry),
+                    mimetype='text/event-stream')
+
+@app.route('/issues/events')
+@login_required
+def issue_events():
+    """
+    Live issue events endpoint.
+
+    Streams the issue events the current user may see as Server-Sent Events.
+    The stream is closed after MAX_STREAM_DURATION seconds (or when it falls
+    too far behind), with an `end` event telling the page to reconnect, and
+    whether it missed any events.
+
+    Returns:
+        A text/event-stream response, which asks the browser to reconnect
+        later and closes at once if this process is already serving
+        MAX_EVENT_STREAMS streams
+    """
+    if not _stream_slots.acquire(blocking=False):
+        return _retry_later()
+
+    role = session['role']
+    user_id = session['user_id']
+    # Bind the relay socket before subscribing, so events published by other
+    # processes reach this one
+    _get_relay_socket()
+    subscription = broker.subscribe()
+
+    def stream():
+        yield 'retry: %d\n\n' % RECONNECT_DELAY
+        deadline = time.monotonic() + MAX_STREAM_DURATION
+        while time.monotonic() < deadline and not subscription.overflowed:
+            try:
+                event = subscription.events.get(timeout=KEEPALIVE_INTERVAL)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            if _may_see(event, role, user_id):
+                yield _format_event(event)
+        # A stream that fell behind reconnects after the usual delay, one that
+        # expired straight away
+        yield _end_event(subscription.overflowed,
+                         RECONNECT_DELAY if subscription.overflowed else 0)
+
+    def close():
+        broker.unsubscribe(subscription)
+        _stream_slots.release()
+
+    response = Response(stream(), mimetype='text/event-stream')
+    # Runs when the server closes the response, even if the client went away
+    # before the stream started
+    response.call_on_close(close)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies such as nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+async def _stream_async(role, user_id):
+    # Subscribe once the stream starts, so a stream that is never started
+    # never needs to unsubscribe
+    subscription = broker.subscribe(asyncio.get_running_loop())
+    try:
+        yield 'retry: %d\n\n' % RECONNECT_DELAY
+        deadline = time.monotonic() + MAX_STREAM_DURATION
+        while time.monotonic() < deadline and not subscription.overflowed:
+            try:
+                event = await asyncio.wait_for(subscription.events.get(),
+                                               KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if _may_see(event, role, user_id):
+                yield _format_event(event)
+        # A stream that fell behind reconnects after the usual delay, one that
+        # expired straight away
+        yield _end_event(subscription.overflowed,
+                         RECONNECT_DELAY if subscription.overflowed else 0)
+    finally:
+        broker.unsubscribe(subscription)
+
+def issue_events_async():
+    """
+    Async variant of `issue_events()`, for the async serving mode.
+
+    The stream waits for events on the event loop rather than on a thread, so
+    these streams aren't limited by MAX_EVENT_STREAMS. Call this with the
+    request context pushed; the stream itself runs without it.
+
+    Returns:
+        An async generator of the stream's chunks, or None if the user isn't
+        logged in (the sync view then redirects them to the login page)
+    """
+    if 'loggedin' not in session:
+        return None
+    _get_relay_socket()
+    return _stream_async(session['role'], session['user_id'])
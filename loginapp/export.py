@@ -0,0 +1,288 @@
+"""
+Export module.
+
+This module provides admin-only exports of issues and comments, as CSV or
+JSON Lines, for reporting.
+
+Exports are streamed: the rows are read through an unbuffered server-side
+cursor and written to the response by a generator as they arrive, so
+exporting millions of rows uses constant memory, and the first bytes are sent
+before the query has finished.
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+
+from flask import Response, request
+from loginapp import app, db
+from loginapp.decorators import admin_required
+
+# Export formats, and the content type each is sent with
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+# Rows fetched from the server, and sent to the client, at a time
+FETCH_SIZE = 1000
+
+ISSUE_EXPORT_COLUMNS = ['issue_id', 'summary', 'description', 'status', 'created_at',
+                        'updated_at', 'comment_count', 'reporter_id', 'reporter_username',
+                        'reporter_first_name', 'reporter_last_name']
+
+ISSUE_EXPORT_QUERY = '''
+    SELECT i.issue_id, i.summary, i.description, i.status, i.created_at,
+           i.updated_at, i.comment_count, u.user_id AS reporter_id,
+           u.username AS reporter_username, u.first_name AS reporter_first_name,
+           u.last_name AS reporter_last_name
+    FROM issues i
+    JOIN users u ON i.user_id = u.user_id
+'''
+
+COMMENT_EXPORT_COLUMNS = ['comment_id', 'issue_id', 'issue_status', 'content', 'created_at',
+                          'author_id', 'author_username', 'author_role']
+
+COMMENT_EXPORT_QUERY = '''
+    SELECT c.comment_id, c.issue_id, i.status AS issue_status, c.content,
+           c.created_at, u.user_id AS author_id, u.username AS author_username,
+           u.role AS author_role
+    FROM comments c
+    JOIN issues i ON c.issue_id = i.issue_id
+    JOIN users u ON c.user_id = u.user_id
+'''
+
+class InvalidFilter(Exception):
+    """Raised when an export's query parameters are invalid."""
+
+def _parse_date(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise InvalidFilter(f'{name} must be a date in YYYY-MM-DD format')
+
+def _export_filters(args, table_alias, status_column):
+    """
+    Build the WHERE clause for an export from its query parameters.
+
+    - `status`: only rows whose issue has this status
+    - `user_id`: only issues reported (or comments written) by this user
+    - `since`, `until`: only rows created on or after / on or before these
+      dates (YYYY-MM-DD)
+
+    Args:
+        args: The query parameters (e.g. `request.args`)
+        table_alias: The alias of the exported table ('i' or 'c')
+        status_column: The column holding the issue status
+
+    Raises:
+        InvalidFilter: If a parameter is invalid
+
+    Returns:
+        tuple: (where_clause, params), with an empty clause if no filters
+            were given
+    """
+    conditions = []
+    params = []
+
+    status = args.get('status')
+    if status:
+        if status not in ['new', 'open', 'stalled', 'resolved']:
+            raise InvalidFilter('status must be new, open, stalled or resolved')
+        conditions.append(f'{status_column} = %s')
+        params.append(status)
+
+    if args.get('user_id'):
+        user_id = args.get('user_id', type=int)
+        if user_id is None:
+            raise InvalidFilter('user_id must be a number')
+        conditions.append(f'{table_alias}.user_id = %s')
+        params.append(user_id)
+
+    since = _parse_date(args, 'since')
+    if since:
+        conditions.append(f'{table_alias}.created_at >= %s')
+        params.append(since)
+    until = _parse_date(args, 'until')
+    if until:
+        conditions.append(f'{table_alias}.created_at < %s')
+        params.append(until + timedelta(days=1))
+
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    return where, tuple(params)
+
+def export_query(sql, args, table_alias, status_column, order):
+    """
+    Build the complete query for an export.
+
+    Args:
+        sql: The export query, without a WHERE or ORDER BY clause
+        args: The query parameters (see `_export_filters()`)
+        table_alias: The alias of the exported table ('i' or 'c')
+        status_column: The column holding the issue status
+        order: The ORDER BY columns, or None to send the rows as they are read
+
+    Raises:
+        InvalidFilter: If a parameter is invalid
+
+    Returns:
+        tuple: (sql, params)
+    """
+    where, params = _export_filters(args, table_alias, status_column)
+    order = f'ORDER BY {order}' if order else ''
+    return f'{sql} {where} {order}', params
+
+def issue_export_order(args):
+    """
+    Get the ORDER BY columns of an issues export.
+
+    Args:
+        args: The query parameters (see `_export_filters()`)
+
+    Returns:
+        str: The columns
+    """
+    if args.get('status') or args.get('user_id'):
+        # Read through the (status or user_id, created_at) indexes
+        return 'i.created_at, i.issue_id'
+    return 'i.issue_id'
+
+def comment_export_order(args):
+    """
+    Get the ORDER BY columns of a comments export.
+
+    Args:
+        args: The query parameters (see `_export_filters()`)
+
+    Returns:
+        str: The columns, or None when filtering on status, as those comments
+            are read through the issues' status index
+    """
+    return None if args.get('status') else 'c.comment_id'
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def _csv_value(value):
+    return value.isoformat(sep=' ') if isinstance(value, datetime) else value
+
+def _stream_rows(sql, params, columns, fmt):
+    """
+    Generate an export's output, reading its rows as they arrive.
+
+    Args:
+        sql: The export query
+        params: The query's parameters
+        columns: The columns to export, in order
+        fmt: 'csv' or 'jsonl'
+
+    Yields:
+        str: Chunks of the export
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    if fmt == 'csv':
+        writer.writerow(columns)
+        # Send the header straight away, before the query runs
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+
+    with db.get_streaming_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                if fmt == 'csv':
+                    writer.writerow([_csv_value(row[column]) for column in columns])
+                else:
+                    output.write(json.dumps({column: row[column] for column in columns},
+                                            default=_json_value))
+                    output.write('\n')
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+
+def _export(name, sql, columns, table_alias, status_column, order, fmt):
+    """
+    Build the streamed response for an export.
+
+    The rows are sorted in the order of the index that serves the filters, so
+    MySQL never has to sort the whole result before sending its first row.
+
+    Args:
+        name: The export's name, used in its filename
+        sql: The export query, without a WHERE or ORDER BY clause
+        columns: The columns to export, in order
+        table_alias: The alias of the exported table ('i' or 'c')
+        status_column: The column holding the issue status
+        order: The ORDER BY columns, or None to send the rows as they are read
+        fmt: 'csv' or 'jsonl'
+
+    Returns:
+        The export response
+        400 error if the format or a filter is invalid
+    """
+    if fmt not in EXPORT_FORMATS:
+        return Response('Unknown export format\n', status=400, mimetype='text/plain')
+    try:
+        sql, params = export_query(sql, request.args, table_alias, status_column, order)
+    except InvalidFilter as e:
+        return Response(f'{e}\n', status=400, mimetype='text/plain')
+
+    response = Response(_stream_rows(sql, params, columns, fmt),
+                        content_type=EXPORT_FORMATS[fmt])
+    filename = f'{name}-{datetime.now():%Y%m%d-%H%M%S}.{fmt}'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Stop reverse proxies such as nginx from buffering the whole export
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/admin/export/issues.<fmt>')
+@admin_required
+def export_issues(fmt):
+    """
+    Issues export endpoint.
+
+    Streams every issue matching the filters (see `_export_filters()`), with
+    its reporter and comment count, oldest first.
+
+    Args:
+        fmt: 'csv' or 'jsonl'
+
+    Returns:
+        The issues as a CSV or JSON Lines attachment
+        400 error if the format or a filter is invalid
+    """
+    return _export('issues', ISSUE_EXPORT_QUERY, ISSUE_EXPORT_COLUMNS, 'i', 'i.status',
+                   issue_export_order(request.args), fmt)
+
+@app.route('/admin/export/comments.<fmt>')
+@admin_required
+def export_comments(fmt):
+    """
+    Comments export endpoint.
+
+    Streams every comment matching the filters (see `_export_filters()`;
+    `status` filters on the status of the comment's issue, and `user_id` on
+    the comment's author), with its author, oldest first; comments filtered
+    by status are sent grouped by issue instead, as they are read through the
+    issues' status index.
+
+    Args:
+        fmt: 'csv' or 'jsonl'
+
+    Returns:
+        The comments as a CSV or JSON Lines attachment
+        400 error if the format or a filter is invalid
+    """
+    return _export('comments', COMMENT_EXPORT_QUERY, COMMENT_EXPORT_COLUMNS, 'c', 'i.status',
+                   comment_export_order(request.args), fmt)
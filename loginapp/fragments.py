@@ -0,0 +1,96 @@
+"""
+Fragment cache module.
+
+This module caches the rendered HTML of issue list rows and issue comment
+lists, so that pages showing unchanged issues don't re-render them.
+
+Each fragment is stored with a version stamp built from the row data it was
+rendered from (for list rows, the issue's `version`, which is bumped on every
+change to the issue, and its reporter's details). A fragment is only reused
+while the stamp of the data being displayed still matches, so a stale
+fragment is never shown even if an invalidation is missed (for example, one
+made by another worker process). Routes that change an issue also invalidate
+its fragments explicitly, to free them straight away.
+"""
+
+from flask import render_template, session
+from markupsafe import Markup
+from loginapp import app
+from loginapp.cache import TTLCache
+
+# Number of rendered fragments kept, and for how many seconds
+FRAGMENT_CACHE_SIZE = 10000
+FRAGMENT_CACHE_TTL = 3600
+
+# Roles that list rows are rendered for (rows differ by role)
+ROLES = ['visitor', 'helper', 'admin']
+
+_fragment_cache = TTLCache(maxsize=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_CACHE_TTL)
+
+def _render_cached(key, stamp, template, **context):
+    """
+    Get a cached fragment, rendering and caching it if it is missing or its
+    stamp doesn't match.
+
+    Args:
+        key: The cache key of the fragment
+        stamp: The version stamp of the data the fragment shows
+        template: The template that renders the fragment
+        **context: Variables passed to the template
+
+    Returns:
+        Markup: The rendered fragment
+    """
+    entry = _fragment_cache.get(key)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+    html = Markup(render_template(template, **context))
+    _fragment_cache.set(key, (stamp, html))
+    return html
+
+@app.template_global()
+def issue_row(issue):
+    """
+    Render an issues list row for the current user's role.
+
+    Args:
+        issue: The issue's row, joined with its reporter's details
+
+    Returns:
+        Markup: The rendered table row
+    """
+    role = session['role']
+    stamp = (issue['version'], issue['first_name'], issue['last_name'],
+             issue['profile_image'])
+    return _render_cached(('issue_row', role, issue['issue_id']), stamp,
+                          'issues/row.html', issue=issue, role=role)
+
+@app.template_global()
+def issue_comments(issue_id, comments):
+    """
+    Render the comments list of an issue. The list looks the same to every
+    user, so it is shared by all roles.
+
+    Args:
+        issue_id: The ID of the issue
+        comments: The issue's comments, joined with their authors' details
+
+    Returns:
+        Markup: The rendered comments list
+    """
+    stamp = tuple((comment['comment_id'], comment['first_name'], comment['last_name'],
+                   comment['profile_image'], comment['role'])
+                  for comment in comments)
+    return _render_cached(('issue_comments', issue_id), stamp,
+                          'issues/comments.html', comments=comments)
+
+def invalidate_issue(issue_id):
+    """
+    Discard the cached fragments of an issue after it has been changed.
+
+    Args:
+        issue_id: The ID of the changed issue
+    """
+    for role in ROLES:
+        _fragment_cache.pop(('issue_row', role, issue_id))
+    _fragment_cache.pop(('issue_comments', issue_id))
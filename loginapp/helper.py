@@ -5,7 +5,8 @@ This module handles helper-specific functionality including the helper dashboard
 """
 
 from loginapp import app
-from loginapp import db
+from loginapp import utils
+from loginapp import stats as dashboard_stats
 from flask import render_template, session
 from loginapp.decorators import helper_required
 
@@ -20,24 +21,22 @@ def helper_home():
     Returns:
         Rendered helper home template with user data and statistics
     """
-    with db.get_cursor() as cursor:
-        # Get current user data
-        cursor.execute('SELECT * FROM users WHERE user_id = %s', (session['user_id'],))
-        user = cursor.fetchone()
+    # Get current user data
+    user = utils.get_current_user()
 
-        # Get issue statistics
-        cursor.execute('''
-            SELECT status, COUNT(*) as count
-            FROM issues
-            GROUP BY status
-        ''')
-        stats = {
-            'new': 0,
-            'open': 0,
-            'stalled': 0,
-            'resolved': 0
-        }
-        for row in cursor.fetchall():
-            stats[row['status']] = row['count']
+    # Get issue statistics
+    stats = dashboard_stats.get_issue_stats()
 
-    return render_template('helper_home.html', user=user, stats=stats) 
\ No newline at end of file
+    return render_template('helper_home.html', user=user, stats=stats)
+
+@helper_required
+async def helper_home_async():
+    """
+    Async variant of `helper_home()`, served in the async serving mode (see
+    asgi.py).
+    """
+    user = await utils.get_current_user_async()
+    stats = await dashboard_stats.get_issue_stats_async()
+
+    return render_template('helper_home.html', user=user, stats=stats)
+ 
\ No newline at end of file
@@ -0,0 +1,348 @@
+"""
+Import module.
+
+This module bulk-loads issues, with their comments, from CSV or JSON Lines
+files, e.g. to migrate a ticket backlog from another tracker. It backs both
+the admin import endpoint below and the import_issues.py command (which is
+better suited to very large files).
+
+Each record is one issue, with the fields:
+- `reporter_username`: the username of an existing user
+- `summary`, `description`
+- `status` (optional, default 'new')
+- `created_at` (optional, ISO 8601, default the time of the import)
+- `comments` (optional): a list of objects with an `author_username`, the
+  `content` and an optional `created_at`; in CSV files, a JSON array
+
+The field names match the issues export (see export.py), so an export can be
+imported again. Any other fields are ignored.
+
+The file is parsed as a stream, and usernames are resolved through a dict of
+every user loaded up front, so the import runs no per-record lookups. Records
+are inserted CHUNK_SIZE issues at a time, each chunk in its own transaction,
+with one multi-row INSERT for the chunk's issues and one per
+COMMENT_BATCH_SIZE of its comments. Invalid records are reported and skipped,
+and a chunk the database rejects is retried one record at a time, so one bad
+record never costs the rest of the load.
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+import MySQLdb
+from flask import jsonify, request
+from loginapp import app, db, stats
+from loginapp.decorators import admin_required
+
+# Import formats
+IMPORT_FORMATS = ['csv', 'jsonl']
+
+# Issues inserted per transaction, and the most comments a transaction may
+# hold before it is committed early
+CHUNK_SIZE = 500
+MAX_CHUNK_COMMENTS = 5000
+
+# Comments inserted per INSERT statement
+COMMENT_BATCH_SIZE = 1000
+
+# Errors listed in an import's summary (the rest are only counted)
+MAX_REPORTED_ERRORS = 100
+
+# Longest summary, in characters, and description or comment, in bytes
+MAX_SUMMARY_LENGTH = 255
+MAX_TEXT_BYTES = 65535
+
+ISSUE_STATUSES = ['new', 'open', 'stalled', 'resolved']
+
+USERNAMES_QUERY = 'SELECT user_id, username FROM users'
+
+INSERT_ISSUES = '''
+    INSERT INTO issues (user_id, summary, description, status, created_at, comment_count)
+    VALUES '''
+ISSUE_VALUES = '(%s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP), %s)'
+
+INSERT_COMMENTS = '''
+    INSERT INTO comments (issue_id, user_id, content, created_at)
+    VALUES '''
+COMMENT_VALUES = '(%s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))'
+
+class InvalidRecord(Exception):
+    """Raised when an import record can't be imported."""
+
+def read_records(stream, fmt):
+    """
+    Parse an import file as a stream.
+
+    Args:
+        stream: The file, as a text stream (opened with newline='' for CSV)
+        fmt: 'csv' or 'jsonl'
+
+    Yields:
+        tuple: (line_number, record), where `record` is a dict, or an
+            InvalidRecord if the record couldn't be parsed
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        while True:
+            try:
+                record = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield reader.line_num, InvalidRecord(f'Invalid CSV: {e}')
+                continue
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, InvalidRecord(f'Invalid JSON: {e}')
+                continue
+            if not isinstance(record, dict):
+                record = InvalidRecord('Each line must hold a JSON object')
+            yield line_number, record
+
+def load_usernames(cursor):
+    """
+    Load the user ID of every user, by username.
+
+    Args:
+        cursor: A dictionary cursor
+
+    Returns:
+        dict: User IDs by username
+    """
+    cursor.execute(USERNAMES_QUERY)
+    return {row['username']: row['user_id'] for row in cursor.fetchall()}
+
+def _text(record, field, required=True):
+    value = record.get(field)
+    if value is None or value == '':
+        if required:
+            raise InvalidRecord(f'{field} is required')
+        return None
+    if not isinstance(value, str):
+        raise InvalidRecord(f'{field} must be a string')
+    value = value.strip()
+    if required and not value:
+        raise InvalidRecord(f'{field} is required')
+    return value
+
+def _long_text(record, field):
+    value = _text(record, field)
+    if len(value.encode('utf-8')) > MAX_TEXT_BYTES:
+        raise InvalidRecord(f'{field} is longer than {MAX_TEXT_BYTES} bytes')
+    return value
+
+def _user_id(record, field, usernames):
+    username = _text(record, field)
+    if username not in usernames:
+        raise InvalidRecord(f'{field} {username!r} is not an existing user')
+    return usernames[username]
+
+def _timestamp(record, field):
+    value = _text(record, field, required=False)
+    if value is None:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidRecord(f'{field} must be an ISO 8601 date and time')
+    if timestamp.tzinfo is not None:
+        # Stored in local time, like every other timestamp
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+def parse_record(record, usernames):
+    """
+    Validate an import record and convert it into rows to insert.
+
+    Args:
+        record: The parsed record
+        usernames: User IDs by username (see `load_usernames()`)
+
+    Raises:
+        InvalidRecord: If the record is invalid
+
+    Returns:
+        tuple: (issue_row, comment_rows), where the comment rows don't yet
+            hold their issue ID
+    """
+    user_id = _user_id(record, 'reporter_username', usernames)
+    summary = _text(record, 'summary')
+    if len(summary) > MAX_SUMMARY_LENGTH:
+        raise InvalidRecord(f'summary is longer than {MAX_SUMMARY_LENGTH} characters')
+    description = _long_text(record, 'description')
+    status = _text(record, 'status', required=False) or 'new'
+    if status not in ISSUE_STATUSES:
+        raise InvalidRecord('status must be new, open, stalled or resolved')
+    created_at = _timestamp(record, 'created_at')
+
+    comments = record.get('comments') or []
+    if isinstance(comments, str):
+        try:
+            comments = json.loads(comments)
+        except ValueError:
+            raise InvalidRecord('comments must be a JSON array')
+    if not isinstance(comments, list):
+        raise InvalidRecord('comments must be a list')
+    comment_rows = []
+    for number, comment in enumerate(comments, start=1):
+        if not isinstance(comment, dict):
+            raise InvalidRecord(f'comment {number} must be an object')
+        try:
+            comment_rows.append((_user_id(comment, 'author_username', usernames),
+                                 _long_text(comment, 'content'),
+                                 _timestamp(comment, 'created_at')))
+        except InvalidRecord as e:
+            raise InvalidRecord(f'comment {number}: {e}')
+
+    issue_row = (user_id, summary, description, status, created_at, len(comment_rows))
+    return issue_row, comment_rows
+
+def _insert_chunk(conn, cursor, chunk, id_step):
+    """
+    Insert a chunk of parsed records in one transaction.
+
+    InnoDB gives the rows of a multi-row INSERT with a known row count one
+    consecutive block of IDs, so each issue's ID follows from the first.
+
+    Args:
+        conn: The database connection
+        cursor: A cursor on the connection
+        chunk: (line_number, issue_row, comment_rows) tuples
+        id_step: The server's auto_increment_increment
+    """
+    conn.begin()
+    cursor.execute(INSERT_ISSUES + ', '.join([ISSUE_VALUES] * len(chunk)),
+                   [value for _, issue_row, _ in chunk for value in issue_row])
+    first_id = cursor.lastrowid
+
+    comment_rows = [(first_id + index * id_step,) + row
+                    for index, (_, _, rows) in enumerate(chunk) for row in rows]
+    for start in range(0, len(comment_rows), COMMENT_BATCH_SIZE):
+        batch = comment_rows[start:start + COMMENT_BATCH_SIZE]
+        cursor.execute(INSERT_COMMENTS + ', '.join([COMMENT_VALUES] * len(batch)),
+                       [value for row in batch for value in row])
+    conn.commit()
+
+def import_issues(conn, cursor, records, progress=None):
+    """
+    Import issues, with their comments.
+
+    Every chunk is committed as soon as it is inserted, so the issues
+    imported before a failure stay imported.
+
+    Args:
+        conn: The database connection
+        cursor: A dictionary cursor on the connection
+        records: (line_number, record) tuples (see `read_records()`)
+        progress: Optional function called with the summary after each chunk
+
+    Returns:
+        dict: A summary with the number of records `read`, issues
+            `imported`, `comments` imported and records that `failed`, the
+            first MAX_REPORTED_ERRORS `errors` (each with its `line` and
+            `error`), and whether the whole file was `complete`ly read
+    """
+    summary = {'read': 0, 'imported': 0, 'comments': 0, 'failed': 0, 'errors': [],
+               'complete': True}
+
+    def fail(line_number, error):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'line': line_number, 'error': str(error)})
+
+    def flush(chunk):
+        try:
+            _insert_chunk(conn, cursor, chunk, id_step)
+        except MySQLdb.DatabaseError as e:
+            # A rollback on a lost connection raises, ending the import
+            conn.rollback()
+            if len(chunk) == 1:
+                fail(chunk[0][0], f'Database error: {e.args[-1]}')
+                return
+            for item in chunk:
+                flush([item])
+            return
+        summary['imported'] += len(chunk)
+        summary['comments'] += sum(len(rows) for _, _, rows in chunk)
+
+    usernames = load_usernames(cursor)
+    cursor.execute('SELECT @@auto_increment_increment AS step')
+    id_step = cursor.fetchone()['step']
+
+    chunk = []
+    chunk_comments = 0
+    records = iter(records)
+    while True:
+        try:
+            line_number, record = next(records)
+        except StopIteration:
+            break
+        except UnicodeDecodeError:
+            fail(None, 'The file is not valid UTF-8; the rest of it was not read')
+            summary['complete'] = False
+            break
+        summary['read'] += 1
+        try:
+            if isinstance(record, InvalidRecord):
+                raise record
+            issue_row, comment_rows = parse_record(record, usernames)
+        except InvalidRecord as e:
+            fail(line_number, e)
+            continue
+        chunk.append((line_number, issue_row, comment_rows))
+        chunk_comments += len(comment_rows)
+        if len(chunk) >= CHUNK_SIZE or chunk_comments >= MAX_CHUNK_COMMENTS:
+            flush(chunk)
+            chunk = []
+            chunk_comments = 0
+            if progress:
+                progress(summary)
+    if chunk:
+        flush(chunk)
+        if progress:
+            progress(summary)
+    return summary
+
+@app.route('/admin/import/issues', methods=['POST'])
+@admin_required
+def import_issues_upload():
+    """
+    Issues import endpoint.
+
+    Imports the issues, with their comments, in an uploaded CSV or JSON Lines
+    file (the `file` field), whose format is given by the `format` field or
+    else by the file's extension. Invalid records are skipped and listed in
+    the summary. Progress is logged after every chunk.
+
+    Returns:
+        A JSON summary of the import (see `import_issues()`)
+        400 error with a JSON message if no file or format was given
+    """
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+    fmt = request.form.get('format') or os.path.splitext(file.filename)[1].lstrip('.').lower()
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'format must be csv or jsonl'}), 400
+
+    def log_progress(summary):
+        app.logger.info('Importing %s: %d records read, %d issues imported, %d failed',
+                        file.filename, summary['read'], summary['imported'],
+                        summary['failed'])
+
+    stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+    with db.get_cursor() as cursor:
+        summary = import_issues(db.get_db(), cursor, read_records(stream, fmt),
+                                progress=log_progress)
+    if summary['imported']:
+        stats.invalidate_issue_stats()
+    return jsonify(dict(summary, success=summary['complete']))
@@ -6,10 +6,25 @@ listing, viewing, commenting, and status updates.
 """
 
 from loginapp import app
+from loginapp import asyncdb
 from loginapp import db
-from flask import redirect, render_template, request, session, url_for, flash
+from loginapp import events
+from loginapp import fragments
+from loginapp import stats
+from loginapp import utils
+from datetime import datetime
+from flask import redirect, render_template, request, session, url_for, flash, make_response, jsonify
+from werkzeug.http import is_resource_modified
+import hashlib
 from loginapp.decorators import login_required, helper_or_admin_required
 
+# Columns shown for each issue in the issues list
+ISSUE_LIST_QUERY = '''
+    SELECT i.*, u.username, u.first_name, u.last_name, u.profile_image
+    FROM issues i 
+    JOIN users u ON i.user_id = u.user_id 
+'''
+
 @app.route('/issues/report', methods=['GET', 'POST'])
 @login_required
 def report_issue():
@@ -47,6 +62,10 @@ def report_issue():
                 ''', (session['user_id'], form_data['summary'], 
                       form_data['description'], 'new'))
                 db.get_db().commit()
+                stats.invalidate_issue_stats()
+                events.publish('issue_reported',
+                               {'issue_id': cursor.lastrowid, 'user_id': session['user_id']},
+                               summary=form_data['summary'], status='new')
                 
                 flash('Issue reported successfully!', 'success')
                 return redirect(url_for('list_issues'))
@@ -58,83 +77,482 @@ def report_issue():
                          errors={}, 
                          form_data={})
 
+# Default and maximum number of issues shown per page of the issues list
+ISSUES_PER_PAGE = 25
+MAX_ISSUES_PER_PAGE = 100
+
+# Statuses shown in the active issues list, in display order
+ACTIVE_STATUSES = ['new', 'open', 'stalled']
+
+def issue_partitions(filter_type, role, user_id):
+    """
+    Get the list partitions to page through for an issues list filter.
+
+    Each partition is a WHERE clause and its parameters. Partitions are listed
+    in status rank order, and the issues within each partition are ordered
+    newest first, so that every partition can be read with a single index
+    range scan.
+
+    Args:
+        filter_type: The filter requested for the issues list
+        role: The role of the user listing issues
+        user_id: The ID of the user listing issues
+
+    Returns:
+        list: (where_clause, params) tuples in display order
+    """
+    if filter_type == 'my_issues':
+        return [('i.user_id = %s', (user_id,))]
+    if filter_type == 'my_active':
+        return [("i.user_id = %s AND i.status != 'resolved'", (user_id,))]
+    if filter_type == 'my_resolved':
+        return [("i.user_id = %s AND i.status = 'resolved'", (user_id,))]
+    if role in ['helper', 'admin']:
+        if filter_type == 'resolved':
+            return [("i.status = 'resolved'", ())]
+        return [('i.status = %s', (status,)) for status in ACTIVE_STATUSES]
+    # Visitor sees only their own issues by default
+    return [('i.user_id = %s', (user_id,))]
+
+def _encode_cursor(rank, issue):
+    """
+    Encode the position of an issue in the list as a page cursor.
+
+    Args:
+        rank: The index of the partition the issue belongs to
+        issue: The issue row
+
+    Returns:
+        str: The cursor, in the form "rank.YYYYmmddHHMMSS.issue_id"
+    """
+    return f"{rank}.{issue['created_at']:%Y%m%d%H%M%S}.{issue['issue_id']}"
+
+def _decode_cursor(cursor):
+    """
+    Decode a page cursor produced by `_encode_cursor()`.
+
+    Args:
+        cursor: The cursor string from the request, or None
+
+    Returns:
+        tuple: (rank, created_at, issue_id), or None if the cursor is missing
+            or invalid
+    """
+    try:
+        rank, created_at, issue_id = cursor.split('.')
+        return (int(rank), datetime.strptime(created_at, '%Y%m%d%H%M%S'),
+                int(issue_id))
+    except (AttributeError, ValueError):
+        return None
+
+def issue_page_query(where, params, limit, position=None, backwards=False):
+    """
+    Build the query that reads issues from one list partition.
+
+    Args:
+        where: The partition's WHERE clause (see `issue_partitions()`)
+        params: The partition's parameters
+        limit: The maximum number of issues to return
+        position: (created_at, issue_id) of the issue to start after, or None
+            to start at the partition's first issue
+        backwards: Whether to read towards the partition's first issue
+
+    Returns:
+        tuple: (sql, params)
+    """
+    direction = 'ASC' if backwards else 'DESC'
+    if position:
+        comparison = '>' if backwards else '<'
+        where += (f' AND (i.created_at {comparison} %s OR '
+                  f'(i.created_at = %s AND i.issue_id {comparison} %s))')
+        params += (position[0], position[0], position[1])
+
+    return ISSUE_LIST_QUERY + f'''
+        WHERE {where}
+        ORDER BY i.created_at {direction}, i.issue_id {direction}
+        LIMIT %s
+    ''', params + (limit,)
+
+def _issue_page_queries(partitions, limit, after=None, before=None):
+    """
+    Plan the queries that fetch one page of issues using keyset pagination.
+
+    Pages are positioned on (status rank, created_at, issue_id) rather than an
+    offset, so every page costs the same however deep into the list it is.
+
+    This is a generator, so that the same paging logic can be driven by the
+    sync (`_fetch_issue_page()`) and async (`_fetch_issue_page_async()`) views:
+    it yields each query to run as a (sql, params) tuple, must be sent the rows
+    that query returned, and returns the page when it stops.
+
+    Args:
+        partitions: The list partitions returned by `issue_partitions()`
+        limit: The maximum number of issues on the page
+        after: Decoded cursor of the last issue on the previous page
+        before: Decoded cursor of the first issue on the next page
+
+    Returns:
+        tuple: (issues, next_cursor, prev_cursor), where each cursor is None if
+            there is no page in that direction
+    """
+    backwards = before is not None
+    position = before if backwards else after
+    if position and not 0 <= position[0] < len(partitions):
+        position = None
+    if backwards and position:
+        ranks = range(position[0], -1, -1)
+    else:
+        ranks = range(position[0] if position else 0, len(partitions))
+
+    rows = []
+    for rank in ranks:
+        where, params = partitions[rank]
+        start = position[1:] if position and rank == position[0] else None
+        issues = yield issue_page_query(where, params, limit + 1 - len(rows),
+                                        start, backwards)
+        rows.extend((rank, issue) for issue in issues)
+        if len(rows) > limit:
+            break
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+        has_next, has_prev = position is not None, has_more
+    else:
+        has_next, has_prev = has_more, position is not None
+
+    next_cursor = _encode_cursor(*rows[-1]) if rows and has_next else None
+    prev_cursor = _encode_cursor(*rows[0]) if rows and has_prev else None
+    return [issue for _, issue in rows], next_cursor, prev_cursor
+
+def _fetch_issue_page(cursor, partitions, limit, after=None, before=None):
+    """
+    Fetch one page of issues (see `_issue_page_queries()`).
+
+    Args:
+        cursor: The database cursor to query with
+        partitions: The list partitions returned by `issue_partitions()`
+        limit: The maximum number of issues on the page
+        after: Decoded cursor of the last issue on the previous page
+        before: Decoded cursor of the first issue on the next page
+
+    Returns:
+        tuple: (issues, next_cursor, prev_cursor)
+    """
+    queries = _issue_page_queries(partitions, limit, after, before)
+    try:
+        query = next(queries)
+        while True:
+            cursor.execute(*query)
+            query = queries.send(cursor.fetchall())
+    except StopIteration as page:
+        return page.value
+
+async def _fetch_issue_page_async(cursor, partitions, limit, after=None, before=None):
+    """
+    Fetch one page of issues with an async database cursor (see
+    `_issue_page_queries()`).
+    """
+    queries = _issue_page_queries(partitions, limit, after, before)
+    try:
+        query = next(queries)
+        while True:
+            await cursor.execute(*query)
+            query = queries.send(await cursor.fetchall())
+    except StopIteration as page:
+        return page.value
+
+def _page_etag(*versions):
+    """
+    Compute the ETag of an issue page for the current user.
+
+    Besides the issue data the page shows (identified by `versions`), the tag
+    covers the URL and everything rendered from the session, such as the
+    user's role and the name and photo in the navigation bar.
+
+    Args:
+        *versions: Values that change whenever the page's issue data changes
+
+    Returns:
+        str: The ETag value
+    """
+    key = repr((request.full_path, session.get('user_id'), session.get('role'),
+                session.get('first_name'), session.get('profile_image')) + versions)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _not_modified(etag, last_modified):
+    """
+    Build a 304 response if the client's cached copy of a page is current.
+
+    Pages with pending flash messages are always rendered in full, since the
+    messages are shown only once.
+
+    Args:
+        etag: The page's ETag
+        last_modified: When the page's issue data last changed
+
+    Returns:
+        A 304 response, or None if the page must be rendered
+    """
+    if '_flashes' in session:
+        return None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return _with_validators(make_response('', 304), etag, last_modified)
+
+def _with_validators(response, etag, last_modified):
+    """
+    Add the ETag and Last-Modified headers to a page response, and have
+    browsers revalidate the page every time it is shown.
+    """
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Latest change to any issue or user, which identifies the version of every
+# list page (rows show their reporter's name and profile image)
+LAST_MODIFIED_QUERY = '''
+    SELECT GREATEST((SELECT MAX(updated_at) FROM issues),
+                    (SELECT MAX(updated_at) FROM users)) AS updated_at
+'''
+
+def _list_page_args():
+    """
+    Read the issues list's filter and paging query parameters.
+
+    Returns:
+        tuple: (filter_type, per_page, after, before)
+    """
+    filter_type = request.args.get('filter')
+    per_page = request.args.get('per_page', ISSUES_PER_PAGE, type=int)
+    per_page = max(1, min(per_page, MAX_ISSUES_PER_PAGE))
+    after = _decode_cursor(request.args.get('after'))
+    before = _decode_cursor(request.args.get('before'))
+    return filter_type, per_page, after, before
+
 @app.route('/issues/list')
 @login_required
 def list_issues():
     """
     View issues list endpoint.
     
-    Displays a list of issues based on user role and filter parameters.
+    Displays one page of issues based on user role and filter parameters. The
+    `after` or `before` query parameter holds the cursor of the page to show,
+    and `per_page` sets the page size.
+
+    Every change to any issue or user updates the latest `updated_at` time of
+    its table, so two index lookups identify the version of every list page.
+    Clients polling with If-None-Match or If-Modified-Since get a 304
+    response, without the page being queried or rendered, until an issue or
+    user changes.
     
     Returns:
         Rendered template with filtered issues list
+        304 response if the client's copy is current
     """
-    # Get filter parameter
-    filter_type = request.args.get('filter')
+    # Get filter and paging parameters
+    filter_type, per_page, after, before = _list_page_args()
 
     with db.get_cursor() as cursor:
-        base_query = '''
-            SELECT i.*, u.username, u.first_name, u.last_name, u.profile_image,
-                   COUNT(c.comment_id) as comment_count 
-            FROM issues i 
-            JOIN users u ON i.user_id = u.user_id 
-            LEFT JOIN comments c ON i.issue_id = c.issue_id 
-        '''
-
-        if filter_type == 'my_issues':
-            # Show only user's own issues
-            cursor.execute(base_query + '''
-                WHERE i.user_id = %s
-                GROUP BY i.issue_id 
-                ORDER BY i.created_at DESC
-            ''', (session['user_id'],))
-        elif filter_type == 'my_active':
-            # Show only user's active issues
-            cursor.execute(base_query + '''
-                WHERE i.user_id = %s AND i.status != 'resolved'
-                GROUP BY i.issue_id 
-                ORDER BY i.created_at DESC
-            ''', (session['user_id'],))
-        elif filter_type == 'my_resolved':
-            # Show only user's resolved issues
-            cursor.execute(base_query + '''
-                WHERE i.user_id = %s AND i.status = 'resolved'
-                GROUP BY i.issue_id 
-                ORDER BY i.created_at DESC
-            ''', (session['user_id'],))
-        elif session['role'] in ['helper', 'admin']:
-            if filter_type == 'resolved':
-                # Show only resolved issues
-                cursor.execute(base_query + '''
-                    WHERE i.status = 'resolved'
-                    GROUP BY i.issue_id 
-                    ORDER BY i.created_at DESC
-                ''')
-            else:
-                # Show active issues
-                cursor.execute(base_query + '''
-                    WHERE i.status != 'resolved'
-                    GROUP BY i.issue_id 
-                    ORDER BY 
-                        CASE i.status
-                            WHEN 'new' THEN 1
-                            WHEN 'open' THEN 2
-                            WHEN 'stalled' THEN 3
-                        END,
-                        i.created_at DESC
-                ''')
-        else:
-            # Visitor sees only their own issues by default
-            cursor.execute(base_query + '''
-                WHERE i.user_id = %s
-                GROUP BY i.issue_id 
-                ORDER BY i.created_at DESC
-            ''', (session['user_id'],))
-
-        issues = cursor.fetchall()
-        return render_template('issues/list.html',
-                            issues=issues,
-                            filter_type=filter_type)
+        cursor.execute(LAST_MODIFIED_QUERY)
+        last_modified = cursor.fetchone()['updated_at']
+        etag = _page_etag(last_modified)
+        not_modified = _not_modified(etag, last_modified)
+        if not_modified:
+            return not_modified
+
+        partitions = issue_partitions(filter_type, session['role'], session['user_id'])
+        issues, next_cursor, prev_cursor = _fetch_issue_page(
+            cursor, partitions, per_page, after=after, before=before)
+
+    return _with_validators(make_response(render_template('issues/list.html',
+                        issues=issues,
+                        filter_type=filter_type,
+                        per_page=per_page,
+                        next_cursor=next_cursor,
+                        prev_cursor=prev_cursor)), etag, last_modified)
+
+@login_required
+async def list_issues_async():
+    """
+    Async variant of `list_issues()`, served in the async serving mode (see
+    asgi.py).
+    """
+    filter_type, per_page, after, before = _list_page_args()
+
+    async with asyncdb.get_cursor() as cursor:
+        await cursor.execute(LAST_MODIFIED_QUERY)
+        last_modified = (await cursor.fetchone())['updated_at']
+        etag = _page_etag(last_modified)
+        not_modified = _not_modified(etag, last_modified)
+        if not_modified:
+            return not_modified
+
+        partitions = issue_partitions(filter_type, session['role'], session['user_id'])
+        issues, next_cursor, prev_cursor = await _fetch_issue_page_async(
+            cursor, partitions, per_page, after=after, before=before)
+
+    return _with_validators(make_response(render_template('issues/list.html',
+                        issues=issues,
+                        filter_type=filter_type,
+                        per_page=per_page,
+                        next_cursor=next_cursor,
+                        prev_cursor=prev_cursor)), etag, last_modified)
+
+# Number of search results per page, and the deepest page that can be requested
+SEARCH_RESULTS_PER_PAGE = 20
+MAX_SEARCH_PAGES = 50
+
+def issue_search_query(search, role, user_id, limit, offset):
+    """
+    Build the query that finds one page of issues matching a search.
+
+    Args:
+        search: The search terms
+        role: The role of the user searching
+        user_id: The ID of the user searching (visitors only find their own
+            issues)
+        limit: The maximum number of issues to return
+        offset: The number of issues to skip
+
+    Returns:
+        tuple: (sql, params)
+    """
+    if role in ['helper', 'admin']:
+        issue_filter = ''
+        comment_join = ''
+        owner = ()
+    else:
+        issue_filter = 'AND user_id = %s'
+        comment_join = 'JOIN issues ci ON ci.issue_id = c.issue_id AND ci.user_id = %s'
+        owner = (user_id,)
+
+    return f'''
+        SELECT i.*, u.username, u.first_name, u.last_name, u.profile_image,
+               hits.score
+        FROM (
+            SELECT issue_id, SUM(score) AS score
+            FROM (
+                SELECT issue_id,
+                       MATCH (summary, description) AGAINST (%s) AS score
+                FROM issues
+                WHERE MATCH (summary, description) AGAINST (%s) {issue_filter}
+                UNION ALL
+                SELECT c.issue_id, MATCH (c.content) AGAINST (%s) AS score
+                FROM comments c
+                {comment_join}
+                WHERE MATCH (c.content) AGAINST (%s)
+            ) matches
+            GROUP BY issue_id
+            ORDER BY score DESC, issue_id DESC
+            LIMIT %s OFFSET %s
+        ) hits
+        JOIN issues i ON i.issue_id = hits.issue_id
+        JOIN users u ON i.user_id = u.user_id
+        ORDER BY hits.score DESC, i.issue_id DESC
+    ''', (search, search) + owner + (search,) + owner + (search, limit, offset)
+
+@app.route('/issues/search')
+@login_required
+def search_issues():
+    """
+    Search issues endpoint.
+
+    Finds issues whose summary, description or comments match the `q` query
+    parameter, using the FULLTEXT indexes on issues and comments. Results are
+    ranked by relevance, summed over the issue itself and its matching
+    comments, and shown one page (`page` query parameter) at a time. Visitors
+    only see their own issues, as in `view_issue()`.
+
+    Returns:
+        Rendered search template with the matching issues
+    """
+    search = request.args.get('q', '').strip()
+    page = max(1, min(request.args.get('page', 1, type=int), MAX_SEARCH_PAGES))
+
+    issues = []
+    has_next = False
+    if search:
+        with db.get_cursor() as cursor:
+            cursor.execute(*issue_search_query(
+                search, session['role'], session['user_id'],
+                SEARCH_RESULTS_PER_PAGE + 1, (page - 1) * SEARCH_RESULTS_PER_PAGE))
+            issues = list(cursor.fetchall())
+
+        has_next = len(issues) > SEARCH_RESULTS_PER_PAGE and page < MAX_SEARCH_PAGES
+        issues = issues[:SEARCH_RESULTS_PER_PAGE]
+
+    return render_template('issues/search.html',
+                           issues=issues,
+                           search=search,
+                           page=page,
+                           has_next=has_next)
+
+# Queries run by the issue details page
+# The issue's version and change time, and the latest change to any user,
+# since the page shows its reporter's and commenters' names and images
+ISSUE_VERSION_QUERY = '''
+    SELECT user_id, version,
+           GREATEST(updated_at, (SELECT MAX(updated_at) FROM users)) AS updated_at
+    FROM issues
+    WHERE issue_id = %s
+'''
+ISSUE_DETAIL_QUERY = ISSUE_LIST_QUERY + '''
+    WHERE i.issue_id = %s
+'''
+ISSUE_COMMENTS_QUERY = '''
+    SELECT c.*, u.username, u.first_name, u.last_name, u.profile_image, u.role
+    FROM comments c
+    JOIN users u ON c.user_id = u.user_id
+    WHERE c.issue_id = %s
+    ORDER BY c.created_at ASC
+'''
+
+def _may_view(issue):
+    """
+    Check whether the current user may see an issue: staff see every issue,
+    visitors only their own.
+
+    Args:
+        issue: A dict with at least the `user_id` of the issue's reporter
+    """
+    return session['role'] in ['helper', 'admin'] or issue['user_id'] == session['user_id']
+
+def _issue_not_modified(version):
+    """
+    Build a 304 response for the issue details page if the client's cached
+    copy is current.
+
+    Args:
+        version: The row returned by ISSUE_VERSION_QUERY, or None
+
+    Returns:
+        A 304 response, or None if the page must be rendered
+    """
+    if not version or not _may_view(version):
+        return None
+    return _not_modified(_page_etag(version['version'], version['updated_at']),
+                         version['updated_at'])
+
+def _render_issue(issue, comments, version):
+    """Render the issue details page, or the response for a missing issue or
+    one the current user may not see. `version` is the row returned by
+    ISSUE_VERSION_QUERY, which the page's validators are built from."""
+    if not issue:
+        flash('Issue not found', 'error')
+        return redirect(url_for('list_issues'))
+
+    # Check if user has permission to view this issue
+    if not _may_view(issue):
+        return render_template('access_denied.html'), 403
+
+    response = make_response(render_template('issues/detail.html', issue=issue,
+                                             comments=comments))
+    return _with_validators(response, _page_etag(version['version'], version['updated_at']),
+                            version['updated_at'])
 
 @app.route('/issues/<int:issue_id>')
 @login_required
@@ -143,44 +561,78 @@ def view_issue(issue_id):
     View issue details endpoint.
     
     Displays detailed information about a specific issue and its comments.
+
+    The issue's version is checked first, so a client polling with
+    If-None-Match or If-Modified-Since gets a 304 response, without the issue
+    and its comments being queried or rendered, until the issue or a user
+    changes.
     
     Args:
         issue_id: The ID of the issue to view
         
     Returns:
         Rendered template with issue details and comments
+        304 response if the client's copy is current
         Redirect to issues list if issue not found
         Access denied page if user lacks permission
     """
     with db.get_cursor() as cursor:
+        cursor.execute(ISSUE_VERSION_QUERY, (issue_id,))
+        version = cursor.fetchone()
+        not_modified = _issue_not_modified(version)
+        if not_modified:
+            return not_modified
+
         # Get issue details with reporter info
-        cursor.execute('''
-            SELECT i.*, u.username, u.first_name, u.last_name, u.profile_image
-            FROM issues i 
-            JOIN users u ON i.user_id = u.user_id 
-            WHERE i.issue_id = %s
-        ''', (issue_id,))
+        cursor.execute(ISSUE_DETAIL_QUERY, (issue_id,))
         issue = cursor.fetchone()
 
-        if not issue:
-            flash('Issue not found', 'error')
-            return redirect(url_for('list_issues'))
+        # Get comments with user info
+        comments = []
+        if issue and _may_view(issue):
+            cursor.execute(ISSUE_COMMENTS_QUERY, (issue_id,))
+            comments = cursor.fetchall()
 
-        # Check if user has permission to view this issue
-        if session['role'] not in ['helper', 'admin'] and issue['user_id'] != session['user_id']:
-            return render_template('access_denied.html'), 403
+    return _render_issue(issue, comments, version)
 
-        # Get comments with user info
-        cursor.execute('''
-            SELECT c.*, u.username, u.first_name, u.last_name, u.profile_image, u.role
-            FROM comments c
-            JOIN users u ON c.user_id = u.user_id
-            WHERE c.issue_id = %s
-            ORDER BY c.created_at ASC
-        ''', (issue_id,))
-        comments = cursor.fetchall()
+@login_required
+async def view_issue_async(issue_id):
+    """
+    Async variant of `view_issue()`, served in the async serving mode (see
+    asgi.py).
+    """
+    async with asyncdb.get_cursor() as cursor:
+        await cursor.execute(ISSUE_VERSION_QUERY, (issue_id,))
+        version = await cursor.fetchone()
+        not_modified = _issue_not_modified(version)
+        if not_modified:
+            return not_modified
+
+        await cursor.execute(ISSUE_DETAIL_QUERY, (issue_id,))
+        issue = await cursor.fetchone()
+
+        comments = []
+        if issue and _may_view(issue):
+            await cursor.execute(ISSUE_COMMENTS_QUERY, (issue_id,))
+            comments = await cursor.fetchall()
 
-    return render_template('issues/detail.html', issue=issue, comments=comments)
+    return _render_issue(issue, comments, version)
+
+ISSUE_QUERY = 'SELECT * FROM issues WHERE issue_id = %s'
+INSERT_COMMENT = '''
+    INSERT INTO comments (issue_id, user_id, content)
+    VALUES (%s, %s, %s)
+'''
+INCREMENT_COMMENT_COUNT = '''
+    UPDATE issues
+    SET comment_count = comment_count + 1, version = version + 1
+    WHERE issue_id = %s
+'''
+REOPEN_ISSUE = '''
+    UPDATE issues
+    SET status = 'open'
+    WHERE issue_id = %s
+'''
 
 @app.route('/issues/<int:issue_id>/comment', methods=['POST'])
 @login_required
@@ -204,7 +656,7 @@ def add_comment(issue_id):
 
     with db.get_cursor() as cursor:
         # Get issue details to check permissions
-        cursor.execute('SELECT * FROM issues WHERE issue_id = %s', (issue_id,))
+        cursor.execute(ISSUE_QUERY, (issue_id,))
         issue = cursor.fetchone()
 
         if not issue:
@@ -215,25 +667,33 @@ def add_comment(issue_id):
         if session['role'] not in ['helper', 'admin'] and issue['user_id'] != session['user_id']:
             return render_template('access_denied.html'), 403
 
-        # Add comment
-        cursor.execute('''
-            INSERT INTO comments (issue_id, user_id, content)
-            VALUES (%s, %s, %s)
-        ''', (issue_id, session['user_id'], content))
+        # Add comment and bump the issue's comment counter together
+        db.get_db().begin()
+        cursor.execute(INSERT_COMMENT, (issue_id, session['user_id'], content))
+        cursor.execute(INCREMENT_COMMENT_COUNT, (issue_id,))
 
         # Update issue status if helper/admin comments on new/stalled/resolved issue
-        if session['role'] in ['helper', 'admin'] and issue['status'] != 'open':
-            cursor.execute('''
-                UPDATE issues 
-                SET status = 'open'
-                WHERE issue_id = %s
-            ''', (issue_id,))
+        reopens_issue = session['role'] in ['helper', 'admin'] and issue['status'] != 'open'
+        if reopens_issue:
+            cursor.execute(REOPEN_ISSUE, (issue_id,))
 
         db.get_db().commit()
+        fragments.invalidate_issue(issue_id)
+        events.publish('comment_added', issue, author=session['first_name'])
+        if reopens_issue:
+            stats.invalidate_issue_stats()
+            events.publish('status_changed', issue, status='open')
         flash('Comment added successfully', 'success')
 
     return redirect(url_for('view_issue', issue_id=issue_id))
 
+UPDATE_ISSUE_STATUS = '''
+    UPDATE issues
+    SET status = %s, version = version + 1
+    WHERE issue_id = %s
+'''
+ISSUE_REPORTER_QUERY = 'SELECT issue_id, user_id FROM issues WHERE issue_id = %s'
+
 @app.route('/issues/<int:issue_id>/status', methods=['POST'])
 @login_required
 @helper_or_admin_required
@@ -255,12 +715,86 @@ def update_issue_status(issue_id):
         return redirect(url_for('list_issues'))
         
     with db.get_cursor() as cursor:
-        cursor.execute('''
-            UPDATE issues 
-            SET status = %s
-            WHERE issue_id = %s
-        ''', (new_status, issue_id))
+        cursor.execute(UPDATE_ISSUE_STATUS, (new_status, issue_id))
         db.get_db().commit()
+        fragments.invalidate_issue(issue_id)
+        stats.invalidate_issue_stats()
+
+        # Look up the reporter, so that only users who may see the issue are told
+        cursor.execute(ISSUE_REPORTER_QUERY, (issue_id,))
+        issue = cursor.fetchone()
+        if issue:
+            events.publish('status_changed', issue, status=new_status)
         
     flash('Issue status updated successfully', 'success')
-    return redirect(url_for('list_issues')) 
\ No newline at end of file
+    return redirect(url_for('list_issues'))
+
+# Locks the issues a bulk change applies to; formatted with the WHERE clause
+# from `utils.bulk_targets()`
+BULK_ISSUE_LOCK_QUERY = '''
+    SELECT issue_id, user_id, status FROM issues
+    WHERE {where}
+    LIMIT %s
+    FOR UPDATE
+'''
+
+@app.route('/issues/bulk/status', methods=['POST'])
+@login_required
+@helper_or_admin_required
+def bulk_update_issue_status():
+    """
+    Bulk update issue status endpoint.
+
+    Changes the status of many issues at once (helper/admin only). The JSON
+    body holds the new `status`, and names the issues either as an
+    `issue_ids` list or as a `filter` on status and reporter (see
+    `utils.bulk_targets()`), e.g. `{"filter": {"status": "new"}, "status":
+    "open"}`. The matching rows are locked, then changed with a single
+    multi-row UPDATE in one transaction.
+
+    Returns:
+        A JSON summary of the rows matched and updated
+        400 error with a JSON message if the request is invalid
+    """
+    data = request.get_json(silent=True) or {}
+    new_status = data.get('status')
+    if new_status not in ['new', 'open', 'stalled', 'resolved']:
+        return jsonify({'success': False, 'error': 'Invalid status'}), 400
+    try:
+        where, params, ids = utils.bulk_targets(data, 'issue_ids', ['status', 'user_id'])
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    with db.get_cursor() as cursor:
+        db.get_db().begin()
+        cursor.execute(BULK_ISSUE_LOCK_QUERY.format(where=where),
+                       params + (utils.MAX_BULK_ROWS + 1,))
+        matched = cursor.fetchall()
+        if len(matched) > utils.MAX_BULK_ROWS:
+            db.get_db().rollback()
+            return jsonify({'success': False,
+                            'error': f'More than {utils.MAX_BULK_ROWS} issues match'}), 400
+
+        targets = [issue for issue in matched if issue['status'] != new_status]
+        if targets:
+            cursor.execute(f'''
+                UPDATE issues
+                SET status = %s, version = version + 1
+                WHERE issue_id IN ({', '.join(['%s'] * len(targets))})
+            ''', (new_status,) + tuple(issue['issue_id'] for issue in targets))
+        db.get_db().commit()
+
+    for issue in targets:
+        fragments.invalidate_issue(issue['issue_id'])
+        events.publish('status_changed', issue, status=new_status)
+    if targets:
+        stats.invalidate_issue_stats()
+
+    matched_ids = {issue['issue_id'] for issue in matched}
+    return jsonify({
+        'success': True,
+        'matched': len(matched),
+        'updated': len(targets),
+        'unchanged': len(matched) - len(targets),
+        'not_found': [id for id in ids if id not in matched_ids] if ids else []
+    })
@@ -0,0 +1,281 @@
+"""
+Metrics module.
+
+This module collects operational metrics for the application (request
+latency per endpoint and role, response status codes, password hashing time,
+template render time, and connection pool and login limiter usage) and serves
+them at /metrics in the Prometheus text exposition format.
+
+Metrics are labelled by route endpoint rather than URL, so the number of
+series stays bounded however many distinct issue IDs or query strings are
+requested. Each metric also caps its number of series at MAX_SERIES, folding
+any further label values into an 'other' series.
+"""
+
+import bisect
+import hmac
+import os
+import threading
+import time
+
+from flask import Response, abort, g, request, session, template_rendered, before_render_template
+from loginapp import app, asyncdb, db, ratelimit
+
+# Maximum number of label combinations kept per metric
+MAX_SERIES = 500
+
+# Bearer token that scrapers must send to read /metrics. The endpoint is
+# disabled when it isn't set. A client's address can't stand in for it: behind
+# a reverse proxy on the same host, every request comes from 127.0.0.1
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Histogram bucket upper bounds, in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BCRYPT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TEMPLATE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+class _Metric:
+    """Base class for a metric with a bounded set of labelled series."""
+
+    kind = None
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, values):
+        # Called with the lock held
+        if values not in self._series and len(self._series) >= MAX_SERIES:
+            return ('other',) * len(self.labels)
+        return values
+
+    def _label_text(self, values, extra=''):
+        pairs = ['%s="%s"' % (label, _escape(value))
+                 for label, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{%s}' % ','.join(pairs) if pairs else ''
+
+    def expose(self):
+        """Renders the metric in the text exposition format.
+
+        Returns:
+            list: The metric's lines
+        """
+        with self._lock:
+            series = sorted((values, self._copy(state))
+                            for values, state in self._series.items())
+        lines = ['# HELP %s %s' % (self.name, self.description),
+                 '# TYPE %s %s' % (self.name, self.kind)]
+        for values, state in series:
+            lines.extend(self._sample_lines(values, state))
+        return lines
+
+class Counter(_Metric):
+    """A counter of events, per label combination."""
+
+    kind = 'counter'
+
+    def inc(self, *values, amount=1):
+        with self._lock:
+            key = self._key(values)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _copy(self, state):
+        return state
+
+    def _sample_lines(self, values, count):
+        return ['%s%s %s' % (self.name, self._label_text(values), _number(count))]
+
+class Histogram(_Metric):
+    """A histogram of observed values, per label combination.
+
+    Each series is a list holding the count of observations in each bucket
+    (plus one for values above the largest bound), followed by the sum of
+    all observations. Recording an observation takes one short lock hold.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels, buckets):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+
+    def observe(self, value, *values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(values)
+            state = self._series.get(key)
+            if state is None:
+                state = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def _copy(self, state):
+        return list(state)
+
+    def _sample_lines(self, values, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), state):
+            cumulative += count
+            le = 'le="%s"' % (bound if bound == '+Inf' else _number(bound))
+            lines.append('%s_bucket%s %d' % (self.name, self._label_text(values, le),
+                                             cumulative))
+        labels = self._label_text(values)
+        lines.append('%s_sum%s %s' % (self.name, labels, _number(state[-1])))
+        lines.append('%s_count%s %d' % (self.name, labels, cumulative))
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+request_duration = Histogram(
+    'lcc_http_request_duration_seconds', 'Time spent handling requests.',
+    ('endpoint', 'role'), REQUEST_BUCKETS)
+responses = Counter(
+    'lcc_http_responses_total', 'Responses sent, by status code.',
+    ('endpoint', 'status'))
+bcrypt_duration = Histogram(
+    'lcc_bcrypt_duration_seconds', 'Time requests spent waiting for password hashing.',
+    ('operation',), BCRYPT_BUCKETS)
+bcrypt_rejected = Counter(
+    'lcc_bcrypt_rejected_total', 'Password hashing requests rejected because the queue was full.',
+    ())
+bcrypt_rejected.inc(amount=0)
+template_duration = Histogram(
+    'lcc_template_render_duration_seconds', 'Time spent rendering templates.',
+    ('template',), TEMPLATE_BUCKETS)
+
+def start_request_timer():
+    """
+    Record the time a request started.
+
+    This is registered as a `before_request` function.
+    """
+    g.metrics_started = time.perf_counter()
+
+def record_request(response):
+    """
+    Record a request's latency and response status.
+
+    This is registered as an `after_request` function.
+    """
+    started = g.pop('metrics_started', None)
+    # Label by route rule, never by URL, to keep the series bounded
+    endpoint = request.endpoint or 'unmatched'
+    if started is not None:
+        role = session.get('role', 'anonymous') if 'loggedin' in session else 'anonymous'
+        request_duration.observe(time.perf_counter() - started, endpoint, role)
+    responses.inc(endpoint, str(response.status_code))
+    return response
+
+def record_bcrypt(operation, seconds):
+    """
+    Record the time a request spent on a password hashing operation.
+
+    Args:
+        operation: 'hash' or 'check'
+        seconds: Time from submitting the job to getting its result
+    """
+    bcrypt_duration.observe(seconds, operation)
+
+@before_render_template.connect_via(app)
+def _template_started(sender, template, context, **extra):
+    g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def _template_finished(sender, template, context, **extra):
+    timers = g.get('metrics_templates')
+    if timers:
+        template_duration.observe(time.perf_counter() - timers.pop(),
+                                  template.name or 'string')
+
+def _gauge_lines(name, description, samples, kind='gauge'):
+    lines = ['# HELP %s %s' % (name, description), '# TYPE %s %s' % (name, kind)]
+    for labels, value in samples:
+        label_text = ','.join('%s="%s"' % (key, _escape(val)) for key, val in labels)
+        lines.append('%s%s %s' % (name, '{%s}' % label_text if label_text else '',
+                                  _number(value)))
+    return lines
+
+def _pool_lines():
+    stats = db.pool_stats()
+    if not stats:
+        return []
+    lines = _gauge_lines('lcc_db_pool_connections', 'Database connections by state.',
+                         [((('state', state),), stats[state])
+                          for state in ('open', 'idle', 'checked_out')])
+    lines += _gauge_lines('lcc_db_pool_limit', 'Database connection pool limits.',
+                          [((('limit', 'pool_size'),), stats['pool_size']),
+                           ((('limit', 'max_overflow'),), stats['max_overflow'])])
+    for key, description in [('checkouts', 'Connections checked out of the pool.'),
+                             ('created', 'Database connections opened.'),
+                             ('closed', 'Database connections closed.'),
+                             ('recycled', 'Connections closed for exceeding their lifetime.'),
+                             ('failed_pings', 'Idle connections that failed a health check.'),
+                             ('timeouts', 'Checkouts that timed out waiting for a connection.')]:
+        lines += _gauge_lines('lcc_db_pool_%s_total' % key, description,
+                              [((), stats[key])], 'counter')
+    lines += _gauge_lines('lcc_db_pool_wait_seconds_total',
+                          'Time spent waiting to check out connections.',
+                          [((), stats['wait_time'])], 'counter')
+    return lines + _async_pool_lines()
+
+def _async_pool_lines():
+    stats = asyncdb.pool_stats()
+    if not stats:
+        return []
+    return _gauge_lines('lcc_async_db_pool_connections',
+                        'Async database connections by state (async serving mode).',
+                        [((('state', state),), stats[state])
+                         for state in ('open', 'idle', 'checked_out')])
+
+def _login_limiter_lines():
+    stats = ratelimit.login_limiter_stats()
+    lines = _gauge_lines('lcc_login_attempts_total', 'Login attempts, by limiter and outcome.',
+                         [((('limiter', limiter), ('outcome', outcome)), stats[limiter][outcome])
+                          for limiter in stats for outcome in ('allowed', 'rejected')],
+                         'counter')
+    lines += _gauge_lines('lcc_login_limiter_tracked_keys',
+                          'Usernames and IP addresses tracked by the login limiters.',
+                          [((('limiter', limiter),), stats[limiter]['tracked_keys'])
+                           for limiter in stats])
+    return lines
+
+@app.route('/metrics')
+def metrics():
+    """
+    Metrics endpoint.
+
+    Serves the application's metrics in the Prometheus text exposition
+    format, only when METRICS_TOKEN is set, and only to clients that send it
+    in an `Authorization: Bearer` header.
+
+    Returns:
+        The metrics as plain text
+        401 error if the token is missing or wrong
+        404 error if the endpoint is disabled
+    """
+    if not METRICS_TOKEN:
+        abort(404)
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(
+            token.strip().encode('utf-8'), METRICS_TOKEN.encode('utf-8')):
+        return Response('A valid bearer token is required\n', status=401,
+                        mimetype='text/plain', headers={'WWW-Authenticate': 'Bearer'})
+
+    lines = []
+    for metric in (request_duration, responses, bcrypt_duration, bcrypt_rejected,
+                   template_duration):
+        lines += metric.expose()
+    lines += _pool_lines()
+    lines += _login_limiter_lines()
+    return Response('\n'.join(lines) + '\n',
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
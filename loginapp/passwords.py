@@ -0,0 +1,148 @@
+"""
+Password hashing module.
+
+This module hashes and verifies user passwords with bcrypt in a dedicated pool
+of worker processes, so that the CPU-heavy bcrypt work never runs on (or
+holds the GIL of) the request-serving threads.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+from flask import Response
+from loginapp import app, metrics
+
+# Default bcrypt cost factor, used unless BCRYPT_LOG_ROUNDS is configured
+DEFAULT_BCRYPT_ROUNDS = 12
+
+# Number of worker processes used for password hashing (per application
+# process; run.py lowers this when serving from several processes)
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))
+
+# Maximum number of hashing jobs queued or running at once; requests beyond
+# this are rejected with `HashQueueFull` instead of piling up
+MAX_PENDING_HASHES = HASH_WORKERS * 4
+
+# Seconds clients are asked to wait before retrying a request rejected because
+# the hashing queue is full
+RETRY_AFTER = 5
+
+class HashQueueFull(Exception):
+    """Raised when too many password hashing jobs are already pending."""
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(MAX_PENDING_HASHES)
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'),
+                         bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _check(password_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'),
+                              password_hash.encode('utf-8'))
+    except ValueError:
+        # Malformed hash
+        return False
+
+def _get_executor():
+    """
+    Get this process's hashing pool, creating it on first use.
+
+    The pool is recreated if the current process was forked from the one that
+    created it, since worker processes cannot be shared across a fork.
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+            _executor_pid = os.getpid()
+        return _executor
+
+def _run(operation, fn, *args):
+    if not _pending.acquire(blocking=False):
+        metrics.bcrypt_rejected.inc()
+        raise HashQueueFull('Too many password hashing requests are pending')
+    started = time.perf_counter()
+    try:
+        return _get_executor().submit(fn, *args).result()
+    finally:
+        _pending.release()
+        metrics.record_bcrypt(operation, time.perf_counter() - started)
+
+def bcrypt_rounds():
+    """
+    Get the configured bcrypt cost factor.
+
+    Returns:
+        int: The BCRYPT_LOG_ROUNDS app setting, or DEFAULT_BCRYPT_ROUNDS
+    """
+    return app.config.get('BCRYPT_LOG_ROUNDS', DEFAULT_BCRYPT_ROUNDS)
+
+def hash_password(password):
+    """
+    Hash a password with the configured bcrypt cost factor.
+
+    Args:
+        password: The plain text password
+
+    Returns:
+        str: The bcrypt hash (60 characters)
+
+    Raises:
+        HashQueueFull: If the hashing queue is full
+    """
+    return _run('hash', _hash, password, bcrypt_rounds())
+
+def check_password(password_hash, password):
+    """
+    Check a password against a stored bcrypt hash.
+
+    Args:
+        password_hash: The stored hash (str or bytes)
+        password: The plain text password to check
+
+    Returns:
+        bool: True if the password matches the hash
+
+    Raises:
+        HashQueueFull: If the hashing queue is full
+    """
+    if isinstance(password_hash, bytes):
+        password_hash = password_hash.decode('utf-8')
+    return _run('check', _check, password_hash, password)
+
+def needs_rehash(password_hash):
+    """
+    Check whether a stored hash uses a different cost factor to the
+    configured one.
+
+    Args:
+        password_hash: The stored hash (str or bytes)
+
+    Returns:
+        bool: True if the password should be rehashed
+    """
+    if isinstance(password_hash, bytes):
+        password_hash = password_hash.decode('utf-8')
+    try:
+        return int(password_hash.split('$')[2]) != bcrypt_rounds()
+    except (IndexError, ValueError):
+        return True
+
+@app.errorhandler(HashQueueFull)
+def hash_queue_full(error):
+    """
+    Error handler for requests rejected because the hashing queue is full.
+
+    Returns:
+        503 error asking the client to retry after RETRY_AFTER seconds
+    """
+    return Response('The server is busy. Please try again in a moment.\n', status=503,
+                    mimetype='text/plain', headers={'Retry-After': str(RETRY_AFTER)})
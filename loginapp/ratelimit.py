@@ -0,0 +1,133 @@
+"""
+Rate limiting module.
+
+This module provides in-process sliding-window rate limiters, used to throttle
+login attempts before any database or bcrypt work is done for them.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Login attempts allowed per username, and per client IP address, in each
+# LOGIN_WINDOW seconds
+LOGIN_ATTEMPTS_PER_USERNAME = 10
+LOGIN_ATTEMPTS_PER_IP = 30
+LOGIN_WINDOW = 60
+
+# Maximum number of usernames/IP addresses each login limiter keeps counters for
+LOGIN_LIMITER_MAX_KEYS = 10000
+
+class SlidingWindowLimiter:
+    """
+    A thread-safe sliding-window rate limiter.
+
+    Each key keeps only three numbers: the start of its current fixed window,
+    the number of hits in that window, and the number in the window before
+    it. The sliding-window count is estimated by weighting the previous
+    window's hits by how much of it still overlaps the sliding window.
+
+    At most `max_keys` keys are tracked. When a new key arrives and the
+    limiter is full, the least recently seen key is evicted; evicted keys
+    simply start counting from zero again.
+    """
+
+    def __init__(self, limit, window, max_keys=10000):
+        """
+        Args:
+            limit: Maximum number of hits allowed per key within `window`
+            window: Length of the sliding window in seconds
+            max_keys: Maximum number of keys to keep counters for
+        """
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def hit(self, key):
+        """
+        Record a hit for a key, unless it is over its limit.
+
+        Args:
+            key: The key to count the hit against
+
+        Returns:
+            bool: True if the hit is allowed, False if it should be rejected
+        """
+        now = time.monotonic()
+        window_start = now - now % self.window
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = [window_start, 0, 0]
+                self._counters[key] = counter
+                if len(self._counters) > self.max_keys:
+                    self._counters.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._counters.move_to_end(key)
+                if counter[0] != window_start:
+                    # Roll over to a new window. If more than one window has
+                    # passed, the previous window had no hits.
+                    elapsed_windows = round((window_start - counter[0]) / self.window)
+                    counter[2] = counter[1] if elapsed_windows == 1 else 0
+                    counter[1] = 0
+                    counter[0] = window_start
+
+            overlap = 1 - (now - window_start) / self.window
+            if counter[1] + counter[2] * overlap >= self.limit:
+                self.rejected += 1
+                return False
+
+            counter[1] += 1
+            self.allowed += 1
+            return True
+
+    def stats(self):
+        """
+        Get the limiter's counters.
+
+        Returns:
+            dict: Hits allowed and rejected, keys evicted, and keys tracked
+        """
+        with self._lock:
+            return {
+                'allowed': self.allowed,
+                'rejected': self.rejected,
+                'evicted': self.evicted,
+                'tracked_keys': len(self._counters)
+            }
+
+username_limiter = SlidingWindowLimiter(LOGIN_ATTEMPTS_PER_USERNAME, LOGIN_WINDOW,
+                                        LOGIN_LIMITER_MAX_KEYS)
+ip_limiter = SlidingWindowLimiter(LOGIN_ATTEMPTS_PER_IP, LOGIN_WINDOW,
+                                  LOGIN_LIMITER_MAX_KEYS)
+
+def allow_login_attempt(username, ip_address):
+    """
+    Check and record a login attempt against the per-IP and per-username limits.
+
+    Args:
+        username: The username being logged in to
+        ip_address: The client IP address making the attempt
+
+    Returns:
+        bool: True if the attempt may proceed
+    """
+    return ip_limiter.hit(ip_address) and username_limiter.hit(username)
+
+def login_limiter_stats():
+    """
+    Get the counters of the login limiters.
+
+    Returns:
+        dict: Limiter stats keyed by 'username' and 'ip'
+    """
+    return {
+        'username': username_limiter.stats(),
+        'ip': ip_limiter.stats()
+    }
@@ -0,0 +1,121 @@
+"""
+Dashboard statistics module.
+
+This module provides the issue and user counts shown on the admin and helper
+dashboards. Counts are cached for a short time so that dashboard page loads
+don't aggregate the whole issues and users tables, and routes that change the
+counts invalidate the cache.
+"""
+
+from loginapp import asyncdb
+from loginapp import db
+from loginapp.cache import TTLCache
+
+# Seconds dashboard statistics are cached for
+STATS_CACHE_TTL = 30
+
+_stats_cache = TTLCache(maxsize=2, ttl=STATS_CACHE_TTL)
+
+# Queries counting issues by status and active users by role
+ISSUE_STATS_QUERY = '''
+    SELECT status, COUNT(*) as count
+    FROM issues
+    GROUP BY status
+'''
+USER_STATS_QUERY = '''
+    SELECT role, COUNT(*) as count
+    FROM users
+    WHERE status = 'active'
+    GROUP BY role
+'''
+
+# Issue statuses and user roles counted, so that each always has a count
+ISSUE_STATUSES = ['new', 'open', 'stalled', 'resolved']
+USER_ROLES = ['visitor', 'helper', 'admin']
+
+def _count_by(rows, column, keys):
+    """
+    Collect the rows of a COUNT(*) ... GROUP BY query into a dict.
+
+    Args:
+        rows: The query's rows
+        column: The column the query grouped by
+        keys: Every expected value of that column
+
+    Returns:
+        dict: The count for each value, 0 for values with no rows
+    """
+    counts = dict.fromkeys(keys, 0)
+    for row in rows:
+        counts[row[column]] = row['count']
+    return counts
+
+def get_issue_stats():
+    """
+    Get the number of issues in each status.
+
+    Returns:
+        dict: Issue counts keyed by status
+    """
+    issue_stats = _stats_cache.get('issues')
+    if issue_stats is None:
+        with db.get_cursor() as cursor:
+            cursor.execute(ISSUE_STATS_QUERY)
+            issue_stats = _count_by(cursor.fetchall(), 'status', ISSUE_STATUSES)
+        _stats_cache.set('issues', issue_stats)
+    return dict(issue_stats)
+
+def get_user_stats():
+    """
+    Get the number of active users in each role.
+
+    Returns:
+        dict: Active user counts keyed by role
+    """
+    user_stats = _stats_cache.get('users')
+    if user_stats is None:
+        with db.get_cursor() as cursor:
+            cursor.execute(USER_STATS_QUERY)
+            user_stats = _count_by(cursor.fetchall(), 'role', USER_ROLES)
+        _stats_cache.set('users', user_stats)
+    return dict(user_stats)
+
+async def get_issue_stats_async():
+    """
+    Async variant of `get_issue_stats()`, for the async serving mode. It
+    shares the same cache.
+
+    Returns:
+        dict: Issue counts keyed by status
+    """
+    issue_stats = _stats_cache.get('issues')
+    if issue_stats is None:
+        async with asyncdb.get_cursor() as cursor:
+            await cursor.execute(ISSUE_STATS_QUERY)
+            issue_stats = _count_by(await cursor.fetchall(), 'status', ISSUE_STATUSES)
+        _stats_cache.set('issues', issue_stats)
+    return dict(issue_stats)
+
+async def get_user_stats_async():
+    """
+    Async variant of `get_user_stats()`, for the async serving mode. It
+    shares the same cache.
+
+    Returns:
+        dict: Active user counts keyed by role
+    """
+    user_stats = _stats_cache.get('users')
+    if user_stats is None:
+        async with asyncdb.get_cursor() as cursor:
+            await cursor.execute(USER_STATS_QUERY)
+            user_stats = _count_by(await cursor.fetchall(), 'role', USER_ROLES)
+        _stats_cache.set('users', user_stats)
+    return dict(user_stats)
+
+def invalidate_issue_stats():
+    """Discard the cached issue counts after issues are added or change status."""
+    _stats_cache.pop('issues')
+
+def invalidate_user_stats():
+    """Discard the cached user counts after users are added or change role or status."""
+    _stats_cache.pop('users')
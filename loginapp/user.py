@@ -4,18 +4,14 @@ User module.
 This module handles user authentication, registration, and profile management.
 """
 
-from loginapp import app, db, utils
+from loginapp import app, db, passwords, ratelimit, stats, utils
 from flask import redirect, render_template, request, session, url_for, flash, jsonify
-from flask_bcrypt import Bcrypt
 import re
 import os
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 from loginapp.decorators import login_required
 
-# Create an instance of the Bcrypt class, which we'll be using to hash user
-# passwords during login and registration.
-flask_bcrypt = Bcrypt(app)
-
 # Default role for new users
 DEFAULT_USER_ROLE = 'visitor'
 
@@ -23,6 +19,9 @@ DEFAULT_USER_ROLE = 'visitor'
 # At least 8 characters, must include uppercase, lowercase, and numbers
 PASSWORD_PATTERN = r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d).{8,}$'
 
+# Bytes allowed in a profile form submission on top of the profile image
+PROFILE_FORM_OVERHEAD_BYTES = 64 * 1024
+
 
 @app.route('/')
 def root():
@@ -54,15 +53,28 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
+
+        # Shed brute-force bursts before doing any database or bcrypt work
+        if not ratelimit.allow_login_attempt(username, request.remote_addr):
+            flash('Too many login attempts. Please wait a minute and try again.', 'danger')
+            return render_template('login.html', username=username, error=True), 429
         
         with db.get_cursor() as cursor:
             cursor.execute('SELECT * FROM users WHERE username = %s', (username,))
             user = cursor.fetchone()
 
-        if user and flask_bcrypt.check_password_hash(user['password_hash'], password):
+        if user and passwords.check_password(user['password_hash'], password):
             if user['status'] != 'active':
                 flash('Your account is inactive. Please contact an administrator for assistance.', 'danger')
                 return render_template('login.html', username=username, error=True)
+
+            # Upgrade the stored hash if the configured cost factor has changed
+            if passwords.needs_rehash(user['password_hash']):
+                with db.get_cursor() as cursor:
+                    cursor.execute('UPDATE users SET password_hash = %s WHERE user_id = %s',
+                                   (passwords.hash_password(password), user['user_id']))
+                    db.get_db().commit()
+                utils.invalidate_user(user['user_id'])
                 
             session['loggedin'] = True
             session['user_id'] = user['user_id']
@@ -140,7 +152,7 @@ def signup():
                         return render_template('signup.html', errors=errors, **form_data)
 
                     # Hash password
-                    hashed_password = flask_bcrypt.generate_password_hash(form_data['password'])
+                    hashed_password = passwords.hash_password(form_data['password'])
                     
                     # Create new user
                     cursor.execute('''
@@ -151,6 +163,7 @@ def signup():
                           form_data['first_name'], form_data['last_name'], 
                           form_data['location'], 'visitor', 'active'))
                     db.get_db().commit()
+                    stats.invalidate_user_stats()
                     
                     # Store registration data in session for auto-fill login
                     session['registration_data'] = {
@@ -161,6 +174,8 @@ def signup():
                     
                     flash('Account created successfully! Please log in with your credentials.', 'success')
                     return redirect(url_for('login'))
+            except passwords.HashQueueFull:
+                raise
             except Exception as e:
                 flash('Failed to create account', 'danger')
                 return render_template('signup.html', errors=errors, **form_data)
@@ -184,12 +199,20 @@ def profile():
         On POST error: Rendered profile template with validation errors
     """
     # Get current user data
-    with db.get_cursor() as cursor:
-        cursor.execute('SELECT * FROM users WHERE user_id = %s', (session['user_id'],))
-        user = cursor.fetchone()
+    user = utils.get_current_user()
     
     # Handle form submission
     if request.method == 'POST':
+        # Stop reading the request as soon as it is larger than any valid
+        # profile form, before the upload is buffered
+        request.max_content_length = utils.MAX_PROFILE_IMAGE_BYTES + PROFILE_FORM_OVERHEAD_BYTES
+        try:
+            request.files
+        except RequestEntityTooLarge:
+            errors = {'profile_image': 'Profile image must be at most %d MB'
+                                       % (utils.MAX_PROFILE_IMAGE_BYTES // (1024 * 1024))}
+            return render_template('profile.html', user=user, errors=errors, form_data={}), 413
+
         # Get form data
         form_data = {
             'first_name': request.form.get('first_name', '').strip(),
@@ -223,8 +246,11 @@ def profile():
         if form_data['new_password']:
             if not form_data['current_password']:
                 errors['current_password'] = 'Current password is required to set a new password'
-            elif not flask_bcrypt.check_password_hash(user['password'], form_data['current_password']):
-                errors['current_password'] = 'Current password is incorrect'
+            else:
+                password_hash = utils.get_password_hash(session['user_id'])
+                if not password_hash or not passwords.check_password(
+                        password_hash, form_data['current_password']):
+                    errors['current_password'] = 'Current password is incorrect'
             
             if len(form_data['new_password']) < 8:
                 errors['new_password'] = 'Password must be at least 8 characters long'
@@ -238,7 +264,23 @@ def profile():
             if form_data['new_password'] != form_data['confirm_password']:
                 errors['confirm_password'] = 'Passwords do not match'
         
+        # Save any new profile image before changing the database, so that a
+        # rejected upload leaves the profile untouched
+        new_image = None
+        if not errors and 'profile_image' in request.files and request.files['profile_image'].filename:
+            file = request.files['profile_image']
+            if utils.allowed_file(file.filename):
+                try:
+                    new_image = utils.save_profile_image(file)
+                except utils.InvalidProfileImage as e:
+                    errors['profile_image'] = str(e)
+            else:
+                errors['profile_image'] = 'Invalid file format'
+
         if not errors:
+            # Image no longer used by this user, deleted once the change is
+            # committed if no other user shares it
+            old_image = None
             with db.get_cursor() as cursor:
                 # Update basic info
                 cursor.execute('''
@@ -250,40 +292,31 @@ def profile():
                 
                 # Update password if provided
                 if form_data['new_password']:
-                    hashed_password = flask_bcrypt.generate_password_hash(form_data['new_password']).decode('utf-8')
+                    hashed_password = passwords.hash_password(form_data['new_password'])
                     cursor.execute('''
                         UPDATE users 
-                        SET password = %s 
+                        SET password_hash = %s 
                         WHERE user_id = %s
                     ''', (hashed_password, session['user_id']))
                 
                 # Handle profile image upload
-                if 'profile_image' in request.files and request.files['profile_image'].filename:
-                    file = request.files['profile_image']
-                    if file and utils.allowed_file(file.filename):
-                        # Delete old profile image if exists
-                        if user['profile_image']:
-                            utils.delete_profile_image(user['profile_image'])
-                        
-                        # Save new profile image
-                        filename = utils.save_profile_image(file, session['username'])
-                        
-                        # Update database
-                        cursor.execute('''
-                            UPDATE users 
-                            SET profile_image = %s 
-                            WHERE user_id = %s
-                        ''', (filename, session['user_id']))
-                        
-                        # Update session
-                        session['profile_image'] = filename
-                    else:
-                        errors['profile_image'] = 'Invalid file format'
+                if new_image:
+                    if user['profile_image'] != new_image:
+                        old_image = user['profile_image']
+                    
+                    # Update database
+                    cursor.execute('''
+                        UPDATE users 
+                        SET profile_image = %s 
+                        WHERE user_id = %s
+                    ''', (new_image, session['user_id']))
+                    
+                    # Update session
+                    session['profile_image'] = new_image
                 
                 # Handle profile image removal
-                if request.form.get('remove_profile_image') == 'true' and user['profile_image']:
-                    # Delete file
-                    utils.delete_profile_image(user['profile_image'])
+                elif request.form.get('remove_profile_image') == 'true' and user['profile_image']:
+                    old_image = user['profile_image']
                     
                     # Update database
                     cursor.execute('''
@@ -296,6 +329,10 @@ def profile():
                     session['profile_image'] = None
                 
                 db.get_db().commit()
+                utils.invalidate_user(session['user_id'])
+                if new_image:
+                    utils.keep_profile_image(new_image)
+                utils.delete_profile_image(old_image)
                 
                 # Update session data
                 session['first_name'] = form_data['first_name']
@@ -343,21 +380,27 @@ def change_password():
     current_password = data.get('current_password')
     new_password = data.get('new_password')
 
-    # Get user data
-    with db.get_cursor() as cursor:
-        cursor.execute('SELECT password_hash FROM users WHERE user_id = %s', 
-                      (session['user_id'],))
-        user = cursor.fetchone()
+    # Check if current password is correct, against the stored hash (never a
+    # cached copy)
+    password_hash = utils.get_password_hash(session['user_id'])
+    try:
+        current_password_matches = bool(password_hash) and passwords.check_password(
+            password_hash, current_password)
+    except passwords.HashQueueFull:
+        return jsonify({
+            'success': False,
+            'error': 'The server is busy. Please try again in a moment.'
+        }), 503, {'Retry-After': str(passwords.RETRY_AFTER)}
 
-    # Check if current password is correct
-    if not flask_bcrypt.check_password_hash(user['password_hash'], current_password):
+    if not current_password_matches:
         return jsonify({
             'success': False,
             'error': 'Current password is incorrect'
         })
 
-    # Check if new password is same as current password
-    if flask_bcrypt.check_password_hash(user['password_hash'], new_password):
+    # Check if new password is same as current password (the current password
+    # has just been verified, so no second hash check is needed)
+    if new_password == current_password:
         return jsonify({
             'success': False,
             'error': 'New password cannot be the same as current password'
@@ -371,11 +414,18 @@ def change_password():
         })
 
     # Update password
-    hashed_password = flask_bcrypt.generate_password_hash(new_password)
+    try:
+        hashed_password = passwords.hash_password(new_password)
+    except passwords.HashQueueFull:
+        return jsonify({
+            'success': False,
+            'error': 'The server is busy. Please try again in a moment.'
+        }), 503, {'Retry-After': str(passwords.RETRY_AFTER)}
     with db.get_cursor() as cursor:
         cursor.execute('UPDATE users SET password_hash = %s WHERE user_id = %s',
                       (hashed_password, session['user_id']))
         db.get_db().commit()
+        utils.invalidate_user(session['user_id'])
         flash('Password updated successfully', 'success')
 
     return jsonify({
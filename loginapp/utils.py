@@ -4,10 +4,32 @@ Utility functions module.
 This module provides utility functions used throughout the application.
 """
 
+import contextlib
+import hashlib
 import os
-from werkzeug.utils import secure_filename
+import tempfile
 from loginapp import app
-from flask import session, url_for
+from loginapp import asyncdb
+from loginapp import avatars
+from loginapp import db
+from loginapp.cache import TTLCache
+from flask import g, session, url_for
+
+# Number of user rows kept in the current-user cache, and for how many seconds
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 60
+
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Largest profile image that can be uploaded, in bytes
+MAX_PROFILE_IMAGE_BYTES = 5 * 1024 * 1024
+
+# Bytes of an upload copied at a time
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Seconds to wait for another request's lock on a profile image (see
+# `_profile_image_lock()`)
+PROFILE_IMAGE_LOCK_TIMEOUT = 10
 
 @app.template_global()
 def user_home_url():
@@ -32,36 +54,240 @@ def user_home_url():
     
     return url_for(home_endpoint)
 
-def save_profile_image(file, username):
+# Query loading the currently logged-in user's row. The password hash is left
+# out, so that the user cache never holds credentials (see
+# `get_password_hash()`).
+CURRENT_USER_QUERY = '''
+    SELECT user_id, username, email, first_name, last_name, location,
+           profile_image, role, status
+    FROM users
+    WHERE user_id = %s
+'''
+
+# Query loading a user's password hash
+PASSWORD_HASH_QUERY = 'SELECT password_hash FROM users WHERE user_id = %s'
+
+def get_current_user():
+    """
+    Get the database row of the currently logged-in user.
+
+    The row is loaded at most once per request, and is also kept in a small
+    process-wide cache so that most requests don't query it at all. Any code
+    that changes a user's row must call `invalidate_user()` afterwards.
+
+    The row holds no `password_hash`; use `get_password_hash()` to verify a
+    password.
+
+    Returns:
+        dict: The user's row from the users table, or None if not found
+    """
+    if 'current_user' not in g:
+        user = _user_cache.get(session['user_id'])
+        if user is None:
+            with db.get_cursor() as cursor:
+                cursor.execute(CURRENT_USER_QUERY, (session['user_id'],))
+                user = cursor.fetchone()
+            if user is not None:
+                _user_cache.set(session['user_id'], user)
+        g.current_user = user
+    return g.current_user
+
+async def get_current_user_async():
+    """
+    Async variant of `get_current_user()`, for the async serving mode. It
+    shares the same caches.
+
+    Returns:
+        dict: The user's row from the users table, or None if not found
+    """
+    if 'current_user' not in g:
+        user = _user_cache.get(session['user_id'])
+        if user is None:
+            async with asyncdb.get_cursor() as cursor:
+                await cursor.execute(CURRENT_USER_QUERY, (session['user_id'],))
+                user = await cursor.fetchone()
+            if user is not None:
+                _user_cache.set(session['user_id'], user)
+        g.current_user = user
+    return g.current_user
+
+def get_password_hash(user_id):
     """
-    Save a profile image to the uploads directory.
+    Get a user's password hash, straight from the database.
+
+    The hash is never cached: the user cache is per process, so a cached hash
+    could keep accepting an old password in other workers after it changed.
+
+    Args:
+        user_id: The ID of the user
+
+    Returns:
+        str: The password hash, or None if the user doesn't exist
+    """
+    with db.get_cursor() as cursor:
+        cursor.execute(PASSWORD_HASH_QUERY, (user_id,))
+        row = cursor.fetchone()
+    return row['password_hash'] if row else None
+
+def invalidate_user(user_id):
+    """
+    Discard any cached copy of a user's row after it has been changed.
+
+    Args:
+        user_id: The ID of the user whose row changed
+    """
+    _user_cache.pop(user_id)
+    current_user = g.get('current_user')
+    if current_user is not None and current_user['user_id'] == user_id:
+        g.pop('current_user')
+
+class InvalidProfileImage(Exception):
+    """Raised when an uploaded profile image is too large or isn't an image."""
+
+def save_profile_image(file):
+    """
+    Save a profile image to the uploads directory, and queue its thumbnails.
+
+    The image is stored under the SHA-256 hash of its content, so identical
+    images uploaded by different users (or again by the same user) share one
+    file, and an image's filename changes whenever its content does.
+
+    The upload is copied in chunks, so it is never held in memory whole, and
+    abandoned as soon as it exceeds MAX_PROFILE_IMAGE_BYTES. It is written
+    under a temporary name, and only moved into place once it has been
+    checked.
+
+    Another request may delete an existing file with the same content before
+    this request's reference to it is committed, so a copy of the upload is
+    kept until then: call `keep_profile_image()` once the reference has been
+    committed. Copies that are never kept are removed at the end of the
+    request.
     
     Args:
         file: The uploaded file object
-        username: The username to use in the filename
+
+    Raises:
+        InvalidProfileImage: If the file is too large or isn't an image
         
     Returns:
         str: The filename of the saved image
     """
     # Define upload folder for profile images
-    UPLOAD_FOLDER = os.path.join(app.static_folder, 'uploads/profiles')
-    
-    # Create filename
-    filename = f"{username}_image{os.path.splitext(file.filename)[1]}"
-    filename = secure_filename(filename)
+    UPLOAD_FOLDER = avatars.profile_image_folder()
     
     # Ensure upload directory exists
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     
     # Save file
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(file_path)
+    descriptor, partial_path = tempfile.mkstemp(suffix='.part', dir=UPLOAD_FOLDER)
+    try:
+        size = 0
+        digest = hashlib.sha256()
+        with os.fdopen(descriptor, 'wb') as output:
+            while True:
+                chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_PROFILE_IMAGE_BYTES:
+                    raise InvalidProfileImage('Profile image must be at most %d MB'
+                                              % (MAX_PROFILE_IMAGE_BYTES // (1024 * 1024)))
+                digest.update(chunk)
+                output.write(chunk)
+        extension = avatars.image_extension(partial_path)
+        if extension is None:
+            raise InvalidProfileImage('Invalid file format')
+
+        filename = digest.hexdigest() + extension
+        file_path = os.path.join(UPLOAD_FOLDER, filename)
+        os.chmod(partial_path, 0o644)
+        try:
+            os.link(partial_path, file_path)
+        except FileExistsError:
+            # Stored already (perhaps by a concurrent upload of the same
+            # image), and identical, since the name is the content's hash
+            pass
+    except BaseException:
+        os.remove(partial_path)
+        raise
+
+    g.setdefault('unkept_profile_images', {})[filename] = partial_path
+    avatars.queue_thumbnails(filename)
     
     return filename
 
+@contextlib.contextmanager
+def _profile_image_lock(filename):
+    """
+    Hold a MySQL named lock on a profile image, as a context manager.
+
+    Deleting an image (from counting its references through removing the
+    file) and restoring it after a save (see `keep_profile_image()`) both
+    hold the lock, so a delete can't remove a file that a concurrent save
+    has just committed a reference to.
+
+    Args:
+        filename: The profile image's filename
+
+    Returns:
+        A context manager giving True if the lock was acquired, or False if
+        it timed out
+    """
+    # Lock names are limited to 64 characters
+    name = 'lcc-avatar:' + filename[-52:]
+    with db.get_cursor() as cursor:
+        cursor.execute('SELECT GET_LOCK(%s, %s) AS locked', (name, PROFILE_IMAGE_LOCK_TIMEOUT))
+        locked = bool(cursor.fetchone()['locked'])
+    try:
+        yield locked
+    finally:
+        if locked:
+            with db.get_cursor() as cursor:
+                cursor.execute('SELECT RELEASE_LOCK(%s)', (name,))
+
+def keep_profile_image(filename):
+    """
+    Make sure a profile image saved by `save_profile_image()` during this
+    request is in place, now that a reference to it has been committed.
+
+    If a concurrent request deleted the file in the meantime (having counted
+    its references before the commit), it is restored from the upload.
+
+    Args:
+        filename: The filename returned by `save_profile_image()`
+    """
+    partial_path = g.get('unkept_profile_images', {}).pop(filename, None)
+    if partial_path is None:
+        return
+    file_path = os.path.join(avatars.profile_image_folder(), filename)
+    try:
+        with _profile_image_lock(filename):
+            if not os.path.exists(file_path):
+                os.replace(partial_path, file_path)
+                avatars.queue_thumbnails(filename)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+@app.teardown_request
+def remove_unkept_profile_images(exception=None):
+    """Remove the copies of the profile images saved during the request that
+    were never referred to (e.g. because the profile update failed)."""
+    for partial_path in g.pop('unkept_profile_images', {}).values():
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+PROFILE_IMAGE_REFS_QUERY = 'SELECT COUNT(*) AS refs FROM users WHERE profile_image = %s'
+
 def delete_profile_image(filename):
     """
-    Delete a profile image from the uploads directory.
+    Delete a profile image and its thumbnails from the uploads directory, if
+    no user refers to it any more.
+
+    Since identical images share one file, the users table acts as the
+    image's reference count: call this after the reference to the image has
+    been removed (and committed). The count and the removal are made under
+    the image's lock (see `_profile_image_lock()`).
     
     Args:
         filename: The filename of the image to delete
@@ -69,17 +295,27 @@ def delete_profile_image(filename):
     Returns:
         bool: True if the file was deleted, False otherwise
     """
-    if not filename:
+    if not filename or filename == avatars.DEFAULT_AVATAR:
         return False
-    
+
     # Define upload folder for profile images
-    UPLOAD_FOLDER = os.path.join(app.static_folder, 'uploads/profiles')
-    
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    if os.path.exists(file_path):
-        os.remove(file_path)
-        return True
-    return False
+    UPLOAD_FOLDER = avatars.profile_image_folder()
+
+    with _profile_image_lock(filename) as locked:
+        if not locked:
+            # Leave the file behind rather than risk deleting one in use
+            return False
+        with db.get_cursor() as cursor:
+            cursor.execute(PROFILE_IMAGE_REFS_QUERY, (filename,))
+            if cursor.fetchone()['refs']:
+                return False
+
+        avatars.delete_thumbnails(filename)
+        file_path = os.path.join(UPLOAD_FOLDER, filename)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+            return True
+        return False
 
 def allowed_file(filename):
     """
@@ -92,4 +328,49 @@ def allowed_file(filename):
         bool: True if the file extension is allowed, False otherwise
     """
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS 
\ No newline at end of file
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+# Largest number of rows a single bulk operation may change
+MAX_BULK_ROWS = 1000
+
+def bulk_targets(data, id_key, filter_keys):
+    """
+    Read which rows a bulk operation applies to from its JSON request body.
+
+    The body names the rows either as a list of IDs under `id_key`, or as a
+    `filter` object holding column values to match, whose keys must be a
+    non-empty subset of `filter_keys` (so a missing filter can never select
+    every row).
+
+    Args:
+        data: The decoded JSON request body
+        id_key: The key of the ID list, e.g. 'user_ids'
+        filter_keys: The columns that may be filtered on
+
+    Raises:
+        ValueError: If the body names no rows, or names them invalidly
+
+    Returns:
+        tuple: (where_clause, params, ids), where `ids` is the list of
+            requested IDs, or None if a filter was given
+    """
+    ids = data.get(id_key)
+    filters = data.get('filter')
+    if ids is not None and filters is None:
+        if (not isinstance(ids, list) or not ids
+                or not all(isinstance(id, int) and not isinstance(id, bool) for id in ids)):
+            raise ValueError(f'{id_key} must be a non-empty list of IDs')
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > MAX_BULK_ROWS:
+            raise ValueError(f'At most {MAX_BULK_ROWS} IDs can be changed at once')
+        column = id_key[:-1]
+        return f'{column} IN ({", ".join(["%s"] * len(ids))})', tuple(ids), ids
+    if filters is not None and ids is None:
+        if (not isinstance(filters, dict) or not filters
+                or not set(filters) <= set(filter_keys)
+                or not all(isinstance(value, (str, int)) for value in filters.values())):
+            raise ValueError('filter must match on one or more of: ' + ', '.join(filter_keys))
+        columns = sorted(filters)
+        return (' AND '.join(f'{column} = %s' for column in columns),
+                tuple(filters[column] for column in columns), None)
+    raise ValueError(f'Give either {id_key} or filter')
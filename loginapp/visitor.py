@@ -5,7 +5,7 @@ This module handles visitor-specific functionality including the visitor dashboa
 """
 
 from loginapp import app
-from loginapp import db
+from loginapp import utils
 from flask import render_template, session, url_for
 from loginapp.decorators import login_required
 
@@ -24,9 +24,21 @@ def visitor_home():
     if session['role'] != 'visitor':
         return render_template('access_denied.html'), 403
         
-    with db.get_cursor() as cursor:
-        # Get current user data
-        cursor.execute('SELECT * FROM users WHERE user_id = %s', (session['user_id'],))
-        user = cursor.fetchone()
+    # Get current user data
+    user = utils.get_current_user()
         
-    return render_template('visitor_home.html', user=user) 
\ No newline at end of file
+    return render_template('visitor_home.html', user=user)
+
+@login_required
+async def visitor_home_async():
+    """
+    Async variant of `visitor_home()`, served in the async serving mode (see
+    asgi.py).
+    """
+    if session['role'] != 'visitor':
+        return render_template('access_denied.html'), 403
+
+    user = await utils.get_current_user_async()
+
+    return render_template('visitor_home.html', user=user)
+ 
\ No newline at end of file
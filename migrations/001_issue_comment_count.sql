@@ -0,0 +1,11 @@
+-- Add a stored comment counter to issues
+-- Run once against an existing LCC database created before `comment_count`
+-- was added to create_database.sql.
+
+ALTER TABLE `issues`
+    ADD COLUMN `comment_count` INT NOT NULL DEFAULT 0 COMMENT 'Number of comments on the issue, maintained by the app'
+    AFTER `status`;
+
+-- Backfill the counter from the existing comments
+UPDATE `issues` i
+SET `comment_count` = (SELECT COUNT(*) FROM `comments` c WHERE c.`issue_id` = i.`issue_id`);
@@ -0,0 +1,20 @@
+-- Add composite indexes for the issue, comment and user access paths
+-- Run once against an existing LCC database created before these indexes were
+-- added to create_database.sql.
+
+-- Issues lists filtered by reporter (and status), newest first
+ALTER TABLE `issues`
+    ADD KEY `idx_issues_user_status_created` (`user_id`, `status`, `created_at`),
+    ADD KEY `idx_issues_user_created` (`user_id`, `created_at`),
+    -- Active/resolved issues lists and per-status dashboard counts
+    ADD KEY `idx_issues_status_created` (`status`, `created_at`);
+
+-- Comments on an issue, oldest first
+ALTER TABLE `comments`
+    ADD KEY `idx_comments_issue_created` (`issue_id`, `created_at`);
+
+-- Active user counts per role on the admin dashboard
+ALTER TABLE `users`
+    ADD KEY `idx_users_status_role` (`status`, `role`);
+
+ANALYZE TABLE `users`, `issues`, `comments`;
@@ -0,0 +1,10 @@
+-- Add full-text indexes for issue search
+-- Run once against an existing LCC database created before these indexes were
+-- added to create_database.sql. Building them on a large comments table can
+-- take several minutes.
+
+ALTER TABLE `issues`
+    ADD FULLTEXT KEY `ft_issues_summary_description` (`summary`, `description`);
+
+ALTER TABLE `comments`
+    ADD FULLTEXT KEY `ft_comments_content` (`content`);
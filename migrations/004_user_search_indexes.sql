@@ -0,0 +1,13 @@
+-- Add indexes for the admin user search
+-- Run once against an existing LCC database created before these indexes were
+-- added to create_database.sql.
+
+-- Paging through all users, and prefix searches on each name column
+ALTER TABLE `users`
+    ADD KEY `idx_users_role_username` (`role`, `username`),
+    ADD KEY `idx_users_first_name` (`first_name`),
+    ADD KEY `idx_users_last_name` (`last_name`);
+
+-- Substring ("contains") searches on any name column
+ALTER TABLE `users`
+    ADD FULLTEXT KEY `ft_users_names` (`username`, `first_name`, `last_name`) WITH PARSER ngram;
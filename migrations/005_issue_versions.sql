@@ -0,0 +1,19 @@
+-- Add change tracking columns to issues
+-- Run once against an existing LCC database created before `version` and
+-- `updated_at` were added to create_database.sql.
+
+-- `version` is bumped by the app on every change to an issue or its comments,
+-- and `updated_at` records when the issue last changed. The index lets the
+-- latest change time across all issues be read without a table scan.
+ALTER TABLE `issues`
+    ADD COLUMN `version` INT NOT NULL DEFAULT 1 COMMENT 'Bumped by the app whenever the issue or its comments change'
+    AFTER `comment_count`,
+    ADD COLUMN `updated_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
+    AFTER `version`,
+    ADD KEY `idx_issues_updated` (`updated_at`);
+
+-- Backfill the change time from each issue's latest comment
+UPDATE `issues` i
+SET `updated_at` = GREATEST(i.`created_at`, COALESCE(
+    (SELECT MAX(c.`created_at`) FROM `comments` c WHERE c.`issue_id` = i.`issue_id`),
+    i.`created_at`));
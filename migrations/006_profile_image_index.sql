@@ -0,0 +1,9 @@
+-- Add an index on users' profile images
+-- Run once against an existing LCC database created before this index was
+-- added to create_database.sql.
+
+-- Identical profile images are stored once and shared between users, so an
+-- image's file is only deleted when no user refers to it any more; the index
+-- lets that reference count be read without a table scan
+ALTER TABLE `users`
+    ADD KEY `idx_users_profile_image` (`profile_image`);
@@ -0,0 +1,11 @@
+-- Add a change time to users
+-- Run once against an existing LCC database created before `updated_at` was
+-- added to the users table in create_database.sql.
+
+-- Issue pages show their reporters' and commenters' names and profile images,
+-- so the pages' Last-Modified time and ETag also cover the latest change to
+-- any user. The index lets that time be read without a table scan.
+ALTER TABLE `users`
+    ADD COLUMN `updated_at` DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
+    AFTER `status`,
+    ADD KEY `idx_users_updated` (`updated_at`);
@@ -1,22 +1,59 @@
 """Script to generate password hashes for one or more user accounts.
 
-This script generates bcrypt password hashes for all the initial user accounts
-required for the LCC Issue Tracker application. It creates hashes for:
+By default, this script generates bcrypt password hashes for all the initial
+user accounts required for the LCC Issue Tracker application. It creates
+hashes for:
 - 20 visitors
 - 5 helpers
 - 2 administrators
 
-The generated hashes will be used in the populate_database.sql script.
+The generated hashes are used in the populate_database.sql script.
+
+To bulk-provision other accounts, pass a CSV file (with a header row) or a
+JSON/JSON Lines file of accounts. Each account needs a username, password and
+role (visitor, helper or admin), and may also give an email, first_name,
+last_name and location. Invalid accounts are skipped, and listed with their
+line numbers at the end; the script exits with status 1 if there were any.
+
+Hashing and verification are spread over a pool of worker processes (one per
+CPU core by default), and results are streamed to the output in input order
+as SQL INSERT statements or CSV rows, so any number of accounts can be
+processed without holding them all in memory.
+
+Usage:
+    python password_hash_generator.py [accounts.csv|accounts.json|accounts.jsonl]
+        [--format sql|csv] [--output PATH] [--cost N] [--workers N]
 """
-from collections import namedtuple
-from flask import Flask
-from flask_bcrypt import Bcrypt
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
 
 # Define a UserAccount named tuple to store username, password, and role
-UserAccount = namedtuple('UserAccount', ['username', 'password', 'role'])
+# (plus optional profile details)
+UserAccount = namedtuple('UserAccount', ['username', 'password', 'role', 'email',
+                                         'first_name', 'last_name', 'location'],
+                         defaults=[None, None, None, None])
+
+# Roles an account may have
+ROLES = ['visitor', 'helper', 'admin']
+
+# Characters of a JSON file read at a time, and the longest account record
+JSON_CHUNK_SIZE = 64 * 1024
+MAX_JSON_RECORD_SIZE = 1024 * 1024
 
-app = Flask(__name__)
-flask_bcrypt = Bcrypt(app)
+# Locations assigned, in turn, to accounts that don't specify one
+LOCATIONS = ['Lincoln', 'Christchurch', 'Canterbury']
+
+# Columns written for each account
+OUTPUT_COLUMNS = ['username', 'password_hash', 'email', 'first_name',
+                  'last_name', 'location', 'role', 'status']
 
 # List of users for the LCC Issue Tracker
 # Format: UserAccount(username, password, role)
@@ -55,50 +92,318 @@ users = [
     UserAccount('admin2', 'Admin2Pass', 'admin')
 ]
 
-print('Username | Password | Role | Hash | Password Matches Hash')
-print('-' * 100)
+class InvalidAccount(Exception):
+    """Raised when an account record can't be used."""
 
-# Generate SQL INSERT statements for the populate_database.sql file
-print('\nSQL INSERT statements for populate_database.sql:')
-print('\n-- Users table data')
-print('INSERT INTO `users` (`username`, `password_hash`, `email`, `first_name`, `last_name`, `location`, `role`, `status`) VALUES')
+def parse_account(record):
+    """Validates an account record.
 
-sql_values = []
+    Args:
+        record: The parsed record. Fields other than those of `UserAccount`
+            are ignored.
 
-for i, user in enumerate(users):
-    # Generate a bcrypt hash
-    password_hash = flask_bcrypt.generate_password_hash(user.password)
-    
-    # Check if the hash matches the original password
-    password_matches_hash = flask_bcrypt.check_password_hash(password_hash, user.password)
+    Raises:
+        InvalidAccount: If the record is not an object, lacks a username,
+            password or role, has an unknown role, or has a field that is not
+            a string.
 
-    # Output for verification
-    print(f'{user.username} | {user.password} | {user.role} | {password_hash.decode()} | {password_matches_hash}')
-    
-    # Generate SQL statement
-    if user.role == 'visitor':
-        first_name = user.username.capitalize()
-        last_name = user.role.capitalize()
-        location = "Lincoln" if i % 3 == 0 else "Christchurch" if i % 3 == 1 else "Canterbury"
-    elif user.role == 'helper':
-        first_name = user.username.capitalize()
-        last_name = user.role.capitalize()
-        location = "Lincoln" if i % 3 == 0 else "Christchurch" if i % 3 == 1 else "Canterbury"
-    elif user.role == 'admin':
-        first_name = user.username.capitalize()
-        last_name = user.role.capitalize()
-        location = "Lincoln" if i % 3 == 0 else "Christchurch" if i % 3 == 1 else "Canterbury"
-    # Format the SQL value string
-    sql_value = f"('{user.username}', '{password_hash.decode()}', '{user.username}@example.com', '{first_name}', '{last_name}', '{location}', '{user.role}', 'active')"
-    
-    # Add comma if not the last item
-    if i < len(users) - 1:
-        sql_value += ','
-    
-    sql_values.append(sql_value)
+    Returns:
+        The `UserAccount`.
+    """
+    if not isinstance(record, dict):
+        raise InvalidAccount('each account must be an object')
+    values = {}
+    for field in UserAccount._fields:
+        value = record.get(field)
+        if value is None or value == '':
+            continue
+        if not isinstance(value, str):
+            raise InvalidAccount(f'{field} must be a string')
+        values[field] = value
+    missing = [field for field in ['username', 'password', 'role'] if field not in values]
+    if missing:
+        raise InvalidAccount(', '.join(missing) + (' is' if len(missing) == 1 else ' are')
+                             + ' required')
+    if values['role'] not in ROLES:
+        raise InvalidAccount(f"role must be one of {', '.join(ROLES)}, "
+                             f"not {values['role']!r}")
+    return UserAccount(**values)
+
+def _csv_records(file):
+    """Streams the records of a CSV file with a header row.
+
+    Yields:
+        Tuples of (line_number, record), where `record` is an `InvalidAccount`
+        if the row is not valid CSV.
+    """
+    reader = csv.DictReader(file)
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield reader.line_num, InvalidAccount(f'Invalid CSV: {e}')
+            continue
+        yield reader.line_num, record
+
+def _json_lines_records(file):
+    """Streams the records of a JSON Lines file.
+
+    Yields:
+        Tuples of (line_number, record), where `record` is an `InvalidAccount`
+        if the line is not valid JSON.
+    """
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, InvalidAccount(f'Invalid JSON: {e}')
+
+def _json_array_records(file):
+    """Streams the elements of a JSON array, without reading it all at once.
+
+    Yields:
+        Tuples of (line_number, record), where `record` is an `InvalidAccount`
+        if the file is not a valid JSON array. Reading stops at the first
+        syntax error.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    offset = 0
+    line_number = 1
+    eof = False
+
+    def skip_whitespace():
+        # Returns the next significant character, reading more as needed
+        nonlocal buffer, offset, line_number, eof
+        while True:
+            while offset < len(buffer) and buffer[offset] in ' \t\r\n':
+                offset += 1
+            if offset < len(buffer) or eof:
+                break
+            line_number += buffer.count('\n')
+            buffer = file.read(JSON_CHUNK_SIZE)
+            offset = 0
+            eof = not buffer
+        return buffer[offset] if offset < len(buffer) else ''
+
+    def error(message):
+        return line_number + buffer.count('\n', 0, offset), InvalidAccount(message)
+
+    if skip_whitespace() != '[':
+        yield error('Invalid JSON: the file must hold an array of accounts')
+        return
+    offset += 1
+    expect_value = False
+    while True:
+        char = skip_whitespace()
+        if char == ']' and not expect_value:
+            offset += 1
+            if skip_whitespace():
+                yield error('Invalid JSON: extra data after the array')
+            return
+        if char == ']':
+            yield error("Invalid JSON: expected an account after ','")
+            return
+        if char == '':
+            yield error('Invalid JSON: unexpected end of file')
+            return
+
+        # Decode the next element, reading more until it is complete (a value
+        # that ends with the buffer, such as a number, may continue past it)
+        while True:
+            try:
+                record, end = decoder.raw_decode(buffer, offset)
+                if end < len(buffer) or eof:
+                    break
+            except json.JSONDecodeError as e:
+                if eof:
+                    yield error(f'Invalid JSON: {e.msg}')
+                    return
+                if len(buffer) - offset > MAX_JSON_RECORD_SIZE:
+                    yield error(f'Invalid JSON: {e.msg}, or an account longer '
+                                f'than {MAX_JSON_RECORD_SIZE} characters')
+                    return
+            line_number += buffer.count('\n', 0, offset)
+            chunk = file.read(JSON_CHUNK_SIZE)
+            buffer = buffer[offset:] + chunk
+            offset = 0
+            eof = not chunk
+        yield line_number + buffer.count('\n', 0, offset), record
+        offset = end
+
+        char = skip_whitespace()
+        if char == ',':
+            offset += 1
+            expect_value = True
+        elif char == ']':
+            expect_value = False
+        else:
+            yield error("Invalid JSON: expected ',' or ']' after an account")
+            return
+
+def read_accounts(path):
+    """Streams accounts from a CSV, JSON or JSON Lines file.
+
+    Args:
+        path: The file to read. Its extension selects the format.
+
+    Yields:
+        Tuples of (line_number, account), where `account` is a `UserAccount`,
+        or an `InvalidAccount` if the record is invalid.
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if path.endswith('.csv'):
+            records = _csv_records(file)
+        elif path.endswith('.jsonl'):
+            records = _json_lines_records(file)
+        else:
+            records = _json_array_records(file)
+        for line_number, record in records:
+            if not isinstance(record, InvalidAccount):
+                try:
+                    record = parse_account(record)
+                except InvalidAccount as e:
+                    record = e
+            yield line_number, record
+
+def hash_account(account, cost, verify):
+    """Hashes (and optionally verifies) one account's password.
+
+    This runs in a worker process.
+
+    Args:
+        account: The `UserAccount` to hash the password of.
+        cost: The bcrypt cost factor.
+        verify: Whether to check that the hash matches the password.
+
+    Returns:
+        A tuple of the password hash and whether it matches the password (or
+        `None` if it wasn't verified).
+    """
+    password = account.password.encode('utf-8')
+    password_hash = bcrypt.hashpw(password, bcrypt.gensalt(cost))
+    matches = bcrypt.checkpw(password, password_hash) if verify else None
+    return password_hash.decode('utf-8'), matches
+
+def hash_accounts(accounts, cost, workers, verify):
+    """Hashes accounts in a process pool, yielding results in input order.
+
+    At most a few jobs per worker are in flight at once, so accounts are read
+    from `accounts` only as fast as they can be hashed.
+
+    Yields:
+        Tuples of (account, password_hash, matches).
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for account in accounts:
+            pending.append((account, executor.submit(hash_account, account, cost, verify)))
+            if len(pending) >= workers * 4:
+                account, future = pending.popleft()
+                yield (account, *future.result())
+        while pending:
+            account, future = pending.popleft()
+            yield (account, *future.result())
+
+def output_row(index, account, password_hash):
+    """Builds the output columns for an account, filling in default details."""
+    return [
+        account.username,
+        password_hash,
+        account.email or f'{account.username}@example.com',
+        account.first_name or account.username.capitalize(),
+        account.last_name or account.role.capitalize(),
+        account.location or LOCATIONS[index % len(LOCATIONS)],
+        account.role,
+        'active'
+    ]
+
+def sql_string(value):
+    """Formats a string as a MySQL string literal."""
+    return "'" + value.replace('\\', '\\\\').replace("'", "''") + "'"
+
+def write_sql(out, rows, batch_size):
+    """Writes rows as INSERT statements of up to `batch_size` rows each."""
+    header = ('INSERT INTO `users` ('
+              + ', '.join(f'`{column}`' for column in OUTPUT_COLUMNS) + ') VALUES\n')
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        out.write(header)
+        out.write(',\n'.join('(' + ', '.join(map(sql_string, row)) + ')' for row in batch))
+        out.write(';\n')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('input', nargs='?',
+                        help='CSV, JSON or JSON Lines file of accounts '
+                             '(default: the initial LCC accounts)')
+    parser.add_argument('--format', choices=['sql', 'csv'], default='sql',
+                        help='output format (default: %(default)s)')
+    parser.add_argument('--output', default='-',
+                        help='file to write to (default: stdout)')
+    parser.add_argument('--cost', type=int, default=12,
+                        help='bcrypt cost factor (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='number of hashing processes (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='rows per INSERT statement (default: %(default)s)')
+    parser.add_argument('--no-verify', dest='verify', action='store_false',
+                        help='skip checking each hash against its password')
+    args = parser.parse_args()
+
+    failures = []
+    invalid = []
+    count = 0
+
+    def valid_accounts():
+        for line_number, account in read_accounts(args.input):
+            if isinstance(account, InvalidAccount):
+                invalid.append(f'{args.input}, line {line_number}: {account}')
+            else:
+                yield account
+
+    accounts = valid_accounts() if args.input else iter(users)
+
+    def rows():
+        nonlocal count
+        for index, (account, password_hash, matches) in enumerate(
+                hash_accounts(accounts, args.cost, args.workers, args.verify)):
+            if matches is False:
+                failures.append(account.username)
+            count += 1
+            yield output_row(index, account, password_hash)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='',
+                                                      encoding='utf-8')
+    try:
+        if args.format == 'sql':
+            out.write('-- Users table data\n')
+            write_sql(out, rows(), args.batch_size)
+        else:
+            writer = csv.writer(out)
+            writer.writerow(OUTPUT_COLUMNS)
+            writer.writerows(rows())
+    finally:
+        if out is not sys.stdout:
+            out.close()
 
-# Print SQL values with proper formatting
-for value in sql_values:
-    print(value)
+    print(f'Hashed {count} accounts with cost {args.cost} on {args.workers} workers',
+          file=sys.stderr)
+    for error in invalid:
+        print(error, file=sys.stderr)
+    if invalid:
+        print(f'Skipped {len(invalid)} invalid accounts', file=sys.stderr)
+    if failures:
+        print('Password does not match hash for: ' + ', '.join(failures), file=sys.stderr)
+    if invalid or failures:
+        sys.exit(1)
 
-print(';\n')
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -2,15 +2,148 @@
 Application entry point.
 
 This module serves as the entry point for the Flask application.
+
+By default it runs Flask's development server with the debugger enabled. Pass
+`--production` to serve the application with gunicorn instead, from one
+worker process per CPU core, each handling several requests at once on its
+own threads:
+
+    python run.py --production [--bind HOST:PORT] [--workers N] [--threads N]
+
+Pass `--async` instead to serve it with uvicorn from an asyncio event loop,
+where the read-heavy pages are served by async views that don't hold a thread
+while waiting on the database (see loginapp/asgi.py):
+
+    python run.py --async [--bind HOST:PORT] [--workers N] [--threads N]
 """
 
-from loginapp import app
+import argparse
+import os
+import tempfile
+
+# Threads per worker process in production mode, so that each process keeps
+# serving other requests while some wait on the database (or hold open a live
+# event stream)
+DEFAULT_THREADS = 16
+
+# Seconds workers are given to finish in-flight requests when shutting down
+GRACEFUL_TIMEOUT = 30
+
+def event_socket_dir(bind):
+    """
+    Get the directory the worker processes relay live events through (see
+    loginapp/events.py), named after the port the application listens on, so
+    that every instance of the application on a host gets its own.
+
+    Args:
+        bind: Address the application listens on, as HOST:PORT
+
+    Returns:
+        str: The directory's path
+    """
+    port = bind.rpartition(':')[2]
+    return os.path.join(tempfile.gettempdir(), f'lcc-events-{port}')
+
+def post_fork(server, worker):
+    """gunicorn hook, run in each worker process right after it is forked."""
+    from loginapp import db
+    db.reset_pool_after_fork()
+
+def worker_exit(server, worker):
+    """gunicorn hook, run in each worker process as it shuts down."""
+    from loginapp import db, events
+    db.close_pool()
+    events.close_relay()
+
+def run_production(bind, workers, threads):
+    """
+    Serve the application with gunicorn.
+
+    The application is loaded once in the master process before the workers
+    are forked (so they share its memory pages copy-on-write), and each worker
+    then opens its own database connections. On SIGTERM or SIGINT, workers
+    stop accepting connections and are given GRACEFUL_TIMEOUT seconds to
+    finish the requests they are serving.
+
+    Args:
+        bind: Address to listen on, as HOST:PORT
+        workers: Number of worker processes
+        threads: Number of request-handling threads per worker
+    """
+    from gunicorn.app.base import BaseApplication
+
+    # Share the cores between the workers' password hashing pools, rather
+    # than giving every worker a hashing process per core
+    os.environ.setdefault('HASH_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+    os.environ.setdefault('EVENT_SOCKET_DIR', event_socket_dir(bind))
+    # Each live event stream holds a thread, so leave at least half of them
+    # for ordinary requests
+    os.environ.setdefault('MAX_EVENT_STREAMS', str(max(1, threads // 2)))
+
+    class ProductionApplication(BaseApplication):
+        def load_config(self):
+            for key, value in {
+                'bind': bind,
+                'workers': workers,
+                'threads': threads,
+                'worker_class': 'gthread',
+                'preload_app': True,
+                'graceful_timeout': GRACEFUL_TIMEOUT,
+                'post_fork': post_fork,
+                'worker_exit': worker_exit,
+            }.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from loginapp import app
+            return app
+
+    ProductionApplication().run()
+
+def run_async(bind, workers, threads):
+    """
+    Serve the application with uvicorn, in the async serving mode.
+
+    Args:
+        bind: Address to listen on, as HOST:PORT
+        workers: Number of worker processes
+        threads: Number of threads per worker serving the requests that have
+            no async view
+    """
+    import uvicorn
+
+    host, _, port = bind.rpartition(':')
+    os.environ.setdefault('HASH_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+    os.environ.setdefault('SYNC_THREADS', str(threads))
+    os.environ.setdefault('EVENT_SOCKET_DIR', event_socket_dir(bind))
+    uvicorn.run('loginapp.asgi:application', host=host, port=int(port),
+                workers=workers, lifespan='on',
+                timeout_graceful_shutdown=GRACEFUL_TIMEOUT)
 
 if __name__ == '__main__':
     """
     Main entry point for the application.
 
-    This function runs the Flask application on the specified host and port.
-    The application will be accessible from any IP address on port 5001.
+    This function runs the Flask development server (or, with `--production`,
+    gunicorn, or with `--async`, uvicorn) on the specified host and port.
     """
-    app.run(debug=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Run the LCC Issue Tracker.')
+    parser.add_argument('--production', action='store_true',
+                        help='serve with gunicorn instead of the development server')
+    parser.add_argument('--async', dest='async_mode', action='store_true',
+                        help='serve with uvicorn, using the async views where available')
+    parser.add_argument('--bind', default='0.0.0.0:5000',
+                        help='address to listen on in production or async mode (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes in production or async mode (default: one per CPU core)')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help='threads per worker in production or async mode (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.production:
+        run_production(args.bind, args.workers, args.threads)
+    elif args.async_mode:
+        run_async(args.bind, args.workers, args.threads)
+    else:
+        from loginapp import app
+        app.run(debug=True)